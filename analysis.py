@@ -0,0 +1,231 @@
+# Engine searches and the analysis records that are stored in the cache.
+# An analysis record is a dict with the depth, MultiPV and engine parameters of the search
+# and the top lines it found (see uci.topLines). The records are cached in an AnalysisCache (see analysiscache.py).
+from ucidriver import UciEngine
+from board import Board
+from movegen import isCheck, legalMoves
+from uci import parseInfo, completedLines, goLimits
+from analysiscache import AnalysisCache
+
+# engine parameters that change the outcome of a search. Results found with other values can not be reused.
+ANALYSIS_PARAMS = ["Skill Level", "UCI_LimitStrength", "UCI_Elo", "Contempt", "UCI_Chess960"]
+
+def getAnalysisParams(stockfish: UciEngine) -> dict:
+    params = stockfish.get_parameters()
+    return {name: params.get(name) for name in ANALYSIS_PARAMS}
+
+# Limits of a search. The search ends when it reached the depth, or earlier when it used up the time (ms) or nodes,
+# with the best result found so far. 0 is no limit for movetime and nodes, the depth of the engine for depth.
+class Budget:
+    def __init__(self, depth: int = 0, movetime: int = 0, nodes: int = 0):
+        self.depth = depth
+        self.movetime = movetime
+        self.nodes = nodes
+
+    def limited(self) -> bool:
+        return self.movetime > 0 or self.nodes > 0
+
+    # the budget with the depth of the engine if it has none
+    def withDepth(self, depth: int) -> "Budget":
+        return self if self.depth > 0 else Budget(depth, self.movetime, self.nodes)
+
+# Runs a single search on the current position of the engine and returns the depth it completed
+# and the top lines of that depth including the WDL stats of each line.
+# The engine keeps the MultiPV of the search afterwards, the engine driver (see ucidriver.py) only sends it again when it changes.
+# With searchmoves only these moves are searched.
+def searchPosition(stockfish: UciEngine, whiteToMove: bool, multipv: int, depth: int, movetime: int = 0, nodes: int = 0, searchmoves: list[str] = None) -> tuple:
+    stockfish.setOption("MultiPV", multipv, False)
+    stockfish.send("go " + goLimits(depth, movetime, nodes, searchmoves))
+    infos = []
+    while True:
+        line = stockfish.readLine()
+        if line.startswith("info") and " pv " in line:
+            infos.append(parseInfo(line))
+        elif line.startswith("bestmove"):
+            break
+    return completedLines(infos, whiteToMove)
+
+# Searches the current position of the engine with at least the configured MultiPV
+# so that eval, WDL and best moves can all be answered from the same search.
+# With a time or node limit the record has the depth the search completed, which may be less than requested.
+# A search that ended before it completed the first depth has no lines and depth 0,
+# so it is not taken for the analysis of a position without moves.
+def runAnalysis(stockfish: UciEngine, board: Board, multipv: int, depth: int, movetime: int = 0, nodes: int = 0) -> dict:
+    multipv = max(multipv, stockfish.get_parameters()["MultiPV"])
+    reached, lines = searchPosition(stockfish, board.whiteToMove, multipv, depth, movetime, nodes)
+    if len(lines) == 0:
+        # without moves there is nothing to search deeper
+        if len(legalMoves(board)) == 0:
+            reached = depth
+    elif movetime <= 0 and nodes <= 0:
+        # without a limit the search always completes the depth
+        reached = depth
+    return {
+        "depth": reached,
+        "multipv": multipv,
+        "params": getAnalysisParams(stockfish),
+        "lines": lines
+    }
+
+# Analysis of the position within the budget, for the current position of the engine.
+# A cached analysis that covers the budget's depth is returned as is. Otherwise the engine searches until the depth
+# or the end of the budget. The engine keeps its hash table between searches of a position, so searching
+# a position again continues from where the previous search stopped instead of starting over.
+# The result replaces the cached analysis only if it got deeper, a search that ran out of budget early keeps the earlier result.
+# A search that didn't complete a single depth is returned but not cached.
+def deepenAnalysis(stockfish: UciEngine, board: Board, cache: AnalysisCache, multipv: int, budget: Budget) -> dict:
+    params = getAnalysisParams(stockfish)
+    old = cache.get(board)
+    if analysisCovers(old, multipv, budget.depth, params):
+        return old
+    analysis = runAnalysis(stockfish, board, multipv, budget.depth, budget.movetime, budget.nodes)
+    if old != None and old["params"] == params and old["multipv"] >= analysis["multipv"] and old["depth"] >= analysis["depth"]:
+        return old
+    if analysis["depth"] > 0:
+        cache.put(board, analysis)
+    return analysis
+
+# whether a cached analysis was at least as deep and as wide as requested, with the same engine parameters
+def analysisCovers(analysis: dict, multipv: int, depth: int, params: dict) -> bool:
+    return analysis != None and analysis["depth"] >= depth and analysis["multipv"] >= multipv and analysis["params"] == params
+
+# evaluation in the format of Stockfish.get_evaluation, positive is advantage for white
+def analysisEval(analysis: dict, board: Board) -> dict:
+    lines = analysis["lines"]
+    if len(lines) == 0:
+        # no legal moves, either mate or stalemate
+        return {"type": "mate", "value": 0} if isCheck(board) else {"type": "cp", "value": 0}
+    return lineEval(lines[0])
+
+# evaluation of the position if the line's move is played, in the format of analysisEval
+def lineEval(line: dict) -> dict:
+    if line["Mate"] != None:
+        return {"type": "mate", "value": line["Mate"]}
+    return {"type": "cp", "value": line["Centipawn"]}
+
+# win/draw/loss stats for the side to move. None if the game is over.
+def analysisWDL(analysis: dict) -> list:
+    lines = analysis["lines"]
+    if len(lines) == 0:
+        return None
+    wdl = lines[0]["WDL"]
+    return wdl if wdl != None else [0,0,0]
+
+def analysisBestMoves(analysis: dict, moves: int) -> list[dict]:
+    return analysis["lines"][0:moves]
+
+# Analyzes many positions at once with the engine pool and puts the results into the cache,
+# so that following getEval/getBestMoves/getWDL calls for these positions are answered from the cache.
+# Positions that already have a good enough analysis are not searched again.
+# progress is called with (positions done, positions to search) after every search.
+# Returns Zobrist key -> analysis record of every position. The cache may have dropped some of them again
+# by the time the last position is done, if they don't all fit into its memory budget.
+def analyzePositions(stockfish: UciEngine, pool, fens: list[str], cache: AnalysisCache, multipv: int = 1, depth: int = 0, progress = None) -> dict:
+    if depth <= 0:
+        depth = int(stockfish.depth)
+    params = getAnalysisParams(stockfish)
+    boards = {}
+    for fen in fens:
+        board = Board(fen)
+        boards.setdefault(board.key, board)
+    analyses = {}
+    missing = []
+    for board in boards.values():
+        cached = cache.get(board)
+        if analysisCovers(cached, multipv, depth, params):
+            analyses[board.key] = cached
+        else:
+            missing.append(board)
+    if progress != None:
+        progress(0, len(missing))
+    for done, (board, analysis) in enumerate(zip(missing, pool.imap([board.fen for board in missing], multipv, depth)), 1):
+        analyses[board.key] = analysis
+        if analysis["depth"] > 0:
+            cache.put(board, analysis)
+        if progress != None:
+            progress(done, len(missing))
+    return analyses
+
+# mates count as this many centipawns, less the number of moves to the mate
+MATE_SCORE = 10000
+
+# Centipawns of an evaluation (see analysisEval) from White's point of view. Mates are turned into large values.
+def evalCentipawns(evaluation: dict, whiteToMove: bool) -> int:
+    if evaluation["type"] == "cp":
+        return evaluation["value"]
+    mate = evaluation["value"]
+    if mate == 0:
+        # the side to move is mated
+        return -MATE_SCORE if whiteToMove else MATE_SCORE
+    return MATE_SCORE - abs(mate) if mate > 0 else -MATE_SCORE + abs(mate)
+
+# Rating of a move for the player who made it: the difference between the evaluations after and before the move.
+# Negative values are what the move lost compared to the evaluation of the position before it.
+def moveRating(evalBefore: dict, evalAfter: dict, whiteMoved: bool) -> int:
+    rating = evalCentipawns(evalAfter, not whiteMoved) - evalCentipawns(evalBefore, whiteMoved)
+    return rating if whiteMoved else -rating
+
+# centipawns a move has to lose to be classified as such, the worst first
+MOVE_CLASSES = [(300, "blunder"), (100, "mistake"), (50, "inaccuracy")]
+
+# classification of a move by its rating (see moveRating), None for a good move
+def classifyMove(rating: int) -> str:
+    for loss, name in MOVE_CLASSES:
+        if -rating >= loss:
+            return name
+    return None
+
+# Rating of a move against the best move of the position (see moveRating) and its class: "best" if it is the best move,
+# otherwise the class of classifyMove or None. No move is better than the best one, a positive rating only comes from
+# evaluations of different searches, like the best move's evaluation in the position after it, so it is capped at 0.
+def rateMove(move: str, best: str, before: dict, after: dict, whiteMoved: bool) -> tuple[int, str]:
+    rating = min(moveRating(before, after, whiteMoved), 0)
+    return rating, "best" if move == best else classifyMove(rating)
+
+# Rates moves of the position against the best move, for the current position of the engine.
+# The lines of the cached analysis of the position (see deepenAnalysis) rate the moves that are among them without a search.
+# The other moves are searched together with the best move in a single search restricted to them with searchmoves,
+# one line per move, so each of them is compared with the best move of the same search. The lines of that search are
+# kept in the cached analysis as its moveLines, [line of the move, best line of the search] pairs, so rating the moves again
+# doesn't search. Returns move -> {"Move", "Best", "Before", "After", "Rating", "Class"}. Before is the evaluation with
+# the best move, After the one with the move (see lineEval), Rating and Class are from rateMove. Illegal moves are left out.
+def rateMoves(stockfish: UciEngine, board: Board, cache: AnalysisCache, moves: list[str], budget: Budget) -> dict:
+    analysis = deepenAnalysis(stockfish, board, cache, stockfish.get_parameters()["MultiPV"], budget)
+    if len(analysis["lines"]) == 0:
+        return {}
+    best = analysis["lines"][0]
+    lines = {line["Move"]: (line, best) for line in analysis["lines"]}
+    for line, searchBest in analysis.get("moveLines", []):
+        lines.setdefault(line["Move"], (line, searchBest))
+    missing = [move for move in dict.fromkeys(moves) if not move in lines]
+    if len(missing) > 0:
+        searchmoves = [best["Move"]] + missing
+        reached, searched = searchPosition(stockfish, board.whiteToMove, len(searchmoves), budget.depth, budget.movetime, budget.nodes, searchmoves)
+        if len(searched) > 0:
+            # the best move of the restricted search, usually the best move of the analysis
+            added = []
+            for line in searched:
+                if not line["Move"] in lines:
+                    lines[line["Move"]] = (line, searched[0])
+                    added.append([line, searched[0]])
+            if len(added) > 0:
+                analysis = dict(analysis)
+                analysis["moveLines"] = analysis.get("moveLines", []) + added
+                cache.put(board, analysis)
+    ratings = {}
+    for move in moves:
+        if not move in lines:
+            continue
+        line, bestLine = lines[move]
+        before = lineEval(bestLine)
+        after = lineEval(line)
+        rating, moveClass = rateMove(move, best["Move"], before, after, board.whiteToMove)
+        ratings[move] = {
+            "Move": move,
+            "Best": best["Move"],
+            "Before": before,
+            "After": after,
+            "Rating": rating,
+            "Class": moveClass
+        }
+    return ratings
@@ -0,0 +1,168 @@
+# In-memory cache of analysis records with a memory budget.
+# Records are kept packed: the lines of a record are a single bytes object with a fixed size per line
+# and the engine parameters are shared between all records that were searched with the same parameters.
+# When the cache grows beyond its budget, the least recently used records are dropped.
+# Records are keyed by the Zobrist key of the position, so transpositions and repetitions share a record
+# regardless of the move counters. With a persistent store (see analysisstore.py), records are written through to it
+# and records that are not in memory are looked up there; the store is keyed by FEN.
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from board import Board, squareIndex, squareName
+
+# move (from | to << 6 | promotion << 12), score kind, score, win, draw, loss
+LINE = struct.Struct("<HBiHHH")
+PROMOTIONS = ["", "n", "b", "r", "q"]
+SCORE_CP = 0
+SCORE_MATE = 1
+NO_WDL = 0xFFFF
+# bytes of an entry in the ordered dict and its key, estimated
+ENTRY_OVERHEAD = 120
+
+def _packMove(move: str) -> int:
+    return squareIndex(move[0:2]) | squareIndex(move[2:4]) << 6 | PROMOTIONS.index(move[4:]) << 12
+
+def _unpackMove(packed: int) -> str:
+    return squareName(packed & 63) + squareName((packed >> 6) & 63) + PROMOTIONS[packed >> 12]
+
+def _packLine(line: dict) -> bytes:
+    wdl = line["WDL"] if line["WDL"] != None else [NO_WDL, NO_WDL, NO_WDL]
+    if line["Mate"] != None:
+        return LINE.pack(_packMove(line["Move"]), SCORE_MATE, line["Mate"], *wdl)
+    return LINE.pack(_packMove(line["Move"]), SCORE_CP, line["Centipawn"], *wdl)
+
+def _unpackLines(packed: bytes) -> list[dict]:
+    lines = []
+    for move, kind, score, win, draw, loss in LINE.iter_unpack(packed):
+        lines.append({
+            "Move": _unpackMove(move),
+            "Centipawn": score if kind == SCORE_CP else None,
+            "Mate": score if kind == SCORE_MATE else None,
+            "WDL": [win, draw, loss] if win != NO_WDL else None
+        })
+    return lines
+
+class PackedAnalysis:
+    __slots__ = ("depth", "multipv", "params", "lines", "moveLines")
+
+    def __init__(self, analysis: dict, params: dict):
+        self.depth = analysis["depth"]
+        self.multipv = analysis["multipv"]
+        self.params = params
+        self.lines = b"".join(_packLine(line) for line in analysis["lines"])
+        # the line of the move and the best line of its search for every pair, see analysis.rateMoves
+        self.moveLines = b"".join(_packLine(line) + _packLine(best) for line, best in analysis.get("moveLines", []))
+
+    # the analysis record, see analysis.py
+    def unpack(self) -> dict:
+        analysis = {"depth": self.depth, "multipv": self.multipv, "params": self.params, "lines": _unpackLines(self.lines)}
+        if self.moveLines != b"":
+            lines = _unpackLines(self.moveLines)
+            analysis["moveLines"] = [[lines[i], lines[i + 1]] for i in range(0, len(lines), 2)]
+        return analysis
+
+    def size(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.lines) + sys.getsizeof(self.moveLines) + ENTRY_OVERHEAD
+
+class AnalysisCache:
+    # maxBytes is the memory budget of the records, store the optional persistent store
+    def __init__(self, maxBytes: int = 64 * 1024 * 1024, store = None):
+        self.maxBytes = maxBytes
+        self.store = store
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # key -> PackedAnalysis, the least recently used first
+        self._params = {}               # engine parameters -> the shared dict of these parameters
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sharedParams(self, params: dict) -> dict:
+        key = tuple(sorted(params.items()))
+        shared = self._params.get(key)
+        if shared == None:
+            shared = dict(params)
+            self._params[key] = shared
+        return shared
+
+    # the analysis record of the position, or None if there is none
+    def get(self, board: Board) -> dict:
+        with self._lock:
+            packed = self._entries.get(board.key)
+            if packed != None:
+                self._entries.move_to_end(board.key)
+                self.hits += 1
+                return packed.unpack()
+            self.misses += 1
+        if self.store != None:
+            stored = self.store.get(board.fen)
+            if stored != None and stored.get("analysis") != None:
+                self._insert(board.key, stored["analysis"])
+                return stored["analysis"]
+        return None
+
+    # caches the analysis record of the position and writes it through to the persistent store
+    def put(self, board: Board, analysis: dict):
+        self._insert(board.key, analysis)
+        if self.store != None:
+            self.store.put(board.fen, {"analysis": analysis})
+
+    # the analysis record packed like the cached ones, sharing their parameters
+    def pack(self, analysis: dict) -> PackedAnalysis:
+        return PackedAnalysis(analysis, self._sharedParams(analysis["params"]))
+
+    def _insert(self, key: int, analysis: dict):
+        packed = self.pack(analysis)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old != None:
+                self.bytes -= old.size()
+            self._entries[key] = packed
+            self.bytes += packed.size()
+            while self.bytes > self.maxBytes and len(self._entries) > 1:
+                evictedKey, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size()
+                self.evictions += 1
+
+    # Fills the cache with the most recently used entries of the store, up to limit or until the memory budget is used.
+    # Runs alongside lookups, the preloaded entries count as used before anything the program has cached meanwhile.
+    # Returns the number of entries that were added.
+    def preload(self, limit: int = 100000) -> int:
+        added = 0
+        for fen, entry in self.store.recent(limit):
+            analysis = entry.get("analysis")
+            if analysis == None:
+                continue
+            key = Board(fen).key
+            packed = self.pack(analysis)
+            with self._lock:
+                if self.bytes + packed.size() > self.maxBytes:
+                    break
+                if key in self._entries:
+                    continue
+                # the entries come the most recently used first, each one goes before the ones loaded so far
+                self._entries[key] = packed
+                self._entries.move_to_end(key, last=False)
+                self.bytes += packed.size()
+            added += 1
+        return added
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0
+        }
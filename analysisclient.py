@@ -0,0 +1,52 @@
+# Client for the analysis server (see server.py), for using the server's engines and cache instead of local engines.
+import concurrent.futures
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Can be used instead of an engine pool (see analysis.analyzePositions).
+# Requests that are refused because the server is overloaded are retried after the time the server asks for.
+class AnalysisClient:
+    # raises RuntimeError if the server can not be reached
+    def __init__(self, url: str, timeout: float = 600, retries: int = 10):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        info = self._get("/info", {})
+        self.params = info["params"]
+        self.multipv = info["multipv"]
+        self.depth = info["depth"]
+        self.processes = info["processes"]
+
+    def _get(self, path: str, query: dict) -> dict:
+        url = self.url + path + ("?" + urllib.parse.urlencode(query) if len(query) > 0 else "")
+        for attempt in range(0, self.retries + 1):
+            try:
+                with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                    return json.loads(response.read())
+            except urllib.error.HTTPError as ex:
+                body = json.loads(ex.read() or b"{}")
+                if ex.code == 503 and attempt < self.retries:
+                    time.sleep(float(ex.headers.get("Retry-After", "1")))
+                    continue
+                raise RuntimeError(f"{self.url}{path}: {body.get('error', ex.reason)}")
+            except urllib.error.URLError as ex:
+                raise RuntimeError(f"{self.url}{path}: {ex.reason}")
+        raise RuntimeError(f"{self.url}{path}: still overloaded after {self.retries} retries")
+
+    def analysis(self, fen: str, multipv: int = 1, depth: int = 0) -> dict:
+        return self._get("/analysis", {"fen": fen, "multipv": multipv, "depth": depth})
+
+    # Analyzes the positions and yields the analysis records in the order of the positions, like EnginePool.imap.
+    # As many requests as the server has engines are sent at once.
+    def imap(self, fens, multipv: int = 1, depth: int = 0):
+        with concurrent.futures.ThreadPoolExecutor(max(1, self.processes)) as executor:
+            yield from executor.map(lambda fen: self.analysis(fen, multipv, depth), fens)
+
+    def metrics(self) -> dict:
+        return self._get("/metrics", {})
+
+    def close(self):
+        pass
@@ -0,0 +1,89 @@
+# Persistent store for engine analysis, shared between sessions and processes.
+# Entries are keyed by the normalized FEN (without move counters) and kept in an SQLite
+# database in WAL mode, which lets any number of processes read while one writes.
+# The store has no memory layer of its own, the analysis cache in front of it keeps the entries in memory
+# within its memory budget (see analysiscache.py).
+import json
+import sqlite3
+import threading
+import time
+from board import normalizeFen
+
+class AnalysisStore:
+    def __init__(self, path: str, maxEntries: int = 1000000, readOnly: bool = False):
+        self.path = path
+        self.maxEntries = maxEntries  # entries beyond this are evicted, least recently used first
+        self.readOnly = readOnly
+        self._lock = threading.Lock()
+        if readOnly:
+            self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False, isolation_level=None)
+        else:
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS analysis (position TEXT PRIMARY KEY, data TEXT NOT NULL, accessed REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS analysis_accessed ON analysis (accessed)")
+        self._count = self._db.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    # returns the stored entry (dict) for the position or None
+    def get(self, fen: str):
+        key = normalizeFen(fen)
+        with self._lock:
+            row = self._db.execute("SELECT data FROM analysis WHERE position = ?", (key,)).fetchone()
+            if row == None:
+                return None
+            if not self.readOnly:
+                self._db.execute("UPDATE analysis SET accessed = ? WHERE position = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, fen: str, entry: dict):
+        self.putMany([(fen, entry)])
+
+    # stores many entries in a single transaction. items is an iterable of (fen, entry)
+    def putMany(self, items):
+        if self.readOnly:
+            raise PermissionError(f"analysis store {self.path} is opened read only")
+        now = time.time()
+        rows = []
+        for fen, entry in items:
+            rows.append((normalizeFen(fen), json.dumps(entry, separators=(',', ':')), now))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("UPDATE analysis SET data = ?, accessed = ? WHERE position = ?", [(row[1], row[2], row[0]) for row in rows])
+                inserted = self._db.executemany("INSERT OR IGNORE INTO analysis (position, data, accessed) VALUES (?, ?, ?)", rows).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._count += inserted
+        if self._count > self.maxEntries:
+            self.evict()
+
+    # Yields (normalized fen, entry) of up to limit of the most recently used entries, the most recently used first.
+    # For filling a memory cache, see AnalysisCache.preload.
+    def recent(self, limit: int = 100000):
+        with self._lock:
+            rows = self._db.execute("SELECT position, data FROM analysis ORDER BY accessed DESC LIMIT ?", (limit,)).fetchall()
+        for key, data in rows:
+            yield key, json.loads(data)
+
+    # removes the least recently used entries until the store is below its size cap.
+    # Deletes a bit more than needed so that not every put has to evict.
+    def evict(self):
+        with self._lock:
+            self._count = self._db.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+            excess = self._count - int(self.maxEntries * 0.9)
+            if excess <= 0:
+                return
+            keys = self._db.execute("SELECT position FROM analysis ORDER BY accessed LIMIT ?", (excess,)).fetchall()
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("DELETE FROM analysis WHERE position = ?", keys)
+            self._db.execute("COMMIT")
+            self._count -= len(keys)
+
+    def close(self):
+        self._db.close()
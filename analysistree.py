@@ -0,0 +1,258 @@
+# Tree of positions and the moves between them, with variations, for exploring the analysis of a game.
+# Positions are nodes keyed by their Zobrist key, so a position that is reached by different move orders (a transposition)
+# is a single node with one analysis, one comment and the continuations of all move orders. The tree is a graph then,
+# repetitions can even make cycles, so every walk over it keeps track of the positions it visited.
+# Nodes keep the analysis of their position packed like the analysis cache does (see analysiscache.py),
+# so the tree still has it after the cache dropped it. Moving through the tree only looks up the nodes by their key
+# and touches the current node and its children, it does not get slower with the size of the tree.
+import regex
+from board import Board, START_FEN
+from movegen import makeMove, unmakeMove
+from fen import parseFen
+from analysis import lineEval
+from analysiscache import AnalysisCache
+from pgn import readTokens, sanToMove, moveToSan, HEADER, COMMENT, VARIATION_START, VARIATION_END, MOVE, RESULT
+
+# evaluation in a PGN comment, as written by toPgn and other programs: [%eval 0.35], [%eval #-3]
+EVAL_REGEX = regex.compile("\\s*\\[%eval [^\\]]*\\]\\s*")
+PGN_LINE_LENGTH = 79
+
+class TreeNode:
+    __slots__ = ("key", "children", "parents", "analysis", "comment")
+
+    def __init__(self, key: int):
+        self.key = key              # Zobrist key of the position
+        self.children = {}          # move -> TreeNode of the position after it, the main continuation first
+        self.parents = 0            # number of moves in the tree that lead to the position
+        self.analysis = None        # PackedAnalysis of the position, if it was analyzed
+        self.comment = ""
+
+class AnalysisTree:
+    def __init__(self, fen: str = START_FEN):
+        board = Board(fen)
+        self.rootFen = board.fen
+        self.headers = {}           # PGN headers of the game besides FEN and SetUp
+        self.nodes = {}             # Zobrist key -> TreeNode
+        self.root = self.node(board)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    # node of the position, added to the tree if it is not in it
+    def node(self, board: Board) -> TreeNode:
+        node = self.nodes.get(board.key)
+        if node == None:
+            node = TreeNode(board.key)
+            self.nodes[board.key] = node
+        return node
+
+    # Adds the move in the position, as a variation if the position has moves already.
+    # Returns the node of the position after the move.
+    def addMove(self, board: Board, move: str) -> TreeNode:
+        parent = self.node(board)
+        child = parent.children.get(move)
+        if child == None:
+            undo = makeMove(board, move)
+            child = self.node(board)
+            unmakeMove(board, move, undo)
+            parent.children[move] = child
+            child.parents += 1
+        return child
+
+    # adds the moves, played from the root position
+    def addLine(self, moves: list[str]):
+        board = Board(self.rootFen)
+        for move in moves:
+            self.addMove(board, move)
+            makeMove(board, move)
+
+    # Moves of the main continuation of the position, up to its end or a position that is on the line already.
+    def mainLine(self, board: Board) -> list[str]:
+        moves = []
+        seen = set()
+        node = self.nodes.get(board.key)
+        while node != None and len(node.children) > 0 and not node.key in seen:
+            seen.add(node.key)
+            move = next(iter(node.children))
+            moves.append(move)
+            node = node.children[move]
+        return moves
+
+    # makes the move the main continuation of the position
+    def promote(self, board: Board, move: str):
+        node = self.nodes[board.key]
+        child = node.children.pop(move)
+        node.children = {move: child, **node.children}
+
+    # Removes the move from the position. The positions that can't be reached from the root any more are removed as well.
+    def remove(self, board: Board, move: str):
+        node = self.nodes[board.key]
+        child = node.children.pop(move)
+        child.parents -= 1
+        # a position that is still reached by other moves may only be reached through the removed move, like in a cycle
+        reachable = {self.root.key}
+        stack = [self.root]
+        while len(stack) > 0:
+            for child in stack.pop().children.values():
+                if not child.key in reachable:
+                    reachable.add(child.key)
+                    stack.append(child)
+        for key in [key for key in self.nodes if not key in reachable]:
+            for child in self.nodes.pop(key).children.values():
+                child.parents -= 1
+
+    # Analysis record of the position, the node's or the cache's, whichever is more complete, None if neither has one.
+    # The node takes the cache's analysis if it is more complete and the cache gets the node's back if it dropped it.
+    def analysis(self, board: Board, cache: AnalysisCache) -> dict:
+        cached = cache.get(board)
+        node = self.nodes.get(board.key)
+        if node == None:
+            return cached
+        packed = node.analysis
+        if cached != None and (packed == None or packed.params != cached["params"]
+                or (cached["depth"], cached["multipv"]) > (packed.depth, packed.multipv)):
+            node.analysis = cache.pack(cached)
+            return cached
+        if packed == None:
+            return None
+        analysis = packed.unpack()
+        if cached == None:
+            cache.put(board, analysis)
+        return analysis
+
+    # The tree as PGN: the main continuations are the game, the other moves variations of it.
+    # The evaluation of analyzed positions is written to their comments as [%eval ...].
+    # The moves after a position that was written already (a transposition or repetition) are only written once,
+    # reading the PGN joins the move orders again.
+    def toPgn(self) -> str:
+        headers = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?", "White": "?", "Black": "?", "Result": "*"}
+        headers.update(self.headers)
+        if self.rootFen != START_FEN:
+            headers["SetUp"] = "1"
+            headers["FEN"] = self.rootFen
+        tokens = []
+        comment = self._comment(self.root)
+        if comment != None:
+            tokens.append(comment)
+        written = {self.root.key}
+        # an explicit stack instead of recursion, variations can be nested deeply in a large tree
+        # ("line", position, node, whether its first move needs the move number) writes the main continuation of the node
+        # ("variation", position, move, node) writes the move and the continuation of the node after it
+        stack = [("line", Board(self.rootFen), self.root, True)]
+        while len(stack) > 0:
+            item = stack.pop()
+            if item[0] == "token":
+                tokens.append(item[1])
+            elif item[0] == "variation":
+                _, board, move, node = item
+                self._writeMove(board, move, node, True, tokens)
+                if not node.key in written:
+                    written.add(node.key)
+                    stack.append(("line", _after(board, move), node, False))
+            else:
+                _, board, node, numbered = item
+                if len(node.children) == 0:
+                    continue
+                moves = list(node.children)
+                child = node.children[moves[0]]
+                self._writeMove(board, moves[0], child, numbered, tokens)
+                if not child.key in written:
+                    written.add(child.key)
+                    # after variations the move number is repeated
+                    stack.append(("line", _after(board, moves[0]), child, len(moves) > 1))
+                for move in reversed(moves[1:]):
+                    stack.append(("token", ")"))
+                    stack.append(("variation", board, move, node.children[move]))
+                    stack.append(("token", "("))
+        tokens.append(headers["Result"])
+        lines = [f'[{name} "{value}"]' for name, value in headers.items()]
+        lines.append("")
+        line = ""
+        for token in tokens:
+            if line == "" or line.endswith("(") or token == ")":
+                line += token
+            elif len(line) + 1 + len(token) > PGN_LINE_LENGTH:
+                lines.append(line)
+                line = token
+            else:
+                line += " " + token
+        lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def _writeMove(self, board: Board, move: str, node: TreeNode, numbered: bool, tokens: list[str]):
+        if board.whiteToMove:
+            tokens.append(f"{board.fullmove}.")
+        elif numbered:
+            tokens.append(f"{board.fullmove}...")
+        tokens.append(moveToSan(board, move))
+        comment = self._comment(node)
+        if comment != None:
+            tokens.append(comment)
+
+    # the comment of the node with its evaluation as a PGN comment, None if it has neither
+    def _comment(self, node: TreeNode) -> str:
+        parts = []
+        analysis = node.analysis.unpack() if node.analysis != None else None
+        # a position without moves is mate or stalemate, the moves show that
+        if analysis != None and len(analysis["lines"]) > 0:
+            evaluation = lineEval(analysis["lines"][0])
+            if evaluation["type"] == "mate":
+                parts.append(f"[%eval #{evaluation['value']}]")
+            else:
+                parts.append(f"[%eval {evaluation['value'] / 100:.2f}]")
+        if node.comment != "":
+            parts.append(node.comment.replace("}", ")"))
+        if len(parts) == 0:
+            return None
+        return "{" + " ".join(parts) + "}"
+
+    # Reads the first game of the PGN lines (e.g. an open file) with its variations and comments.
+    # Raises ValueError if the PGN has no game or a move is not legal.
+    @staticmethod
+    def fromPgn(lines) -> "AnalysisTree":
+        headers = {}
+        tree = None
+        board = None            # current position
+        before = None           # position before the last move, where a variation of it starts
+        variations = []         # (board, before) of the lines the open variations branched off from
+        for kind, text in readTokens(lines):
+            if kind == HEADER:
+                if tree != None:
+                    # the next game
+                    break
+                headers[text[0]] = text[1]
+                continue
+            if tree == None:
+                tree = AnalysisTree(parseFen(headers["FEN"]).fen if "FEN" in headers else START_FEN)
+                tree.headers = {name: value for name, value in headers.items() if not name in ["FEN", "SetUp"]}
+                board = Board(tree.rootFen)
+            if kind == MOVE:
+                move = sanToMove(board, text)
+                before = board.copy()
+                tree.addMove(board, move)
+                makeMove(board, move)
+            elif kind == VARIATION_START:
+                if before == None:
+                    raise ValueError("Variation without a move to replace")
+                variations.append((board, before))
+                board = before.copy()
+                before = None
+            elif kind == VARIATION_END:
+                if len(variations) == 0:
+                    raise ValueError("Unmatched ')'")
+                board, before = variations.pop()
+            elif kind == COMMENT:
+                comment = EVAL_REGEX.sub(" ", text).strip()
+                if comment != "":
+                    tree.node(board).comment = comment
+            elif kind == RESULT and len(variations) == 0:
+                tree.headers["Result"] = text
+                break
+        if tree == None:
+            raise ValueError("No game in the PGN")
+        return tree
+
+def _after(board: Board, move: str) -> Board:
+    after = board.copy()
+    makeMove(after, move)
+    return after
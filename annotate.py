@@ -0,0 +1,35 @@
+# Annotation of a whole game: the evaluation and best move of every position and a rating of every played move.
+# The positions are analyzed in parallel with the engine pool and the results are kept in the cache by their Zobrist key,
+# so annotating the game again after changing a few moves only searches the new positions.
+from ucidriver import UciEngine
+from analysis import analyzePositions, analysisEval, analysisBestMoves, rateMove
+from analysiscache import AnalysisCache
+from game import Game
+
+# Returns a list with one entry per played move:
+# {"Ply", "Move", "White", "Before", "After", "Best", "Rating", "Class"}
+# Before and After are the evaluations (see analysisEval), Best the best move of the engine in the position before the move.
+# Rating and Class are from rateMove.
+# progress is called with (positions done, positions to search), see analyzePositions.
+def annotateGame(stockfish: UciEngine, pool, game: Game, cache: AnalysisCache, depth: int = 0, progress = None) -> list[dict]:
+    boards = game.boards()
+    analyses = analyzePositions(stockfish, pool, [board.fen for board in boards], cache, 1, depth, progress)
+    analyses = [analyses[board.key] for board in boards]
+    evals = [analysisEval(analysis, board) for analysis, board in zip(analyses, boards)]
+    annotations = []
+    for ply, move in enumerate(game.moves):
+        board = boards[ply]
+        best = analysisBestMoves(analyses[ply], 1)
+        best = best[0]["Move"] if len(best) > 0 else None
+        rating, moveClass = rateMove(move, best, evals[ply], evals[ply + 1], board.whiteToMove)
+        annotations.append({
+            "Ply": ply + 1,
+            "Move": move,
+            "White": board.whiteToMove,
+            "Before": evals[ply],
+            "After": evals[ply + 1],
+            "Best": best,
+            "Rating": rating,
+            "Class": moveClass
+        })
+    return annotations
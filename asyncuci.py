@@ -0,0 +1,192 @@
+# asyncio based driver for a UCI engine.
+# Searches report their intermediate results while they run and can be stopped at any time,
+# keeping the lines found so far. Other coroutines keep running while the engine searches.
+import asyncio
+import concurrent.futures
+import threading
+from uci import parseInfo, topLines, goLimits
+
+class Search:
+    def __init__(self, whiteToMove: bool, multipv: int):
+        self.whiteToMove = whiteToMove
+        self.multipv = multipv
+        self.depth = 0              # last depth for which all lines are known
+        self.lines = []             # top lines of that depth, see uci.topLines
+        self.bestMove = None
+        self._current = {}          # multipv -> info of the depth that is being searched
+        self._currentDepth = 0
+        self._updates = asyncio.Queue()
+        self._finished = asyncio.Event()
+
+    def _onInfo(self, info: dict):
+        if not "move" in info or not "score" in info or "bound" in info:
+            return
+        # the engine reports all lines of a depth before starting the next one,
+        # so the first line of a new depth means the previous depth is complete
+        depth = info.get("depth", 0)
+        if depth > self._currentDepth and len(self._current) > 0:
+            self._completeDepth()
+        self._currentDepth = depth
+        self._current[info.get("multipv", 1)] = info
+
+    def _completeDepth(self):
+        self.lines = topLines(list(self._current.values()), self.whiteToMove)
+        self.depth = self._currentDepth
+        self._current = {}
+        self._updates.put_nowait((self.depth, self.lines))
+
+    def _onBestMove(self, move: str):
+        # a search that was stopped may not have reported all lines of the last depth
+        if len(self._current) > 0 and self._currentDepth > self.depth and (len(self._current) >= len(self.lines) or self.depth == 0):
+            self._completeDepth()
+        self.bestMove = None if move == "(none)" else move
+        self._finished.set()
+        self._updates.put_nowait(None)
+
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    # yields (depth, top lines) every time a depth is completed
+    async def updates(self):
+        while True:
+            update = await self._updates.get()
+            if update == None:
+                return
+            yield update
+
+    # waits for the search to finish and returns the top lines
+    async def wait(self) -> list[dict]:
+        await self._finished.wait()
+        return self.lines
+
+class AsyncEngine:
+    def __init__(self, process):
+        self._process = process
+        self._responses = asyncio.Queue()   # lines that are not part of a search
+        self._search = None
+        self._reader = None
+        self.options = []                   # names of the options the engine supports
+
+    @classmethod
+    async def start(cls, path: str, parameters: dict = None) -> "AsyncEngine":
+        process = await asyncio.create_subprocess_exec(path, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        engine = cls(process)
+        engine._reader = asyncio.ensure_future(engine._readLoop())
+        engine._write("uci")
+        while True:
+            line = await engine._responses.get()
+            if line.startswith("option name "):
+                engine.options.append(line[len("option name "):].split(" type ")[0])
+            elif line == "uciok":
+                break
+        await engine.setOptions(parameters if parameters != None else {})
+        if "UCI_ShowWDL" in engine.options:
+            await engine.setOptions({"UCI_ShowWDL": "true"})
+        return engine
+
+    def _write(self, command: str):
+        self._process.stdin.write((command + "\n").encode())
+
+    async def _readLoop(self):
+        while True:
+            raw = await self._process.stdout.readline()
+            if raw == b"":
+                break
+            line = raw.decode().strip()
+            search = self._search
+            if search != None and line.startswith("info "):
+                search._onInfo(parseInfo(line))
+            elif search != None and line.startswith("bestmove"):
+                self._search = None
+                search._onBestMove(line.split()[1])
+            elif line != "":
+                self._responses.put_nowait(line)
+
+    async def isReady(self):
+        self._write("isready")
+        await self._process.stdin.drain()
+        while await self._responses.get() != "readyok":
+            pass
+
+    async def setOptions(self, options: dict):
+        for name, value in options.items():
+            if name in self.options:
+                self._write(f"setoption name {name} value {value}")
+        await self.isReady()
+
+    # Starts searching the position and returns right away. Any running search is stopped first.
+    # The search ends at the depth or when it used up the time (ms) or nodes, without any limit it runs until it is stopped.
+    async def search(self, fen: str, whiteToMove: bool, multipv: int = 1, depth: int = 0, searchmoves: list[str] = None, movetime: int = 0, nodes: int = 0) -> Search:
+        if self._search != None:
+            await self.stop()
+        search = Search(whiteToMove, multipv)
+        self._write(f"setoption name MultiPV value {multipv}")
+        self._write(f"position fen {fen}")
+        go = "go " + goLimits(depth, movetime, nodes)
+        if searchmoves:
+            go = go + " searchmoves " + " ".join(searchmoves)
+        self._search = search
+        self._write(go)
+        await self._process.stdin.drain()
+        return search
+
+    # Stops the running search and returns its top lines.
+    # If a search is given, it is only stopped if it is still the one that is running.
+    async def stop(self, search: Search = None) -> list[dict]:
+        if search == None:
+            search = self._search
+        if search == None or search != self._search:
+            return search.lines if search != None else []
+        self._write("stop")
+        await self._process.stdin.drain()
+        return await search.wait()
+
+    async def quit(self):
+        await self.stop()
+        self._write("quit")
+        await self._process.stdin.drain()
+        await self._process.wait()
+        self._reader.cancel()
+
+# Runs an event loop in a background thread that owns an engine, started on first use.
+# Coroutines are handed to the loop with run(), which returns a concurrent.futures.Future,
+# so the (blocking) menu can keep waiting for input while searches run.
+# onStart is called with the AsyncEngine once it runs, e.g. to register it with the profiler.
+class BackgroundEngine:
+    def __init__(self, path: str, parameters: dict = None, onStart = None):
+        self.path = path
+        self.parameters = parameters
+        self.onStart = onStart
+        self.loop = asyncio.new_event_loop()
+        self._engine = None         # future of the started engine
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def engine(self) -> AsyncEngine:
+        if self._engine == None:
+            self._engine = asyncio.ensure_future(self._start())
+        # a cancelled caller (like a cancelled prefetch) must not cancel the start of the engine for everyone else
+        return await asyncio.shield(self._engine)
+
+    async def _start(self) -> AsyncEngine:
+        engine = await AsyncEngine.start(self.path, self.parameters)
+        if self.onStart != None:
+            self.onStart(engine)
+        return engine
+
+    # stops the search that is currently running, if any
+    async def stop(self):
+        if self._engine != None:
+            await (await self._engine).stop()
+
+    async def _quit(self):
+        await (await self._engine).quit()
+
+    def close(self):
+        if self._engine != None:
+            self.run(self._quit()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,212 @@
+#!python3
+# Non-interactive analysis of many positions.
+# Reads positions from an EPD/FEN file (one position per line) or the mainlines of a PGN file,
+# analyzes them with a pool of engines and writes one JSON object per position to the output file.
+# Positions are streamed, so the memory used does not depend on the size of the input.
+# If the output file already exists, the positions it contains are skipped, so an interrupted run can be resumed.
+#
+# python batch.py positions.epd results.jsonl --processes 4 --threads 2 --hash 512
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from board import Board
+from chess import ENGINE_PATH, ENGINE_DEPTH, ENGINE_PARAMS
+from config import loadConfig
+from analysis import ANALYSIS_PARAMS, analysisCovers, analysisEval, analysisWDL, analysisBestMoves
+from analysisstore import AnalysisStore
+from enginepool import EnginePool
+from pgn import readGames, gameStartFen, sanToMove
+from movegen import makeMove
+from fen import parseFen, parseFields
+
+class BatchItem:
+    __slots__ = ("index", "id", "fen", "error", "analysis")
+
+    def __init__(self, index: int, id: str, fen: str, error: str = None):
+        self.index = index
+        self.id = id
+        self.fen = fen
+        self.error = error
+        self.analysis = None
+
+# Turns a line of an EPD or FEN file into a FEN and an id.
+# EPD lines only have the first four fields of a FEN, followed by operations like 'id "name";'.
+def parseEpdLine(line: str):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        return line, None
+    fen = " ".join(fields[0:4])
+    rest = fields[4] if len(fields) > 4 else ""
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        # a complete FEN
+        return f"{fen} {counters[0]} {counters[1]}", None
+    ops = {}
+    for op in rest.split(";"):
+        parts = op.strip().split(None, 1)
+        if len(parts) == 2:
+            ops[parts[0]] = parts[1].strip('"')
+    return f"{fen} {ops.get('hmvc', '0')} {ops.get('fmvn', '1')}", ops.get("id")
+
+def readEpd(path: str):
+    with open(path, "r") as file:
+        for lineNumber, line in enumerate(file, 1):
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            fen, id = parseEpdLine(line)
+            yield (id if id != None else f"line {lineNumber}"), fen, None
+
+# yields every position of the mainline of every game
+def readPgn(path: str):
+    with open(path, "r") as file:
+        for gameNumber, (headers, moves) in enumerate(readGames(file), 1):
+            fen = gameStartFen(headers)
+            try:
+                board = parseFen(fen)
+            except ValueError as ex:
+                yield f"game {gameNumber}", fen, str(ex)
+                continue
+            yield f"game {gameNumber} ply 0", board.fen, None
+            for ply, san in enumerate(moves, 1):
+                try:
+                    makeMove(board, sanToMove(board, san))
+                except ValueError as ex:
+                    yield f"game {gameNumber} ply {ply}", board.fen, str(ex)
+                    break
+                yield f"game {gameNumber} ply {ply}", board.fen, None
+
+def readPositions(path: str):
+    if path.lower().endswith(".pgn"):
+        return readPgn(path)
+    return readEpd(path)
+
+# Number of complete results in the output file of an earlier run.
+# A line that was only partially written when the run was interrupted is removed.
+def resumeOutput(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    complete = 0    # length of the file up to the last complete line
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            count += 1
+            complete += len(line)
+    if complete != os.path.getsize(path):
+        with open(path, "r+b") as file:
+            file.truncate(complete)
+    return count
+
+# Analyzes the items and yields them in input order. Items that are invalid or already in the store are passed through
+# without a search, everything else goes through the engine pool. Only a few items are read ahead of the first one that
+# is not done yet, so the memory used does not depend on the number of items and results are written as they come.
+def analyzeItems(pool: EnginePool, items, multipv: int, depth: int, store: AnalysisStore, params: dict):
+    maxPending = pool.processes * 2     # searches queued at a time
+    maxQueue = pool.processes * 8       # items read ahead, a search that takes long holds back the items after it
+    queue = deque()                     # items in input order that were not yielded yet
+    pending = {}                        # job id -> item of the queued searches
+    items = iter(items)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < maxPending and len(queue) < maxQueue:
+            item = next(items, None)
+            if item == None:
+                exhausted = True
+                break
+            queue.append(item)
+            if item.error != None:
+                continue
+            if store != None:
+                stored = store.get(item.fen)
+                if stored != None and analysisCovers(stored.get("analysis"), multipv, depth, params):
+                    item.analysis = stored["analysis"]
+                    continue
+            pending[pool.submit(item.fen, multipv, depth)] = item
+        while len(queue) > 0 and (queue[0].error != None or queue[0].analysis != None):
+            yield queue.popleft()
+        if len(pending) == 0:
+            if exhausted:
+                return
+            continue
+        idx, analysis, error = pool.nextResult()
+        item = pending.pop(idx, None)
+        if item == None:
+            continue
+        if error != None:
+            raise RuntimeError(f"Analysis of {item.fen} failed: {error}")
+        item.analysis = analysis
+        if store != None:
+            store.put(item.fen, {"analysis": analysis})
+
+def toJson(item: BatchItem, multipv: int) -> str:
+    result = {"index": item.index, "id": item.id, "fen": item.fen}
+    if item.error != None:
+        result["error"] = item.error
+    else:
+        analysis = item.analysis
+        result["depth"] = analysis["depth"]
+        result["eval"] = analysisEval(analysis, Board(item.fen))
+        result["best_moves"] = analysisBestMoves(analysis, multipv)
+        result["wdl"] = analysisWDL(analysis)
+    return json.dumps(result, separators=(',', ':'))
+
+def main():
+    # defaults from the config file and environment, see config.py
+    try:
+        config = loadConfig(ENGINE_PATH, ENGINE_DEPTH, ENGINE_PARAMS)
+    except ValueError as ex:
+        sys.exit(f"Error: {ex}")
+    parser = argparse.ArgumentParser(description="Analyze positions from an EPD/FEN or PGN file and write the results as JSON lines.")
+    parser.add_argument("input", help="EPD/FEN file with one position per line, or a PGN file (.pgn)")
+    parser.add_argument("output", help="JSON lines output file. Existing results are kept and skipped.")
+    parser.add_argument("--engine", default=config["engine"], help="path to the stockfish binary")
+    parser.add_argument("--depth", type=int, default=config["depth"])
+    parser.add_argument("--multipv", type=int, default=config["parameters"]["MultiPV"], help="number of top moves to report")
+    parser.add_argument("--processes", type=int, default=config["processes"] if config["processes"] > 0 else max(1, (os.cpu_count() or 2) // 2), help="number of engine processes")
+    parser.add_argument("--threads", type=int, default=2, help="threads per engine process")
+    parser.add_argument("--hash", type=int, default=256, help="hash size in MB per engine process")
+    parser.add_argument("--cache", default=config["cache"], help="persistent analysis store to read from and write to")
+    args = parser.parse_args()
+
+    done = resumeOutput(args.output)
+    if done > 0:
+        print(f"Resuming after {done} positions.", file=sys.stderr)
+    store = AnalysisStore(args.cache) if args.cache != "" else None
+    params = dict(config["parameters"])
+    params["MultiPV"] = args.multipv
+    analysisParams = {name: params.get(name) for name in ANALYSIS_PARAMS}
+
+    def items():
+        for index, (id, fen, error) in enumerate(readPositions(args.input)):
+            if index < done:
+                continue
+            if error == None:
+                try:
+                    parseFields(fen)
+                except ValueError as ex:
+                    error = str(ex)
+            yield BatchItem(index, id, fen, error)
+
+    start = time.perf_counter()
+    lastReport = start
+    count = 0
+    with EnginePool(args.engine, processes=args.processes, threads=args.threads, hash=args.hash, depth=args.depth, parameters=params) as pool:
+        with open(args.output, "a") as output:
+            for item in analyzeItems(pool, items(), args.multipv, args.depth, store, analysisParams):
+                output.write(toJson(item, args.multipv) + "\n")
+                output.flush()
+                count += 1
+                now = time.perf_counter()
+                if now - lastReport >= 5:
+                    lastReport = now
+                    print(f"{done + count} positions, {count / (now - start):.2f} positions/sec", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"Done. {count} positions in {elapsed:.1f}s ({count / elapsed if elapsed > 0 else 0:.2f} positions/sec)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!python3
+# Benchmarks of the interactive operations against the fake engine (see fakeengine.py), no Stockfish binary needed.
+# Reports the wall time and the engine round trips of every operation over a fixed set of positions.
+# The round trips of every operation are deterministic and don't depend on the machine, the expected counts are checked in
+# (bench_counts.json) and the run fails if an operation needs more of them. Timings depend on the machine, with a local
+# timing baseline (saved with --save, not checked in) the run also fails if an operation got slower than the tolerance allows.
+#
+# python bench.py                   # exit code 1 on a regression
+# python bench.py --save            # record the local timing baseline
+# python bench.py --save-counts     # record the round trips after an operation needs fewer of them
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import chess
+from board import Board
+from movegen import legalMoves, getCapture, Capture, PERFT_SUITE
+from fakeengine import FakeStockfish
+from game import Game
+from prefetch import Prefetcher
+from analysiscache import AnalysisCache
+
+BENCH_POSITIONS = [fen for fen, counts in PERFT_SUITE] + [
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "8/8/4k3/8/2p5/8/B2K4/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1",
+]
+BENCH_DEPTH = 10
+DEFAULT_BASELINE = "bench_baseline.json"
+# expected round trips of every operation, checked in
+COUNTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_counts.json")
+
+# shorthand inputs as a user would type them (e4, Nf3, exd5, oo) for every legal move
+def shorthandMoves(board: Board) -> list[str]:
+    moves = []
+    for move in legalMoves(board):
+        piece = board.pieceAt(move[0:2]).upper()
+        capture = getCapture(board, move) != Capture.NO_CAPTURE
+        if piece == 'K' and move[0] == 'e' and move[2] in "cg":
+            moves.append("oo" if move[2] == 'g' else "ooo")
+        elif piece == 'P':
+            moves.append((move[0] + "x" if capture else "") + move[2:])
+        else:
+            moves.append(piece + ("x" if capture else "") + move[2:4])
+    return moves
+
+def newEngine(latency: float) -> FakeStockfish:
+    return FakeStockfish(depth=BENCH_DEPTH, parameters=chess.ENGINE_PARAMS, latency=latency)
+
+def newSession() -> chess.Session:
+    session = chess.Session({"prefetch": False}, AnalysisCache())
+    session.evalMoves = True
+    return session
+
+def benchFenPass(engine: FakeStockfish) -> int:
+    calls = 0
+    for i in range(0, 200):
+        for fen in BENCH_POSITIONS:
+            chess.fenPass(fen)
+            calls += 1
+    return calls
+
+def benchResolveMove(engine: FakeStockfish) -> int:
+    calls = 0
+    for fen in BENCH_POSITIONS:
+        board = Board(fen)
+        for move in shorthandMoves(board) + legalMoves(board):
+            chess.resolveMove(board, move)
+            calls += 1
+    return calls
+
+def benchBoardStr(engine: FakeStockfish) -> int:
+    calls = 0
+    for i in range(0, 25):
+        for fen in BENCH_POSITIONS:
+            board = Board(fen)
+            for flip in [False, True]:
+                chess.BOARD_CACHE.clear()
+                chess.getBoardStr(board, flip=flip)
+                calls += 1
+    return calls
+
+def benchBoardStrEval(engine: FakeStockfish) -> int:
+    calls = 0
+    session = newSession()
+    for i in range(0, 2):
+        for fen in BENCH_POSITIONS:
+            game = Game(fen, engine)
+            chess.getBoardStr(game.board, stockfish=engine, session=session)
+            calls += 1
+    return calls
+
+def benchEvaluateMove(engine: FakeStockfish) -> int:
+    calls = 0
+    session = newSession()
+    prefetcher = Prefetcher(None, session.cache)    # never started, wait() returns right away
+    for fen in BENCH_POSITIONS:
+        game = Game(fen, engine)
+        for move in legalMoves(game.board)[0:5]:
+            chess.evaluateMove(engine, prefetcher, game, move, session)
+            calls += 1
+    return calls
+
+def benchStaticEval(engine: FakeStockfish) -> int:
+    # all replies of a position in one batch
+    calls = 0
+    if chess.loadStaticEval() == None:
+        return calls
+    for i in range(0, 10):
+        for fen in BENCH_POSITIONS:
+            chess.loadStaticEval().staticMoveEvals(Board(fen))
+            calls += 1
+    return calls
+
+BENCHMARKS = [
+    ("fenPass", benchFenPass),
+    ("resolveMove", benchResolveMove),
+    ("getBoardStr", benchBoardStr),
+    ("getBoardStr+eval", benchBoardStrEval),
+    ("evaluateMove", benchEvaluateMove),
+    ("staticMoveEvals", benchStaticEval),
+]
+
+# Runs every benchmark repeat times and keeps the fastest run.
+# Returns name -> {"calls", "seconds", "roundTrips", "commands", "writes"}
+def runBenchmarks(repeat: int = 3, latency: float = 0.0) -> dict:
+    results = {}
+    realInput = builtins.input
+    builtins.input = lambda prompt = "": "n"    # decline every move preview
+    try:
+        for name, benchmark in BENCHMARKS:
+            best = None
+            for i in range(0, repeat):
+                engine = newEngine(latency)
+                engine.process.resetCounts()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    calls = benchmark(engine)
+                    seconds = time.perf_counter() - start
+                if best == None or seconds < best["seconds"]:
+                    best = {"calls": calls, "seconds": seconds, "roundTrips": engine.process.roundTrips, "commands": sum(engine.process.counts.values()), "writes": engine.process.writes}
+            results[name] = best
+    finally:
+        builtins.input = realInput
+    return results
+
+# returns the descriptions of all regressions against the expected round trips and the timing baseline
+def compare(results: dict, counts: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name in counts and result["roundTrips"] > counts[name]:
+            regressions.append(f"{name}: {result['roundTrips']} round trips, expected {counts[name]}")
+        old = baseline.get(name)
+        if old == None:
+            continue
+        if result["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['seconds'] * 1000:.1f}ms, baseline {old['seconds'] * 1000:.1f}ms (+{tolerance * 100:.0f}% allowed)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the interactive operations against a fake engine.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="file with the timings to compare against")
+    parser.add_argument("--save", action="store_true", help="save the timings as the new baseline")
+    parser.add_argument("--save-counts", action="store_true", help=f"save the round trips as the expected ones in {os.path.basename(COUNTS_PATH)}")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest one counts")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake engine takes for every round trip")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.repeat, args.latency)
+    counts = {}
+    if os.path.exists(COUNTS_PATH):
+        with open(COUNTS_PATH, "r") as file:
+            counts = json.load(file)
+    elif not args.save_counts:
+        print(f"Missing {COUNTS_PATH}, the expected round trips")
+        return 1
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+    print(f"{'operation':<18} {'calls':>6} {'total ms':>10} {'us/call':>10} {'round trips':>12} {'expected':>9} {'commands':>9} {'writes':>7}  baseline")
+    for name, result in results.items():
+        old = baseline.get(name)
+        oldStr = f"{old['seconds'] * 1000:.1f}ms" if old != None else "-"
+        print(f"{name:<18} {result['calls']:>6} {result['seconds'] * 1000:>10.1f} {result['seconds'] / max(result['calls'], 1) * 1e6:>10.1f} {result['roundTrips']:>12} {counts.get(name, '-'):>9} {result['commands']:>9} {result['writes']:>7}  {oldStr}")
+    if args.save_counts:
+        with open(COUNTS_PATH, "w") as file:
+            json.dump({name: result["roundTrips"] for name, result in results.items()}, file, indent=2)
+            file.write("\n")
+        print(f"Saved round trips to {COUNTS_PATH}")
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    if args.save or args.save_counts:
+        return 0
+    regressions = compare(results, counts, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
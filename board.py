@@ -0,0 +1,134 @@
+# Local model of the position on the board.
+# Parsed once from a FEN string whenever the position changes so that rendering,
+# piece lookups and move descriptions don't need to ask the engine.
+
+from zobrist import computeKey
+
+# Squares are stored in a flat list of 64 entries. Index 0 is a1, 7 is h1, 56 is a8 and 63 is h8.
+# Each entry is either None (empty square) or the FEN letter of the piece on it.
+
+FILES = "abcdefgh"
+RANKS = "12345678"
+
+WHITE_PIECES = "PNBRQK"
+BLACK_PIECES = "pnbrqk"
+
+# Names of the pieces, matching the names of the stockfish Piece enum
+PIECE_NAMES = {
+    'P': "WHITE_PAWN",
+    'N': "WHITE_KNIGHT",
+    'B': "WHITE_BISHOP",
+    'R': "WHITE_ROOK",
+    'Q': "WHITE_QUEEN",
+    'K': "WHITE_KING",
+    'p': "BLACK_PAWN",
+    'n': "BLACK_KNIGHT",
+    'b': "BLACK_BISHOP",
+    'r': "BLACK_ROOK",
+    'q': "BLACK_QUEEN",
+    'k': "BLACK_KING"
+}
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def squareIndex(square: str) -> int:
+    # "e4" -> 28
+    return (ord(square[1]) - ord('1')) * 8 + (ord(square[0]) - ord('a'))
+
+def squareName(index: int) -> str:
+    # 28 -> "e4"
+    return FILES[index & 7] + RANKS[index >> 3]
+
+class Board:
+    __slots__ = ("squares", "whiteToMove", "castling", "epSquare", "halfmove", "fullmove", "key", "_fen")
+
+    def __init__(self, fen: str = START_FEN):
+        self.squares = [None] * 64
+        self.setFen(fen)
+
+    # FEN of the position. Rebuilt from the board only when it was changed by a move.
+    @property
+    def fen(self) -> str:
+        if self._fen is None:
+            self._fen = self.toFen()
+        return self._fen
+
+    def copy(self) -> "Board":
+        other = Board.__new__(Board)
+        other.squares = self.squares[:]
+        other.whiteToMove = self.whiteToMove
+        other.castling = self.castling
+        other.epSquare = self.epSquare
+        other.halfmove = self.halfmove
+        other.fullmove = self.fullmove
+        other.key = self.key
+        other._fen = self._fen
+        return other
+
+    # Board from already parsed fields, see fen.parseFen
+    @classmethod
+    def fromFields(cls, squares: list, whiteToMove: bool, castling: str, epSquare: str, halfmove: int, fullmove: int, fen: str) -> "Board":
+        board = cls.__new__(cls)
+        board.squares = squares
+        board.whiteToMove = whiteToMove
+        board.castling = castling
+        board.epSquare = epSquare
+        board.halfmove = halfmove
+        board.fullmove = fullmove
+        board.key = computeKey(squares, whiteToMove, castling, epSquare)
+        board._fen = fen
+        return board
+
+    # Parse the FEN into the board. The FEN is expected to be valid (see fen.parseFen).
+    def setFen(self, fen: str):
+        fields = fen.split()
+        squares = self.squares
+        for i in range(0, 64):
+            squares[i] = None
+        rank = 7
+        file = 0
+        for c in fields[0]:
+            if c == '/':
+                rank -= 1
+                file = 0
+            elif c.isdigit():
+                file += int(c)
+            else:
+                squares[rank * 8 + file] = c
+                file += 1
+        self.whiteToMove = len(fields) < 2 or fields[1] == 'w'
+        self.castling = fields[2] if len(fields) > 2 else '-'
+        self.epSquare = None if len(fields) < 4 or fields[3] == '-' else fields[3]
+        self.halfmove = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmove = int(fields[5]) if len(fields) > 5 else 1
+        self.key = computeKey(squares, self.whiteToMove, self.castling, self.epSquare) # Zobrist key of the position
+        self._fen = fen
+
+    def toFen(self) -> str:
+        rows = []
+        for rank in range(7, -1, -1):
+            row = ""
+            empty = 0
+            for piece in self.squares[rank * 8:rank * 8 + 8]:
+                if piece == None:
+                    empty += 1
+                else:
+                    if empty > 0:
+                        row = row + str(empty)
+                        empty = 0
+                    row = row + piece
+            if empty > 0:
+                row = row + str(empty)
+            rows.append(row)
+        ep = '-' if self.epSquare == None else self.epSquare
+        return f"{'/'.join(rows)} {'w' if self.whiteToMove else 'b'} {self.castling} {ep} {self.halfmove} {self.fullmove}"
+
+    # returns the FEN letter of the piece on the square ("e4") or None if the square is empty
+    def pieceAt(self, square: str):
+        return self.squares[squareIndex(square)]
+
+
+# FEN without the halfmove and fullmove counters, so the same position reached at a
+# different point of the game maps to the same key.
+def normalizeFen(fen: str) -> str:
+    return " ".join(fen.split()[0:4])
@@ -0,0 +1,64 @@
+# Lookup of moves in a Polyglot opening book (.bin).
+# The book is a sorted array of 16 byte entries (key, move, weight, learn), all big endian.
+# The file is memory mapped and searched with a binary search on the Zobrist key of the position
+# (see zobrist.py), so opening even a large book is instant and only the touched pages are read.
+import mmap
+import struct
+from board import Board, squareName
+from movegen import legalMoves
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+PROMOTIONS = ["", "n", "b", "r", "q"]
+# Polyglot encodes castling as the king capturing its own rook
+CASTLING_MOVES = {"e1h1": "e1g1", "e1a1": "e1c1", "e8h8": "e8g8", "e8a8": "e8c8"}
+
+class OpeningBook:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = len(self._map) // ENTRY.size
+
+    def _keyAt(self, index: int) -> int:
+        return KEY.unpack_from(self._map, index * ENTRY.size)[0]
+
+    # index of the first entry with a key that is not less than the given key
+    def _lowerBound(self, key: int) -> int:
+        lo = 0
+        hi = self.entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._keyAt(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _decodeMove(self, board: Board, raw: int) -> str:
+        move = squareName((raw >> 6) & 63) + squareName(raw & 63) + PROMOTIONS[(raw >> 12) & 7]
+        if move in CASTLING_MOVES and board.pieceAt(move[0:2]) in ['K', 'k']:
+            move = CASTLING_MOVES[move]
+        return move
+
+    # Book moves of the position as [{"Move", "Weight"}], the most played first. Empty if the position is not in the book.
+    def lookup(self, board: Board) -> list[dict]:
+        index = self._lowerBound(board.key)
+        moves = {}
+        legal = None
+        while index < self.entries:
+            key, raw, weight, learn = ENTRY.unpack_from(self._map, index * ENTRY.size)
+            if key != board.key:
+                break
+            index += 1
+            move = self._decodeMove(board, raw)
+            if legal == None:
+                legal = legalMoves(board)
+            # a key collision or a broken book could give moves that can't be played here
+            if move in legal:
+                moves[move] = moves.get(move, 0) + weight
+        return [{"Move": move, "Weight": weight} for move, weight in sorted(moves.items(), key=lambda item: -item[1])]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
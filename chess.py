@@ -1,8 +1,26 @@
 #!python3
-from stockfish import Stockfish
+import concurrent.futures
+import os
+import select
+import sys
+import threading
+import time
+from ucidriver import UciEngine
 from termcolor import colored
 import regex
-# https://pypi.org/project/stockfish/
+from board import Board, FILES, PIECE_NAMES, START_FEN, squareIndex
+from movegen import Capture, legalMoves, getCapture, makeMove
+from analysis import Budget, deepenAnalysis, getAnalysisParams, analysisCovers, analysisEval, analysisWDL, analysisBestMoves, moveRating, rateMove, rateMoves
+from analysiscache import AnalysisCache
+from asyncuci import BackgroundEngine
+from prefetch import Prefetcher
+from game import Game
+from analysistree import AnalysisTree
+from pgn import moveToSan
+from fen import parseFen, parseFields
+from profiler import PROFILER, ASYNC_ENGINE_METHODS, POOL_METHODS
+from lazyengine import LazyEngine
+from config import loadConfig, backgroundParams
 
 class ColorConst:
     # red, green, yellow, blue, magenta, cyan, white.
@@ -18,55 +36,157 @@ class Player:
     BLACK = "Black"
     WHITE = "White"
 
+# State of the program besides the game: display settings, the configuration and where analysis comes from
+class Session:
+    def __init__(self, config: dict, cache: AnalysisCache):
+        self.pov = False            # show the board from black's side
+        self.evalMoves = False      # evaluate moves before playing them
+        self.config = config        # see config.py
+        self.cache = cache          # analysis of positions
+        self.book = None            # opening book, see book.py
+        self.server = None          # analysis server to search with instead of the local engines, see analysisclient.py
+        self.pool = None            # engine pool for analyzing many positions, started on first use
+        self.tree = None            # analysis tree of the game with its variations, see explore
+
+# staticeval module once it was loaded, None if it can't be, see loadStaticEval
+STATIC_EVAL = False
+
+# The static evaluation (see staticeval.py), imported on first use like the other heavy modules: it loads NumPy.
+# None without NumPy, there is only the engine's evaluation then.
+def loadStaticEval():
+    global STATIC_EVAL
+    if STATIC_EVAL == False:
+        try:
+            import staticeval
+            STATIC_EVAL = staticeval
+        except ImportError:
+            STATIC_EVAL = None
+    return STATIC_EVAL
+
+# names of the menu actions in the profiling data, anything else is a move
+MENU_ACTIONS = {
+    "0": "profiling",
+    "1": "best moves",
+    "2": "move help",
+    "3": "set board",
+    "4": "flip sides",
+    "5": "revert",
+    "6": "evaluate board",
+    "7": "switch pov",
+    "8": "evaluate moves",
+    "9": "exit",
+    "10": "annotate",
+    "11": "rate moves",
+    "12": "explore"
+}
+
+# defaults, see config.py for the config file and environment variables that change them
+ENGINE_PATH = "stockfish"           # searched in PATH
+ENGINE_DEPTH = 20
+ENGINE_PARAMS = {
+    "Debug Log File": "",
+    "Contempt": 0,
+    "Min Split Depth": 0,
+    "Threads": 4,                   # More threads will make the engine stronger, but should be kept at less than the number of logical processors on your computer.
+    "Ponder": "true",               # Let stockfish ponder the next move while the opponent is thinking
+    "Hash": 2048,                   # 1024 MB for the hash table - you may want to increase/decrease this, depending on how much RAM you want to use. Should also be kept as some power of 2.
+    "MultiPV": 4,                   # Output the N best lines (principal variations, PVs) when searching. Leave at 1 for best performance.
+    "Skill Level": 100,             # Lower the Skill Level in order to make Stockfish play weaker (see also UCI_LimitStrength). Internally, MultiPV is enabled, and with a certain probability depending on the Skill Level a weaker move will be played.
+    "Move Overhead": 0,             # Assume a time delay of x ms due to network and GUI overheads. This is useful to avoid losses on time in those cases.
+    "Minimum Thinking Time": 60,
+    "Slow Mover": 200,              # Lower values will make Stockfish take less time in games, higher values will make it think longer.
+    "UCI_Chess960": "false",
+    "UCI_LimitStrength": "false",
+    "UCI_Elo": 1350
+}
+# Search limits of the menu actions, see analysis.Budget. A depth of 0 is ENGINE_DEPTH.
+# A search that runs out of time keeps the deepest result it found, asking again continues from there.
+ENGINE_BUDGETS = {
+    "preview": Budget(movetime=1000),               # evaluating moves before playing them
+    "best moves": Budget(depth=30, movetime=60000)  # get best moves, can be stopped early with enter
+}
+# plies beyond ENGINE_DEPTH to which the positions that are viewed in the analysis tree are deepened in the background
+EXPLORE_DEPTH = 10
+# moves before the current position that are shown when exploring
+EXPLORE_PATH_LENGTH = 8
+
 def main():
-    params = {
-        "Debug Log File": "",
-        "Contempt": 0,
-        "Min Split Depth": 0,
-        "Threads": 4,                   # More threads will make the engine stronger, but should be kept at less than the number of logical processors on your computer.
-        "Ponder": "true",               # Let stockfish ponder the next move while the opponent is thinking
-        "Hash": 2048,                   # 1024 MB for the hash table - you may want to increase/decrease this, depending on how much RAM you want to use. Should also be kept as some power of 2.
-        "MultiPV": 4,                   # Output the N best lines (principal variations, PVs) when searching. Leave at 1 for best performance.
-        "Skill Level": 100,             # Lower the Skill Level in order to make Stockfish play weaker (see also UCI_LimitStrength). Internally, MultiPV is enabled, and with a certain probability depending on the Skill Level a weaker move will be played.
-        "Move Overhead": 0,             # Assume a time delay of x ms due to network and GUI overheads. This is useful to avoid losses on time in those cases.
-        "Minimum Thinking Time": 60,
-        "Slow Mover": 200,              # Lower values will make Stockfish take less time in games, higher values will make it think longer.
-        "UCI_Chess960": "false",
-        "UCI_LimitStrength": "false",
-        "UCI_Elo": 1350
-    }
-    stockfish = Stockfish(
-        path="/home/paul/repositories/chess/stockfish/src/stockfish",
-        depth=20,
-        parameters=params
-    )
-    
+    try:
+        config = loadConfig(ENGINE_PATH, ENGINE_DEPTH, ENGINE_PARAMS)
+    except ValueError as ex:
+        print(f"Error: {ex}")
+        return
+    # searches go to the analysis server instead of local engines if there is one
+    server = None
+    if config["server"] != "":
+        from analysisclient import AnalysisClient
+        try:
+            server = AnalysisClient(config["server"])
+        except RuntimeError as ex:
+            print(f"Error: {ex}")
+            return
+        config["prefetch"] = False
+    # the engines start when the first search needs them, or in the background right away with warm up,
+    # and register with the profiler then, so profiling doesn't start them
+    stockfish = LazyEngine(config["engine"], config["depth"], config["parameters"], onStart=PROFILER.register)
+    background = BackgroundEngine(config["engine"], backgroundParams(config), onStart=lambda engine: PROFILER.register(engine, ASYNC_ENGINE_METHODS, "background ")) # engine for searches that run while the user does something else
+    if config["warmup"] and server == None:
+        stockfish.warmUp()
+        background.run(background.engine())
     finished = False        # whether to exit the program or not
-    history = []            # history of board positions
-    cache = {}              # cache of values for board positions
-    cache["pov"] = False
-    cache["eval_moves"] = False
+    game = Game(START_FEN, stockfish) # moves played from the root position, keeps the engine on the current position
+    board = game.board      # local copy of the position, kept in sync with the engine
+    lastKey = None          # Zobrist key of the position of the previous iteration
+    # optional persistent analysis cache shared between sessions
+    store = None
+    if (config["cache"] != ""):
+        from analysisstore import AnalysisStore
+        store = AnalysisStore(config["cache"], maxEntries=config["cache_entries"])
+    session = Session(config, AnalysisCache(config["cache_memory"] * 1024 * 1024, store)) # analysis of board positions and settings
+    if store != None:
+        # filling the memory is not needed for the first prompt
+        threading.Thread(target=session.cache.preload, daemon=True).start()
+    session.server = server
+    # optional opening book, its moves are used instead of searching as long as the position is in the book
+    if (config["book"] != ""):
+        from book import OpeningBook
+        session.book = OpeningBook(config["book"])
+    prefetcher = Prefetcher(background, session.cache) # analyzes the current position and its candidate moves while the user is thinking
+    if config["profile"]:
+        PROFILER.enable()
     while (not finished):
         print("="*60)
-        fen = stockfish.get_fen_position()
-        if (len(history) == 0 or history[-1] != fen):
+        if (lastKey != board.key):
             # new board position
-            history.append(fen)
-        print("FEN: " + getFen(stockfish))
-        finished = menu(stockfish, history, cache)
+            lastKey = board.key
+            if (game.repetitions() >= 3):
+                print("Threefold repetition.")
+            elif (game.repetitions() == 2):
+                print("Position repeated.")
+        print("FEN: " + getFen(board))
+        finished = menu(stockfish, background, prefetcher, game, session)
+    prefetcher.cancel()
+    background.close()
+    if session.pool != None:
+        session.pool.close()
 
-def menu(stockfish: Stockfish, history: list, cache: dict) -> bool:
+def menu(stockfish: UciEngine, background: BackgroundEngine, prefetcher: Prefetcher, game: Game, session: Session) -> bool:
+    board = game.board
+    PROFILER.action = "menu"    # drawing the menu and starting the prefetch
     menu = ["1. Get best Moves",
             "2. Move help",
             "3. Set board (FEN)",
             "4. Flip sides",
             "5. Revert",
             "6. Evaluate Board",
-            f"7. Switch POV (Current: {'b' if cache['pov'] else 'w'})",
-            f"8. Evaluate Moves (Current: {'Y' if cache['eval_moves'] else 'N'})",
-            "9. Exit"
+            f"7. Switch POV (Current: {'b' if session.pov else 'w'})",
+            f"8. Evaluate Moves (Current: {'Y' if session.evalMoves else 'N'})",
+            "9. Exit",
+            "10. Annotate game",
+            "11. Rate moves",
+            "12. Explore variations"
             ]
-    board = getBoardStr(stockfish=stockfish, flip=cache["pov"]).split("\n")
+    boardLines = getBoardStr(board, flip=session.pov).split("\n")
     # find the longest line in the menu
     menuMaxLineLen = 0
     for menuLine in menu:
@@ -76,7 +196,7 @@ def menu(stockfish: Stockfish, history: list, cache: dict) -> bool:
         menu[i] = menu[i].ljust(menuMaxLineLen)
     # matchup menu with board string and print them side by side.
     sep = (" " * 4) + "|" + (" " * 4)
-    for i in range (0, len(menu) if len(menu) > len(board) else len(board)):
+    for i in range (0, len(menu) if len(menu) > len(boardLines) else len(boardLines)):
         # loop over all the lines. Need to check every time if the index exists
         # print menu part
         if (i < len(menu)):
@@ -84,27 +204,45 @@ def menu(stockfish: Stockfish, history: list, cache: dict) -> bool:
         else:
             print(" " * menuMaxLineLen, end="")
         # print board part
-        if (i < len(board)):
+        if (i < len(boardLines)):
             print(sep, end="")
-            print(board[i])
+            print(boardLines[i])
         else:
             print() # print new line
     
+    # start analyzing while the user is thinking, unless the book knows the position
+    if session.config["prefetch"] and len(getBookMoves(board, session.book)) == 0:
+        prefetcher.start(board, stockfish.get_parameters()["MultiPV"], int(stockfish.depth), getAnalysisParams(stockfish))
+    
     # user input handling
     selection = input("Selection or Move ?> ")
+    PROFILER.action = MENU_ACTIONS.get(selection, "move")
+    actionStart = time.perf_counter()
     if (selection == "1"):
-        # bestMove = stockfish.get_best_move_time(60000)
-        # print(f"Best: {bestMove} - {describeMove(stockfish, bestMove)}")
-        moves = getBestMoves(stockfish, cache)
-        for move in moves:
-            score = move["Centipawn"]
-            mate = move["Mate"]
-            move = move["Move"]
-            moveDesc = describeMove(stockfish, move, color=False).ljust(50)
-            if mate != None:
-                print(f"{move}: {moveDesc} - Mate in {mate}")
+        prefetcher.cancel() # the search uses the same engine
+        bookMoves = getBookMoves(board, session.book)
+        search = True
+        if len(bookMoves) > 0:
+            total = sum(move["Weight"] for move in bookMoves)
+            for move in bookMoves:
+                moveDesc = describeMove(board, move["Move"], color=False).ljust(50)
+                print(f"{move['Move']}: {moveDesc} - Book move ({move['Weight'] * 100 / total:.0f}%)")
+            print("Search with the engine anyway?")
+            search = ask(False)
+        if search:
+            if session.server != None:
+                moves = getBestMoves(stockfish, board, session, useBook=False)
             else:
-                print(f"{move}: {moveDesc} - White advantage {score}")
+                moves = streamBestMoves(stockfish, background, board, session.cache, ENGINE_BUDGETS["best moves"])
+            for move in moves:
+                score = move["Centipawn"]
+                mate = move["Mate"]
+                move = move["Move"]
+                moveDesc = describeMove(board, move, color=False).ljust(50)
+                if mate != None:
+                    print(f"{move}: {moveDesc} - Mate in {mate}")
+                else:
+                    print(f"{move}: {moveDesc} - White advantage {score}")
     elif (selection == "2"):
         print("Move either A to B (a1b3) or shorthand")
         print("Shorthand: [Piece][file][rank]['x']target | 'oo' | 'ooo'\n"
@@ -118,82 +256,307 @@ def menu(stockfish: Stockfish, history: list, cache: dict) -> bool:
               "Or use the full length moves src dst"
               )
     elif (selection == "3"):
-        setPosition(stockfish, cache=cache)
+        setPosition(game, session)
     elif (selection == "4"):
-        fen = stockfish.get_fen_position()
-        white_turn = (fen.find(" w ") > 0)
-        if (white_turn):
+        fen = board.fen
+        if (board.whiteToMove):
             fen = fen.replace(" w ", " b ")
         else:
             fen = fen.replace(" b ", " w ")
-        stockfish.set_fen_position(fen, False)
+        game.setRoot(fen)
     elif (selection == "5"):
-        for i in range(0, len(history)):
-            ni = i - len(history)
-            print(f"{i} | {ni}: " + colorFen(history[i]))
+        # the positions of all segments, setting the board or flipping sides starts a new one
+        positions = game.history()
+        for i in range(0, len(positions)):
+            ni = i - len(positions)
+            segment, ply, move, fen = positions[i]
+            move = move if move != None else "root"
+            current = "*" if segment == game.segment and ply == game.ply else " "
+            print(f"{current}{i} | {ni}: {move.ljust(5)} " + colorFen(fen))
         try:
             idx = int(input("ID ?> "))
-            if (idx >= (-1 * len(history)) and idx < len(history)):
-                stockfish.set_fen_position(history[idx], False)
+            if (idx >= (-1 * len(positions)) and idx < len(positions)):
+                segment, ply, move, fen = positions[idx]
+                game.goto(ply, segment)
             else:
                 print("Invalid index.")
         except ValueError:
             print("Not a number.")
     elif (selection == "6"):
-        print(getBoardStr(stockfish=stockfish, flip=cache["pov"], cache=cache))
+        PROFILER.timed("prefetch wait", prefetcher.wait, board.fen)
+        printEvaluatedBoard(stockfish, board, session)
     elif (selection == "7"):
-        flipPov(cache)
+        flipPov(session)
     elif (selection == "8"):
-        flipEvalMoves(cache)
+        flipEvalMoves(session)
     elif (selection == "9"):
         return True
+    elif (selection == "10"):
+        prefetcher.cancel()
+        annotate(stockfish, game, session)
+    elif (selection == "11"):
+        PROFILER.timed("prefetch wait", prefetcher.wait, board.fen)
+        rateCandidates(stockfish, board, session)
+    elif (selection == "12"):
+        explore(stockfish, prefetcher, game, session)
+    elif (selection == "0"):
+        # hidden, not in the menu
+        profilingMenu(stockfish, session)
     else:
         move = selection
-        evaluateMove(stockfish, move, cache)
+        evaluateMove(stockfish, prefetcher, game, move, session)
+    if PROFILER.enabled:
+        # includes the time spent in prompts of the action
+        PROFILER.record("(action total)", time.perf_counter() - actionStart)
     return False
 
-def flipPov(cache: dict):
-    cache["pov"] = not cache["pov"]
+# Engine pool for analyzing many positions at once, started on first use.
+# The processes setting is the number of engine processes, half the logical processors by default.
+def getPool(session: Session):
+    if session.server != None:
+        return session.server
+    if session.pool == None:
+        from enginepool import EnginePool
+        config = session.config
+        processes = config["processes"]
+        if processes <= 0:
+            processes = max(1, (os.cpu_count() or 2) // 2)
+        session.pool = EnginePool(config["engine"], processes=processes, threads=1, hash=256, depth=config["depth"], parameters=config["parameters"])
+        PROFILER.register(session.pool, POOL_METHODS, "pool ")
+    return session.pool
+
+def annotate(stockfish: UciEngine, game: Game, session: Session):
+    if len(game.moves) == 0:
+        print("No moves to annotate.")
+        return
+    start = time.perf_counter()
+    def progress(done: int, total: int):
+        if total == 0:
+            # every position is in the cache already
+            return
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed > 0 else 0
+        print(f"\rAnalyzing positions: {done}/{total} ({rate:.1f} positions/sec)", end="", flush=True)
+    from annotate import annotateGame
+    annotations = annotateGame(stockfish, getPool(session), game, session.cache, progress=progress)
+    print()
+    for annotation in annotations:
+        number = (annotation["Ply"] + 1) // 2
+        moveStr = f"{number}. " if annotation["White"] else f"{number}... "
+        moveStr = (moveStr + annotation["Move"]).ljust(12)
+        evalStr = formatEval(annotation["After"]).ljust(10)
+        note = annotation["Class"] if annotation["Class"] != None else ""
+        if annotation["Class"] != None and annotation["Class"] != "best":
+            note = f"{note}, best was {annotation['Best']}"
+        current = "*" if annotation["Ply"] == game.ply else " "
+        print(f"{current}{moveStr} {evalStr} {annotation['Rating']:>6}  {note}")
+
+# Rates several moves of the position at once, all legal moves if none are given. See getMoveRatings.
+def rateCandidates(stockfish: UciEngine, board: Board, session: Session):
+    moves = []
+    typed = input("Moves (empty for all) ?> ").split()
+    for move in typed:
+        move = resolveMove(board, move)
+        if move in legalMoves(board):
+            moves.append(move)
+        else:
+            print(f"Error: {move}")
+    if len(typed) == 0:
+        moves = legalMoves(board)
+    elif len(moves) == 0:
+        # rating all moves instead would start a search of every legal move
+        print("No valid moves to rate.")
+        return
+    ratings = getMoveRatings(stockfish, board, session, moves)
+    for rated in sorted(ratings.values(), key=lambda rated: -rated["Rating"]):
+        note = rated["Class"] if rated["Class"] != None else ""
+        print(f"{describeMove(board, rated['Move'], color=False).ljust(50)} {formatEval(rated['After']).ljust(10)} {rated['Rating']:>6}  {note}")
 
-def flipEvalMoves(cache: dict):
-    cache["eval_moves"] = not cache["eval_moves"]
+# The analysis tree of the game, with the moves of the game added to it.
+# A new tree is started when the game has another root position.
+def getTree(game: Game, session: Session) -> AnalysisTree:
+    if session.tree == None or session.tree.rootFen != game.rootFen:
+        session.tree = AnalysisTree(game.rootFen)
+    session.tree.addLine(game.moves)
+    return session.tree
+
+# Moving through the analysis tree of the game. The viewed position is the current position of the game,
+# moves that are played here are added to the tree as variations. The engine deepens the analysis of the viewed position
+# and the positions after its moves in the background while the user looks at them.
+# When leaving, the moves of the game after the position are its main continuation in the tree.
+def explore(stockfish: UciEngine, prefetcher: Prefetcher, game: Game, session: Session):
+    tree = getTree(game, session)
+    print("Number to follow a variation, a move to add one, b(ack), r(oot), p(romote) N, d(elete) N,\n"
+          "c(omment), s(ave) or l(oad) PGN, q(uit)")
+    while True:
+        board = game.board
+        node = tree.node(board)
+        moves = list(node.children)
+        if session.config["prefetch"]:
+            depth = int(stockfish.depth)
+            prefetcher.deepen(board, moves, stockfish.get_parameters()["MultiPV"], depth, getAnalysisParams(stockfish), depth + EXPLORE_DEPTH)
+        print("="*60)
+        print(getBoardStr(board, flip=session.pov))
+        # the last moves that led here, the line may be long
+        path = [moveToSan(before, move) for before, move in game.lastMoves(EXPLORE_PATH_LENGTH)]
+        print(f"Line: {'... ' if game.ply > EXPLORE_PATH_LENGTH else ''}{' '.join(path)}")
+        print(f"Position {game.ply} of the line, {len(tree)} positions in the tree")
+        print(f"Evaluation: {getTreeEvalStr(tree, board, session)}")
+        if node.comment != "":
+            print(f"Comment: {node.comment}")
+        for i, move in enumerate(moves):
+            after = boardAfter(board, move)
+            # the position is reached by other moves as well
+            note = "transposition" if node.children[move].parents > 1 else ""
+            print(f"{i + 1}. {moveToSan(board, move).ljust(8)} {getTreeEvalStr(tree, after, session).ljust(24)} {note}")
+        choice = input("Explore ?> ").strip()
+        command, _, argument = choice.partition(" ")
+        if choice == "q" or choice == "":
+            break
+        elif choice.isdigit():
+            idx = int(choice) - 1
+            if idx >= 0 and idx < len(moves):
+                game.push(moves[idx])
+            else:
+                print("Invalid index.")
+        elif choice == "b":
+            if game.ply > 0:
+                game.goto(game.ply - 1)
+        elif choice == "r":
+            game.goto(0)
+        elif command in ["p", "d"]:
+            if not argument.isdigit() or int(argument) < 1 or int(argument) > len(moves):
+                print("Invalid index.")
+            elif command == "p":
+                tree.promote(board, moves[int(argument) - 1])
+            else:
+                tree.remove(board, moves[int(argument) - 1])
+        elif choice == "c":
+            node.comment = input("Comment ?> ").strip()
+        elif choice == "s":
+            path = input("File ?> ")
+            if path != "":
+                try:
+                    with open(path, "w") as file:
+                        file.write(tree.toPgn())
+                except OSError as ex:
+                    print(f"Error: {ex}")
+        elif choice == "l":
+            path = input("File ?> ")
+            if path == "":
+                continue
+            try:
+                with open(path, "r") as file:
+                    tree = AnalysisTree.fromPgn(file)
+            except (OSError, ValueError) as ex:
+                print(f"Error: {ex}")
+                continue
+            session.tree = tree
+            game.setRoot(tree.rootFen, newGame=True)
+        else:
+            move = resolveMove(board, choice)
+            if move in legalMoves(board):
+                tree.addMove(board, move)
+                game.push(move)
+            else:
+                print(f"Error: {move}")
+    # the game continues with the main line of the tree
+    ply = game.ply
+    for move in tree.mainLine(game.board):
+        game.push(move)
+    game.goto(ply)
+
+# evaluation of a position of the analysis tree with its depth, without searching
+def getTreeEvalStr(tree: AnalysisTree, board: Board, session: Session) -> str:
+    analysis = tree.analysis(board, session.cache)
+    if analysis == None:
+        return "not analyzed"
+    return f"{formatEval(analysisEval(analysis, board))} (depth {analysis['depth']})"
+
+# evaluation (see analysisEval) as a short string, like formatScore
+def formatEval(evaluation: dict) -> str:
+    if evaluation["type"] == "mate":
+        return f"M{evaluation['value']}"
+    return f"{evaluation['value'] / 100:+.2f}"
+
+def profilingMenu(stockfish: UciEngine, session: Session):
+    print(f"Profiling is {'on' if PROFILER.enabled else 'off'}.")
+    print("1. Toggle profiling\n2. Show\n3. Export as JSON\n4. Reset")
+    choice = input("?> ")
+    if (choice == "1"):
+        if PROFILER.enabled:
+            PROFILER.disable()
+        else:
+            PROFILER.enable()
+    elif (choice == "2"):
+        print(PROFILER.report())
+        stats = session.cache.stats()
+        print(f"Analysis cache: {stats['entries']} positions, {stats['bytes'] / 1024:.0f} of {stats['maxBytes'] / 1024:.0f} KB, "
+            + f"{stats['hitRate'] * 100:.0f}% hits, {stats['evictions']} evicted")
+    elif (choice == "3"):
+        path = input("File ?> ")
+        if (path != ""):
+            try:
+                PROFILER.export(path)
+            except OSError as ex:
+                print(f"Error: {ex}")
+    elif (choice == "4"):
+        PROFILER.reset()
+
+def flipPov(session: Session):
+    session.pov = not session.pov
+
+def flipEvalMoves(session: Session):
+    session.evalMoves = not session.evalMoves
 
 # Shows move preview if valid, otherwise reports error
-def evaluateMove(stockfish: Stockfish, move: str, cache: dict):
-    move = resolveMove(stockfish, move)
-    if (stockfish.is_move_correct(move)):
-        desc = describeMove(stockfish, move) # describe move for later (because we update the board)
+def evaluateMove(stockfish: UciEngine, prefetcher: Prefetcher, game: Game, move: str, session: Session):
+    board = game.board
+    move = resolveMove(board, move)
+    if (move in legalMoves(board)):
+        desc = describeMove(board, move) # describe move for later (because we update the board)
         highlight = [move[0:2], move[2:4]]
-        fen = stockfish.get_fen_position() # backup board state
-        if cache["eval_moves"]:
-            ntm = getNTM(stockfish)
-            # calculate the difference between the advantages before and after the move
-            eval_before = getEval(stockfish, cache)
-            stockfish.make_moves_from_current_position([move])
-            eval_after = getEval(stockfish, cache)
-            # generate a rating for the move
-            rating = eval_after["value"] - eval_before["value"]
-            if (ntm == Player.BLACK):
-                # ntm is from before the move so we get the rating
-                # for the player who makes the move
-                rating = rating * -1
-            print(getBoardStr(stockfish, flip=cache["pov"], highlight=highlight, cache=cache))
-            print(f"Before: {eval_before}\n"
-                  f" After: {eval_after}\n"
-                  f"Move Rating for {ntm}: {rating}")
+        if session.evalMoves:
+            ntm = getNTM(board)
+            budget = ENGINE_BUDGETS["preview"]
+            timeout = budget.movetime / 1000 if budget.movetime > 0 else None
+            # the engine needs a while unless the analysis of the position has the move, show the estimate until it is done
+            estimated = not isRated(stockfish, board, session, [move], budget) and loadStaticEval() != None
+            if estimated:
+                after = boardAfter(board, move)
+                estimates = loadStaticEval().staticEvals([board, after])
+                rating = moveRating({"type": "cp", "value": estimates[0]}, {"type": "cp", "value": estimates[1]}, ntm == Player.WHITE)
+                print(getBoardStr(after, flip=session.pov, highlight=highlight, session=session, estimate=True))
+                print(f"Estimated move rating for {ntm}: {rating}", flush=True)
+            # compare the move with the best move of the position in a single search
+            # use the result of the background analysis if it is working on the position
+            PROFILER.timed("prefetch wait", prefetcher.wait, board.fen, timeout)
+            rated = getMoveRatings(stockfish, board, session, [move], budget).get(move)
+            dropped = game.push(move)
+            if not estimated:
+                print(getBoardStr(board, flip=session.pov, highlight=highlight))
+            if rated == None:
+                # the search stopped before the engine had a line with the move, only the evaluation after it is known
+                print(getEvalStr(stockfish, board, session, budget), end="")
+            else:
+                # ratings are for the player who makes the move
+                print(f"Before: {rated['Before']}\n"
+                      f" After: {rated['After']}\n"
+                      f"Move Rating for {ntm}: {rated['Rating']}" + (f" ({rated['Class']})" if rated["Class"] != None else ""))
         else:
-            stockfish.make_moves_from_current_position([move])
-            print(getBoardStr(stockfish, flip=cache["pov"], highlight=highlight))
+            dropped = game.push(move)
+            print(getBoardStr(board, flip=session.pov, highlight=highlight))
         print(desc)
         print("Play move?")
         choice = ask()
         if not choice:
-            # reset the board to the previous state but don't clear cache
-            stockfish.set_fen_position(fen, False)
+            # take the move back, keeping the moves that followed in the game
+            game.pop(dropped)
     else:
         print(f"Error: {move}")
 
-def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
+# Warnings about the move (like a capture that was not indicated) are added to warnings if it is given, printed otherwise.
+def resolveMove(board: Board, move: str, color: bool = True, warnings: list[str] = None) -> str:
     # turn shorthand notation into valid moves for stockfish
     # "e4" = pawn to e4
     # "xe4" = pawn captures e4
@@ -207,12 +570,13 @@ def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
     # "d2d1q" = pawn from d2 to d1 turns into a queen
     # "d2e1q" = pawn from d2 captures e1 and turns into a queen
     move = move.replace(" ", "").replace("-", "")
-    ntm = getNTM(stockfish)
+    ntm = getNTM(board)
     if len(move) == 0:
         return "Empty move"
+    legal = legalMoves(board)
     if regex.match("^(?:[a-h][1-8]){2}[qrnb]$", move.lower()):
         move = move.lower()
-        if stockfish.is_move_correct(move):
+        if move in legal:
             return move
         else:
             return "Invalid move."
@@ -221,25 +585,25 @@ def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
         if (move.lower() == 'oo'):
             # castle king side
             # need to check if it's actually a king there as another piece could also have a valid move.
-            if ntm == Player.WHITE and stockfish.get_what_is_on_square("e1") == Stockfish.Piece.WHITE_KING:
+            if ntm == Player.WHITE and board.pieceAt("e1") == 'K':
                 move = "e1g1"
-            elif ntm == Player.BLACK and stockfish.get_what_is_on_square("e8") == Stockfish.Piece.BLACK_KING:
+            elif ntm == Player.BLACK and board.pieceAt("e8") == 'k':
                 move = "e8g8"
             else:
                 move = "Invalid"
-            if stockfish.is_move_correct(move):
+            if move in legal:
                 return move
             else:
                 return "Can not castle king side."
         elif (move.lower() == 'ooo'):
             # castle queen side
-            if ntm == Player.WHITE and stockfish.get_what_is_on_square("e1") == Stockfish.Piece.WHITE_KING:
+            if ntm == Player.WHITE and board.pieceAt("e1") == 'K':
                 move = "e1c1"
-            elif ntm == Player.BLACK and stockfish.get_what_is_on_square("e8") == Stockfish.Piece.BLACK_KING:
+            elif ntm == Player.BLACK and board.pieceAt("e8") == 'k':
                 move = "e8c8"
             else:
                 move = "Invalid"
-            if stockfish.is_move_correct(move):
+            if move in legal:
                 return move
             else:
                 return "Can not castle queen side."
@@ -255,20 +619,22 @@ def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
         
         # resolve piece class
         if len(groups[0]) == 0:
-            piece = Stockfish.Piece.WHITE_PAWN if ntm == Player.WHITE else Stockfish.Piece.BLACK_PAWN
+            piece = 'P'
         else:
             if groups[0].lower() == 'r':
-                piece = Stockfish.Piece.WHITE_ROOK if ntm == Player.WHITE else Stockfish.Piece.BLACK_ROOK
+                piece = 'R'
             elif groups[0] == 'B': # bxc6 is a pawn from b, not a bishop.
-                piece = Stockfish.Piece.WHITE_BISHOP if ntm == Player.WHITE else Stockfish.Piece.BLACK_BISHOP
+                piece = 'B'
             elif groups[0].lower() == 'n':
-                piece = Stockfish.Piece.WHITE_KNIGHT if ntm == Player.WHITE else Stockfish.Piece.BLACK_KNIGHT
+                piece = 'N'
             elif groups[0].lower() == 'k':
-                piece = Stockfish.Piece.WHITE_KING if ntm == Player.WHITE else Stockfish.Piece.BLACK_KING
+                piece = 'K'
             elif groups[0].lower() == 'q':
-                piece = Stockfish.Piece.WHITE_QUEEN if ntm == Player.WHITE else Stockfish.Piece.BLACK_QUEEN
+                piece = 'Q'
             else:
                 return f"Can not determine piece to move ('{groups[0]}')."
+        if ntm == Player.BLACK:
+            piece = piece.lower()
         
         # resolve source file
         src_file = None
@@ -284,7 +650,7 @@ def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
         isCapture = groups[3] == 'x'
         
         # pawn conversion
-        turnsInto = groups[5].lstrip('=')
+        turnsInto = groups[5].lstrip('=').lower()
         
         # resolve dst
         dst = groups[4]
@@ -296,22 +662,21 @@ def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
             src = f"{src_file}{src_rank}"
         else:
             possibleSrc = []
-            # run through all the squares and check all the pieces if they can move to the square
-            for file in range(ord('a'), ord('h') + 1):
-                file = chr(file)
-                if src_file != None and src_file != file:
+            # run through all the legal moves and check which pieces of the right type can move to the square
+            for legalMove in legal:
+                if legalMove[2:] != f"{dst}{turnsInto}":
+                    continue
+                src = legalMove[0:2]
+                if src_file != None and src_file != src[0]:
                     continue
-                for rank in range(1,8+1):
-                    rank = str(rank)
-                    if src_rank != None and src_rank != rank:
-                        continue
-                    src = f"{file}{rank}"
-                    if piece == stockfish.get_what_is_on_square(src) and stockfish.is_move_correct(f"{src}{dst}{turnsInto}"):
-                        possibleSrc.append(src)
+                if src_rank != None and src_rank != src[1]:
+                    continue
+                if piece == board.pieceAt(src):
+                    possibleSrc.append(src)
             if len(possibleSrc) == 1:
                 src = possibleSrc[0]
             elif len(possibleSrc) == 0:
-                pieceDesc = str(piece).replace("Piece.", "")
+                pieceDesc = PIECE_NAMES[piece]
                 if color:
                     pieceDesc = colored(pieceDesc, color=ColorConst.WHITE_PIECE if ntm == Player.WHITE else ColorConst.BLACK_PIECE, on_color=ColorConst.FEN_BG, attrs=['bold'])
                 if src_rank != None and src_file == None:
@@ -322,34 +687,40 @@ def resolveMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
                 # no need to check for neither since no additional description is needed
                 return f"No {pieceDesc} can go to {dst}"
             else:
-                pieceDesc = str(piece).replace("Piece.", "")
+                pieceDesc = PIECE_NAMES[piece]
                 if color:
                     pieceDesc = colored(pieceDesc, color=ColorConst.WHITE_PIECE if ntm == Player.WHITE else ColorConst.BLACK_PIECE, on_color=ColorConst.FEN_BG, attrs=['bold'])                
                 return f"Could not determine which {pieceDesc} you want to move to {dst}"
         # build stockfish move
         move = f"{src}{dst}{turnsInto}"
         # check if resolved move is indeed a capture
-        if stockfish.is_move_correct(move):
-            if ((isCapture and turnsInto != '' and stockfish.get_what_is_on_square(dst) == None) or (isCapture and turnsInto == '' and stockfish.will_move_be_a_capture(move) == Stockfish.Capture.NO_CAPTURE)):
+        if move in legal:
+            cap = getCapture(board, move)
+            if isCapture and cap == Capture.NO_CAPTURE:
                 return "Move is no Capture"
-            elif (not isCapture and turnsInto != '' and stockfish.get_what_is_on_square(dst) != None) or (not isCapture and turnsInto == '' and stockfish.will_move_be_a_capture(move) != Stockfish.Capture.NO_CAPTURE):
-                print("Warning: Move results in a capture, but capture was not indicated by the move string.")
+            elif not isCapture and cap != Capture.NO_CAPTURE:
+                warning = "Move results in a capture, but capture was not indicated by the move string."
+                if warnings != None:
+                    warnings.append(warning)
+                else:
+                    print(f"Warning: {warning}")
             return move
     return "Invalid Move"
 
-def describeMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
-    if (stockfish.is_move_correct(move)):
+def describeMove(board: Board, move: str, color: bool = True) -> str:
+    if (move in legalMoves(board)):
         # move stuff
         src = move[0:2]
         dst = move[2:4]
         turnsInto = move[4:5].lower()
         cap = None
-        pieceMoving = str(stockfish.get_what_is_on_square(src)).replace("Piece.", "")        
+        pieceMoving = PIECE_NAMES[board.pieceAt(src)]
         attrs = ['bold']
         fg, bg = None, None
         tgt_fg, tgt_bg = ColorConst.FEN_BG, ColorConst.FEN_BG
+        whiteToMove = board.whiteToMove
         if color:
-            if getNTM(stockfish) == Player.WHITE:
+            if whiteToMove:
                 fg = ColorConst.WHITE_PIECE
                 tgt_fg = ColorConst.BLACK_PIECE
             else:
@@ -360,44 +731,34 @@ def describeMove(stockfish: Stockfish, move: str, color: bool = True) -> str:
         ret = f"{pieceMoving} from {src} to {dst}"
         
         # if capture
-        cap = stockfish.will_move_be_a_capture(move)
+        cap = getCapture(board, move)
         
-        if cap == Stockfish.Capture.DIRECT_CAPTURE:
-            tgt = stockfish.get_what_is_on_square(dst)
-            tgt = str(tgt).replace("Piece.", "")
+        if cap == Capture.DIRECT_CAPTURE:
+            tgt = PIECE_NAMES[board.pieceAt(dst)]
             if (color):
                 tgt = colored(tgt, color=tgt_fg, on_color=tgt_bg, attrs=attrs)
             ret = ret + f" capturing {tgt}"
-        elif cap == Stockfish.Capture.EN_PASSANT:
-            tgt = Stockfish.Piece.WHITE_PAWN if getNTM(stockfish) == Player.BLACK else Stockfish.Piece.BLACK_PAWN
-            tgt = str(tgt).replace("Piece.", "")
+        elif cap == Capture.EN_PASSANT:
+            tgt = PIECE_NAMES['p' if whiteToMove else 'P']
             if (color):
                 tgt = colored(tgt, color=tgt_fg, on_color=tgt_bg, attrs=attrs)            
             ret = ret + f" capturing {tgt} en passant"
 
         # turning pawn into something else.
         if turnsInto != '':
-            if turnsInto == 'q':
-                turnsInto = Stockfish.Piece.WHITE_QUEEN if getNTM(stockfish) == Player.WHITE else Stockfish.Piece.BLACK_QUEEN
-            elif turnsInto == 'n':
-                turnsInto = Stockfish.Piece.WHITE_KNIGHT if getNTM(stockfish)== Player.WHITE else Stockfish.Piece.BLACK_KNIGHT
-            elif turnsInto == 'b':
-                turnsInto = Stockfish.Piece.WHITE_BISHOP if getNTM(stockfish)== Player.WHITE else Stockfish.Piece.BLACK_BISHOP
-            elif turnsInto == 'r':
-                turnsInto = Stockfish.Piece.WHITE_ROOK if getNTM(stockfish)== Player.WHITE else Stockfish.Piece.BLACK_ROOK
-            # remove 'Piece.'
-            turnsInto = str(turnsInto).replace('Piece.', '')
+            turnsInto = PIECE_NAMES[turnsInto.upper() if whiteToMove else turnsInto]
             # color
             if color:
-                turnsInto = colored(turnsInto, color=ColorConst.WHITE_PIECE if getNTM(stockfish) == Player.WHITE else ColorConst.BLACK_PIECE, on_color=ColorConst.FEN_BG, attrs=['bold'])
-            if cap != None:
+                turnsInto = colored(turnsInto, color=ColorConst.WHITE_PIECE if whiteToMove else ColorConst.BLACK_PIECE, on_color=ColorConst.FEN_BG, attrs=['bold'])
+            if cap != Capture.NO_CAPTURE:
                 ret = ret + " and"
             ret = ret + f" turning into {turnsInto}"
         return ret
     else:
         return "Invalid Move"
 
-def setPosition(stockfish: Stockfish, cache: dict):
+def setPosition(game: Game, session: Session):
+    board = game.board
     print("https://en.wikipedia.org/wiki/Forsyth%E2%80%93Edwards_Notation")
     print("Small letters are black. Possible pieces: R, N, B, Q, K, P")
     print("Numbers denote empty spaces. Rows are delimited by '/'")
@@ -413,176 +774,284 @@ def setPosition(stockfish: Stockfish, cache: dict):
         if (len(fen) == 0):
             correct = True # abort without changing the board.
         else:
-            old_fen = stockfish.get_fen_position()
             try:
-                fenPass(fen)
-                stockfish.set_fen_position(fen, False)
-                print(getBoardStr(stockfish, flip=cache["pov"]))
+                preview = parseFen(fen)
+                print(getBoardStr(preview, flip=session.pov))
                 print("Correct?")
                 choice = ask()
                 if choice:
-                    stockfish.set_fen_position(fen, True)
+                    game.setRoot(fen, newGame=True)
                     correct = True
                 else:
-                    stockfish.set_fen_position(old_fen, False)
                     correct = False
             except ValueError as ex:
                 print("Invalid position.")
                 print(ex)
                 correct = False
 
-def getBoardStr(stockfish: Stockfish, flip: bool = False, highlight: list[str] = [], cache = None, color = True) -> str:
+# Rendered pieces on squares and FEN characters, built on first use so that drawing a board
+# doesn't call colored() for every square. (piece, white square, highlighted) -> cell with the ANSI sequences.
+SQUARE_CELLS = {}
+FEN_CHARS = {}
+# Finished boards without the evaluation part. (fen, flip, highlight, color) -> board string
+BOARD_CACHE = {}
+BOARD_CACHE_SIZE = 256
+
+def buildRenderTables():
+    attrs = ['bold']
+    for piece in [None, 'R', 'N', 'B', 'Q', 'K', 'P', 'r', 'n', 'b', 'q', 'k', 'p']:
+        fieldStr = "   " if piece == None else f" {piece} "
+        fg = None if piece == None else (ColorConst.BLACK_PIECE if piece.islower() else ColorConst.WHITE_PIECE)
+        for whiteSquare in [True, False]:
+            bg = ColorConst.BOARD_WHITE if whiteSquare else ColorConst.BOARD_BLACK
+            SQUARE_CELLS[(piece, whiteSquare, False)] = colored(fieldStr, color=fg, on_color=bg, attrs=attrs)
+            SQUARE_CELLS[(piece, whiteSquare, True)] = colored(fieldStr, color=fg, on_color=bg, attrs=attrs + ['reverse'])
+    for c in "RNBQKPw":
+        FEN_CHARS[c] = colored(c, color=ColorConst.WHITE_PIECE, on_color=ColorConst.FEN_BG, attrs=attrs)
+    for c in "rnbqkp":
+        FEN_CHARS[c] = colored(c, color=ColorConst.BLACK_PIECE, on_color=ColorConst.FEN_BG, attrs=attrs)
+    for c in "12345678/- abcdefghKQ0123456789":
+        if not c in FEN_CHARS:
+            FEN_CHARS[c] = colored(c, color=None, on_color=ColorConst.FEN_BG, attrs=attrs)
+
+def getBoardStr(board: Board, flip: bool = False, highlight: list[str] = [], stockfish: UciEngine = None, session: Session = None, color = True, budget: Budget = None, estimate: bool = False) -> str:
+    key = (board.fen, flip, tuple(highlight), color)
+    result = BOARD_CACHE.get(key)
+    if PROFILER.enabled:
+        PROFILER.cacheLookup("board", result != None)
+    if result == None:
+        result = PROFILER.timed("renderBoard", renderBoard, board, flip, highlight, color)
+        if len(BOARD_CACHE) >= BOARD_CACHE_SIZE:
+            # drop the oldest board
+            del BOARD_CACHE[next(iter(BOARD_CACHE))]
+        BOARD_CACHE[key] = result
+    if (not session is None):
+        result = result + (getEstimateStr(board) if estimate else getEvalStr(stockfish, board, session, budget))
+    return result
+
+def getEvalStr(stockfish: UciEngine, board: Board, session: Session, budget: Budget = None) -> str:
+    result = f"Evaluation (Positive is advantage for White):\n{str(getEval(stockfish, board, session, budget))}\n"
+    return result + f"Win/Draw/Loose stats for {getNTM(board)}\n{str(getWDL(stockfish, board, session, budget))}\n"
+
+# The static evaluation (see staticeval.py), labelled so it is not mistaken for the engine's evaluation
+def getEstimateStr(board: Board) -> str:
+    staticeval = loadStaticEval()
+    if staticeval == None:
+        return ""
+    return f"Estimate (static, no search, the engine is still searching):\n{str(staticeval.staticEval(board))}\n"
+
+# Prints the board with the engine's evaluation. If the engine has to search first,
+# the board is printed right away with the static estimate and the evaluation follows once the search is done.
+def printEvaluatedBoard(stockfish: UciEngine, board: Board, session: Session, highlight: list[str] = [], budget: Budget = None):
+    if isEvaluated(stockfish, board, session, budget) or loadStaticEval() == None:
+        print(getBoardStr(board, flip=session.pov, highlight=highlight, stockfish=stockfish, session=session, budget=budget))
+        return
+    print(getBoardStr(board, flip=session.pov, highlight=highlight, session=session, estimate=True), flush=True)
+    print(getEvalStr(stockfish, board, session, budget))
+
+def renderBoard(board: Board, flip: bool, highlight: list[str], color: bool) -> str:
+    if color and len(SQUARE_CELLS) == 0:
+        buildRenderTables()
     # unfliped A8 is top left
     range_ranks = range(1, 8 + 1) if flip else range(8, 1 - 1, -1)
-    range_files = range(ord('a'), ord('h') + 1) if not flip else range(ord('h'), ord('a') - 1, -1)
-    white_squre = True # first square is white regardless of orientation
-    lineSep = "  " + (("+---" * 9)[:-3]) # the seperator between the lines on the board.
-    
-    result = " " # spacing for header to line up right
-    # make files header
-    for file in range_files:
-        file = chr(file)
-        result = result + f"   {file}"
-    result = result.rstrip() + "\n"
-    
-    # print actual board
+    range_files = range(0, 8) if not flip else range(7, -1, -1)
+    lineSep = "  " + (("+---" * 9)[:-3]) + "\n" # the seperator between the lines on the board.
+    highlighted = [squareIndex(sqr) for sqr in highlight]
+    # files header and footer, with spacing to line up right
+    filesLine = " " + "".join(f"   {FILES[file]}" for file in range_files) + "\n"
+
+    parts = [filesLine]
     for rank in range_ranks:
-        result = result + lineSep + "\n"
-        result = result + f"{rank} |"
+        parts.append(lineSep)
+        parts.append(f"{rank} |")
         for file in range_files:
-            file = chr(file)
-            sqr = f"{file}{rank}"
-            piece = stockfish.get_what_is_on_square(sqr)
-            fieldStr = "   " if piece == None else f" {piece.value} "
+            idx = (rank - 1) * 8 + file
+            piece = board.squares[idx]
             if color:
-                fg = None
-                bg = ColorConst.BOARD_WHITE if white_squre else ColorConst.BOARD_BLACK
-                attrs = ['bold']
-                if sqr in highlight:
-                    attrs.append('reverse')
-                if piece != None:
-                    if piece.value in ['r', 'n', 'b', 'q', 'k', 'p']:
-                        fg = ColorConst.BLACK_PIECE
-                    else:
-                        fg = ColorConst.WHITE_PIECE
-                fieldStr = colored(fieldStr, color=fg, on_color=bg, attrs=attrs)
-            result = result + f"{fieldStr}|"
-            white_squre = not white_squre
-        result = result + f" {rank}\n"
-        white_squre = not white_squre
-    result = result + lineSep + "\n"
-    
-    # make files footer
-    result = result + " " # spacing for footer to line up right
-    for file in range_files:
-        file = chr(file)
-        result = result + f"   {file}"
-    result = result.rstrip() + "\n"
-    
+                # a1 is a black square
+                parts.append(SQUARE_CELLS[(piece, (idx + rank - 1) % 2 == 1, idx in highlighted)])
+            else:
+                parts.append("   " if piece == None else f" {piece} ")
+            parts.append("|")
+        parts.append(f" {rank}\n")
+    parts.append(lineSep)
+    parts.append(filesLine)
+
     # more description stuffs
-    result = result + getFen(stockfish, color) + "\n"
-    result = result + f"Next to move: {getNTM(stockfish)}\n"
-    if (not cache is None):
-        result = result + f"Evaluation (Positive is advantage for White):\n{str(getEval(stockfish, cache))}\n"
-        result = result + f"Win/Draw/Loose stats for {getNTM(stockfish)}\n{str(getWDL(stockfish, cache))}\n"
-    return result
+    parts.append(getFen(board, color) + "\n")
+    parts.append(f"Next to move: {getNTM(board)}\n")
+    return "".join(parts)
+
+# Returns the analysis of the position with at least the requested number of lines, searched within the budget.
+# A cached search that was at least as deep as the budget's depth and as wide answers the request without searching again.
+# Without a budget the search goes to the depth of the engine. With a time or node limit the result may be shallower,
+# see analysis.deepenAnalysis.
+# New searches always use at least the configured MultiPV, so eval, WDL and best moves all come from the same search.
+def getAnalysis(stockfish: UciEngine, board: Board, session: Session, multipv: int = 1, budget: Budget = None) -> dict:
+    budget = (budget if budget != None else Budget()).withDepth(int(stockfish.depth))
+    if session.server != None:
+        return getServerAnalysis(session.server, board, session.cache, multipv, budget.depth)
+    if PROFILER.enabled:
+        PROFILER.cacheLookup("analysis", analysisCovers(session.cache.get(board), multipv, budget.depth, getAnalysisParams(stockfish)))
+    return deepenAnalysis(stockfish, board, session.cache, multipv, budget)
+
+# whether getAnalysis would answer from the cache without searching
+def isEvaluated(stockfish: UciEngine, board: Board, session: Session, budget: Budget = None) -> bool:
+    budget = (budget if budget != None else Budget()).withDepth(int(stockfish.depth))
+    params = session.server.params if session.server != None else getAnalysisParams(stockfish)
+    return analysisCovers(session.cache.get(board), 1, budget.depth, params)
 
-def getWDL(stockfish: Stockfish, cache: dict) -> list:
-    key = "wdl"
-    fen = stockfish.get_fen_position()
-    if not (fen in cache and key in cache[fen]):
-        if not fen in cache:
-            cache[fen] = {}
-        cache[fen][key] = stockfish.get_wdl_stats() if stockfish.does_current_engine_version_have_wdl_option() else [0,0,0]
-    return cache[fen][key]
-
-def getBestMoves(stockfish: Stockfish, cache: dict, moves: int = 0) -> list[dict]:
-    key = "best_moves"
+# the position after the move, the board is not changed
+def boardAfter(board: Board, move: str) -> Board:
+    after = board.copy()
+    makeMove(after, move)
+    return after
+
+# Ratings of the moves against the best move of the position, see analysis.rateMoves. The board has to be the position of the engine.
+# The analysis server can not restrict a search to some moves, with a server the positions after the moves are evaluated instead.
+def getMoveRatings(stockfish: UciEngine, board: Board, session: Session, moves: list[str], budget: Budget = None) -> dict:
+    budget = (budget if budget != None else Budget()).withDepth(int(stockfish.depth))
+    if session.server == None:
+        return rateMoves(stockfish, board, session.cache, moves, budget)
+    before = getEval(stockfish, board, session, budget)
+    best = getBestMoves(stockfish, board, session, 1, useBook=False)
+    ratings = {}
+    for move in moves:
+        after = getEval(stockfish, boardAfter(board, move), session, budget)
+        rating, moveClass = rateMove(move, best[0]["Move"], before, after, board.whiteToMove)
+        ratings[move] = {
+            "Move": move,
+            "Best": best[0]["Move"],
+            "Before": before,
+            "After": after,
+            "Rating": rating,
+            "Class": moveClass
+        }
+    return ratings
+
+# whether getMoveRatings would rate the moves without searching
+def isRated(stockfish: UciEngine, board: Board, session: Session, moves: list[str], budget: Budget = None) -> bool:
+    budget = (budget if budget != None else Budget()).withDepth(int(stockfish.depth))
+    if session.server != None:
+        return all(isEvaluated(stockfish, position, session, budget) for position in [board] + [boardAfter(board, move) for move in moves])
+    analysis = session.cache.get(board)
+    if not analysisCovers(analysis, stockfish.get_parameters()["MultiPV"], budget.depth, getAnalysisParams(stockfish)):
+        return False
+    known = [line["Move"] for line in analysis["lines"]] + [line["Move"] for line, best in analysis.get("moveLines", [])]
+    return all(move in known for move in moves)
+
+# Like getAnalysis, with the search done by the analysis server. The server searches to the depth, it has no time limits.
+def getServerAnalysis(server, board: Board, cache: AnalysisCache, multipv: int, depth: int) -> dict:
+    analysis = cache.get(board)
+    covered = analysisCovers(analysis, multipv, depth, server.params)
+    if PROFILER.enabled:
+        PROFILER.cacheLookup("analysis", covered)
+    if not covered:
+        analysis = server.analysis(board.fen, multipv, depth)
+        cache.put(board, analysis)
+    return analysis
+
+def formatScore(line: dict) -> str:
+    if line["Mate"] != None:
+        return f"M{line['Mate']}"
+    return f"{line['Centipawn'] / 100:+.2f}"
+
+# Searches for the best moves within the budget and prints the top lines every time the search finishes another depth.
+# Pressing enter stops the search early and keeps the lines of the last finished depth.
+# A shallower cached result is shown right away and only replaced once the search got deeper.
+def streamBestMoves(stockfish: UciEngine, background: BackgroundEngine, board: Board, cache: AnalysisCache, budget: Budget = None) -> list[dict]:
+    multipv = stockfish.get_parameters()["MultiPV"]
+    budget = (budget if budget != None else Budget()).withDepth(int(stockfish.depth))
+    params = getAnalysisParams(stockfish)
+    old = cache.get(board)
+    covered = analysisCovers(old, multipv, budget.depth, params)
+    if PROFILER.enabled:
+        PROFILER.cacheLookup("analysis", covered)
+    if covered:
+        return analysisBestMoves(old, multipv)
+    if analysisCovers(old, multipv, 0, params):
+        print(f"Depth {old['depth']} (cached): " + ", ".join(f"{line['Move']} ({formatScore(line)})" for line in old["lines"][0:multipv]))
+    elif loadStaticEval() != None:
+        estimates = loadStaticEval().staticMoveEvals(board)[0:multipv]
+        if len(estimates) > 0:
+            print("Estimate (static, no search): " + ", ".join(f"{line['Move']} ({line['Centipawn'] / 100:+.2f})" for line in estimates))
+
+    async def search():
+        engine = await background.engine()
+        search = await engine.search(board.fen, board.whiteToMove, multipv, budget.depth, movetime=budget.movetime, nodes=budget.nodes)
+        async for reached, lines in search.updates():
+            print(f"Depth {reached}: " + ", ".join(f"{line['Move']} ({formatScore(line)})" for line in lines))
+        return search
+
+    # Only a terminal can stop the search with enter. It hands out one line per read, so lines typed ahead stay
+    # with the following prompts. Piped input is left alone entirely, the search runs until the end of its budget then.
+    interactive = sys.stdin.isatty()
+    print("Searching... Press enter to stop." if interactive else "Searching...")
+    future = background.run(search())
+    try:
+        while not future.done():
+            if not interactive:
+                concurrent.futures.wait([future], 0.1)
+                continue
+            ready, _, _ = select.select([sys.stdin], [], [], 0.1)
+            if ready:
+                # read past sys.stdin, so its buffer never holds input that belongs to the following prompts
+                os.read(sys.stdin.fileno(), 1024)
+                background.run(background.stop()).result()
+    except KeyboardInterrupt:
+        background.run(background.stop()).result()
+    result = future.result()
+    # keep what was found, even if the search was stopped early, unless the cached result is deeper
+    old = cache.get(board)
+    if result.depth > 0 and (old == None or old["params"] != params or old["multipv"] < multipv or old["depth"] <= result.depth):
+        cache.put(board, {"depth": result.depth, "multipv": multipv, "params": params, "lines": result.lines})
+        return result.lines
+    return analysisBestMoves(old, multipv) if analysisCovers(old, multipv, 0, params) else result.lines
+
+def getWDL(stockfish: UciEngine, board: Board, session: Session, budget: Budget = None) -> list:
+    return analysisWDL(getAnalysis(stockfish, board, session, 1, budget))
+
+# Moves of the opening book for the position as [{"Move", "Weight"}], empty if there is no book or the position is not in it
+def getBookMoves(board: Board, book) -> list[dict]:
+    if book == None:
+        return []
+    moves = book.lookup(board)
+    if PROFILER.enabled:
+        PROFILER.cacheLookup("book", len(moves) > 0)
+    return moves
+
+# The best moves of the book if the position is in it, otherwise the best moves of the engine.
+# Book moves have a weight and no score, useBook=False always asks the engine.
+def getBestMoves(stockfish: UciEngine, board: Board, session: Session, moves: int = 0, useBook: bool = True) -> list[dict]:
     if moves <= 0:
         moves = stockfish.get_parameters()["MultiPV"]
-    fen = stockfish.get_fen_position()
-    if not (fen in cache and key in cache[fen]):
-        if not fen in cache:
-            cache[fen] = {}
-        cache[fen][key] = stockfish.get_top_moves(moves)
-    return cache[fen][key]
-
-def getEval(stockfish: Stockfish, cache: dict) -> dict:
-    key = "eval"
-    fen = stockfish.get_fen_position()
-    if not (fen in cache and key in cache[fen]):
-        if not fen in cache:
-            cache[fen] = {}
-        cache[fen][key] = stockfish.get_evaluation()
-    return cache[fen][key]
-
-def getNTM(stockfish: Stockfish) -> str:
-    return Player.WHITE if (stockfish.get_fen_position().find(" w ") > 0) else Player.BLACK
-
-def getFen(stockfish: Stockfish, color: bool = True) -> str:
-    fen = stockfish.get_fen_position()
+    if useBook:
+        bookMoves = getBookMoves(board, session.book)
+        if len(bookMoves) > 0:
+            return [{"Move": move["Move"], "Centipawn": None, "Mate": None, "Weight": move["Weight"]} for move in bookMoves[0:moves]]
+    return analysisBestMoves(getAnalysis(stockfish, board, session, moves), moves)
+
+def getEval(stockfish: UciEngine, board: Board, session: Session, budget: Budget = None) -> dict:
+    return analysisEval(getAnalysis(stockfish, board, session, 1, budget), board)
+
+def getNTM(board: Board) -> str:
+    return Player.WHITE if board.whiteToMove else Player.BLACK
+
+def getFen(board: Board, color: bool = True) -> str:
+    fen = board.fen
     if color:
         return colorFen(fen)
     else:
         return fen
 
 def colorFen(fen: str) -> str:
-    coloredFen = ""
-    attrs=['bold']
-    for c in fen:
-        cc = c
-        if cc in ['R','N','B','Q','K','P', 'w']:
-            cc = colored(c, color=ColorConst.WHITE_PIECE, on_color=ColorConst.FEN_BG, attrs=attrs)
-        elif cc in ['r','n','b','q','k','p']:
-            cc = colored(c, color=ColorConst.BLACK_PIECE, on_color=ColorConst.FEN_BG, attrs=attrs)
-        else:
-            cc = colored(c, color=None, on_color=ColorConst.FEN_BG, attrs=attrs)
-        coloredFen = coloredFen + cc
-    return coloredFen
+    if len(FEN_CHARS) == 0:
+        buildRenderTables()
+    return "".join([FEN_CHARS[c] if c in FEN_CHARS else colored(c, color=None, on_color=ColorConst.FEN_BG, attrs=['bold']) for c in fen])
 
+# raises ValueError if the fen is not valid, see fen.parseFen
 def fenPass(fen):
-    regexMatch=regex.match('\s*^(((?:[rnbqkpRNBQKP1-8]+\/){7})[rnbqkpRNBQKP1-8]+)\s([b|w])\s([K|Q|k|q]{1,4}|-)\s(-|[a-h][1-8])\s(\d+\s\d+)$', fen)
-    if  regexMatch:
-        regexList = regexMatch.groups()
-        fen = regexList[0].split("/")
-        if len(fen) != 8:
-            raise ValueError("expected 8 rows in position part of fen: {0}".format(repr(fen)))
-        
-        white_king = False
-        black_king = False
-        for fenPart in fen:
-            field_sum = 0
-            previous_was_digit = False
-
-            for c in fenPart:
-                if c in ["1", "2", "3", "4", "5", "6", "7", "8"]:
-                    if previous_was_digit:
-                        raise ValueError("two subsequent digits in position part of fen: {0}".format(repr(fen)))
-                    field_sum += int(c)
-                    previous_was_digit = True
-                elif c.lower() in ["p", "n", "b", "r", "q", "k"]:
-                    field_sum += 1
-                    previous_was_digit = False
-                    if c == "K" and not white_king:
-                        white_king = True
-                    elif c == "k" and not black_king:
-                        black_king = True
-                    elif c == "K" and white_king:
-                        raise ValueError("Multiple white kings.")
-                    elif c == "k" and black_king:
-                        raise ValueError("Multiple black kings.")
-                else:
-                    raise ValueError("invalid character in position part of fen: {0}".format(repr(fen)))
-            # end for in fenPart
-        # end for in fen
-        if field_sum != 8:
-            raise ValueError("expected 8 columns per row in position part of fen: {0}".format(repr(fen)))
-        if not black_king:
-            raise ValueError("Black king not present.")
-        if not white_king:
-            raise ValueError("White king not present.")
-    else: # else regex doesn't match
-        raise ValueError("fen doesn`t match follow this example: rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 ")
+    parseFields(fen)
 
 def ask(defaultTrue: bool = True) -> bool:
     if defaultTrue:
@@ -593,7 +1062,7 @@ def ask(defaultTrue: bool = True) -> bool:
             return False
     else:
         answer = input("y/N ?> ")
-        if anwer == '' or answer[0].lower() != 'y':
+        if answer == '' or answer[0].lower() != 'y':
             return False
         else:
             return True
@@ -0,0 +1,115 @@
+# Settings of the program, from a JSON config file and the environment.
+# The config file is PYCHESS_CONFIG, or ~/.config/pychess/config.json if it exists. Environment variables override it.
+#
+# {
+#     "engine": "/usr/local/bin/stockfish",   PYCHESS_ENGINE
+#     "depth": 20,                            PYCHESS_DEPTH
+#     "parameters": {"Threads": 4},           PYCHESS_THREADS and PYCHESS_HASH for the two most common ones
+#     "background": {"Threads": 1, "Hash": 256},  parameters of the engine that searches in the background (prefetch),
+#                                             on top of "parameters", PYCHESS_BACKGROUND_THREADS and PYCHESS_BACKGROUND_HASH
+#     "warmup": true,                         PYCHESS_WARMUP, start the engines in the background right away
+#     "prefetch": true,                       PYCHESS_PREFETCH, analyze while the user is thinking
+#     "cache": "analysis.db",                 PYCHESS_CACHE, persistent analysis cache, see analysisstore.py
+#     "cache_entries": 1000000,               PYCHESS_CACHE_ENTRIES
+#     "cache_memory": 64,                     PYCHESS_CACHE_MEMORY, MB of memory for analysis, see analysiscache.py
+#     "book": "book.bin",                     PYCHESS_BOOK, Polyglot opening book, see book.py
+#     "processes": 0,                         PYCHESS_PROCESSES, engines of the pool, 0 is half the processors
+#     "profile": false,                       PYCHESS_PROFILE
+#     "server": "http://127.0.0.1:8765"       PYCHESS_SERVER, use the engines of an analysis server, see server.py
+# }
+import json
+import os
+
+DEFAULT_CONFIG_PATH = os.path.join("~", ".config", "pychess", "config.json")
+
+# setting -> (environment variable, type)
+ENVIRONMENT = {
+    "engine": ("PYCHESS_ENGINE", str),
+    "depth": ("PYCHESS_DEPTH", int),
+    "warmup": ("PYCHESS_WARMUP", bool),
+    "prefetch": ("PYCHESS_PREFETCH", bool),
+    "cache": ("PYCHESS_CACHE", str),
+    "cache_entries": ("PYCHESS_CACHE_ENTRIES", int),
+    "cache_memory": ("PYCHESS_CACHE_MEMORY", int),
+    "book": ("PYCHESS_BOOK", str),
+    "processes": ("PYCHESS_PROCESSES", int),
+    "profile": ("PYCHESS_PROFILE", bool),
+    "server": ("PYCHESS_SERVER", str),
+}
+# engine parameter -> environment variable
+ENVIRONMENT_PARAMS = {
+    "Threads": "PYCHESS_THREADS",
+    "Hash": "PYCHESS_HASH",
+}
+# background engine parameter -> environment variable
+ENVIRONMENT_BACKGROUND_PARAMS = {
+    "Threads": "PYCHESS_BACKGROUND_THREADS",
+    "Hash": "PYCHESS_BACKGROUND_HASH",
+}
+# The background engine runs next to the foreground engine, with the foreground's Hash and Threads
+# it would double the memory and compete with its searches for the same cores.
+DEFAULT_BACKGROUND_PARAMS = {
+    "Threads": 1,
+    "Hash": 256,
+}
+
+def _parseBool(value: str) -> bool:
+    return value.strip().lower() not in ["", "0", "false", "no", "off"]
+
+# Returns the settings. engine, depth and parameters are the defaults for the engine,
+# parameters from the config file and environment are applied on top of them.
+# Raises ValueError if the config file or a variable can not be read.
+def loadConfig(engine: str, depth: int, parameters: dict) -> dict:
+    config = {
+        "engine": engine,
+        "depth": depth,
+        "parameters": dict(parameters),
+        "background": dict(DEFAULT_BACKGROUND_PARAMS),
+        "warmup": True,
+        "prefetch": True,
+        "cache": "",
+        "cache_entries": 1000000,
+        "cache_memory": 64,
+        "book": "",
+        "processes": 0,
+        "profile": False,
+        "server": "",
+    }
+    path = os.environ.get("PYCHESS_CONFIG", "")
+    if path == "" and os.path.exists(os.path.expanduser(DEFAULT_CONFIG_PATH)):
+        path = DEFAULT_CONFIG_PATH
+    if path != "":
+        try:
+            with open(os.path.expanduser(path), "r") as file:
+                loaded = json.load(file)
+        except (OSError, json.JSONDecodeError) as ex:
+            raise ValueError(f"can not read config file {path}: {ex}")
+        for name, value in loaded.items():
+            if name in ["parameters", "background"]:
+                config[name].update(value)
+            elif name in config:
+                config[name] = value
+            else:
+                raise ValueError(f"unknown setting {repr(name)} in config file {path}")
+    for name, (variable, kind) in ENVIRONMENT.items():
+        value = os.environ.get(variable)
+        if value == None:
+            continue
+        try:
+            config[name] = _parseBool(value) if kind == bool else kind(value)
+        except ValueError:
+            raise ValueError(f"{variable} must be a number, got {repr(value)}")
+    for section, variables in [("parameters", ENVIRONMENT_PARAMS), ("background", ENVIRONMENT_BACKGROUND_PARAMS)]:
+        for param, variable in variables.items():
+            value = os.environ.get(variable)
+            if value != None:
+                if not value.isdigit():
+                    raise ValueError(f"{variable} must be a number, got {repr(value)}")
+                config[section][param] = int(value)
+    return config
+
+# parameters of the background engine: the engine parameters with the background section on top
+def backgroundParams(config: dict) -> dict:
+    params = dict(config["parameters"])
+    params.update(config["background"])
+    return params
@@ -0,0 +1,102 @@
+# Pool of engine processes for analyzing many positions in parallel.
+# Every process runs its own Stockfish instance. Positions are handed out through a job queue
+# to whichever engine is idle and the results are returned in the order of the positions.
+import multiprocessing
+from ucidriver import UciEngine
+from board import Board
+from analysis import runAnalysis
+
+def _worker(path: str, depth: int, parameters: dict, jobs, results):
+    stockfish = UciEngine(path=path, depth=depth, parameters=parameters)
+    while True:
+        job = jobs.get()
+        if job == None:
+            break
+        idx, fen, multipv, depth = job
+        try:
+            stockfish.set_fen_position(fen, False)
+            analysis = runAnalysis(stockfish, Board(fen), multipv, depth)
+            results.put((idx, analysis, None))
+        except Exception as ex:
+            results.put((idx, None, f"{type(ex).__name__}: {ex}"))
+    del stockfish # stops the engine
+
+class EnginePool:
+    # threads and hash (MB) are per process. parameters are the remaining engine parameters, like in main()
+    def __init__(self, path: str, processes: int = 2, threads: int = 2, hash: int = 256, depth: int = 20, parameters: dict = None):
+        params = dict(parameters) if parameters != None else {}
+        params["Threads"] = threads
+        params["Hash"] = hash
+        self.depth = depth
+        self.processes = processes
+        self._jobs = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._nextId = 0
+        self._workers = []
+        for i in range(0, processes):
+            worker = multiprocessing.Process(target=_worker, args=(path, depth, params, self._jobs, self._results), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # Analyzes the positions and yields the analysis records in the order of the positions.
+    # fens may be any iterable. Only a few jobs per process are queued at a time, so the memory
+    # used does not depend on the number of positions.
+    def imap(self, fens, multipv: int = 1, depth: int = 0):
+        if depth <= 0:
+            depth = self.depth
+        maxPending = self.processes * 2
+        pending = {}        # id -> fen of queued jobs
+        done = {}           # id -> analysis of finished jobs that can not be returned yet
+        order = []          # ids in the order of the positions
+        fens = iter(fens)
+        exhausted = False
+        while True:
+            # keep the queue filled
+            while not exhausted and len(pending) < maxPending:
+                fen = next(fens, None)
+                if fen == None:
+                    exhausted = True
+                    break
+                idx = self._nextId
+                self._nextId += 1
+                pending[idx] = fen
+                order.append(idx)
+                self._jobs.put((idx, fen, multipv, depth))
+            # return finished results in order
+            while len(order) > 0 and order[0] in done:
+                yield done.pop(order.pop(0))
+            if len(pending) == 0 and exhausted:
+                return
+            idx, analysis, error = self._results.get()
+            if not idx in pending:
+                # left over from an earlier call that was not consumed completely
+                continue
+            fen = pending.pop(idx)
+            if error != None:
+                raise RuntimeError(f"Analysis of {fen} failed: {error}")
+            done[idx] = analysis
+
+    # Queues a single position and returns the id of the job. For callers that hand out the results themselves,
+    # like the analysis server, together with nextResult. Don't mix with imap on the same pool.
+    def submit(self, fen: str, multipv: int = 1, depth: int = 0) -> int:
+        idx = self._nextId
+        self._nextId += 1
+        self._jobs.put((idx, fen, multipv, depth if depth > 0 else self.depth))
+        return idx
+
+    # waits for the next finished job and returns (id, analysis, error), error is None if the analysis succeeded
+    def nextResult(self) -> tuple:
+        return self._results.get()
+
+    def close(self):
+        for worker in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
@@ -0,0 +1,161 @@
+# In-process stand-in for the Stockfish engine, for benchmarks and trying things out without a Stockfish binary.
+# FakeStockfish is the engine driver (see ucidriver.py) with the engine process replaced by FakeProcess,
+# which answers the UCI commands itself. Answers are deterministic: moves are scored by material
+# plus a small offset derived from the Zobrist key of the resulting position.
+# Every command is counted, and commands the driver has to wait for (round trips) can be given a latency.
+# Writes to the process are counted as well, the driver collects several commands into one write.
+import time
+from collections import deque
+from board import Board, START_FEN
+from movegen import legalMoves, makeMove, unmakeMove, isCheck
+from ucidriver import UciEngine, DEFAULT_PARAMS
+
+PIECE_VALUES = {'P': 100, 'N': 300, 'B': 310, 'R': 500, 'Q': 900, 'K': 0,
+                'p': -100, 'n': -300, 'b': -310, 'r': -500, 'q': -900, 'k': 0}
+
+# commands after which the driver waits for an answer
+ROUND_TRIPS = ["uci", "isready", "go", "d"]
+
+class FakeInput:
+    def __init__(self, process: "FakeProcess"):
+        self._process = process
+        self._buffer = ""
+
+    def write(self, text: str):
+        self._process.writes += 1
+        self._buffer = self._buffer + text
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            self._process.command(line.strip())
+
+    def flush(self):
+        pass
+
+class FakeOutput:
+    def __init__(self, process: "FakeProcess"):
+        self._process = process
+
+    def readline(self) -> str:
+        if len(self._process.output) == 0:
+            # a real engine would block forever here
+            raise RuntimeError("read from the fake engine without a pending answer")
+        return self._process.output.popleft() + "\n"
+
+class FakeProcess:
+    def __init__(self, latency: float = 0.0, searchLatency: float = 0.0):
+        self.latency = latency                  # seconds for every round trip
+        self.searchLatency = searchLatency      # additional seconds for every searched depth
+        self.stdin = FakeInput(self)
+        self.stdout = FakeOutput(self)
+        self.output = deque(["Stockfish 16 by the Stockfish developers (see AUTHORS file)"])
+        self.board = Board(START_FEN)
+        self.options = {"MultiPV": "1", "UCI_ShowWDL": "false"}
+        self.counts = {}                        # command -> number of times it was sent
+        self.roundTrips = 0
+        self.writes = 0
+        self.searchedNodes = 0                  # positions scored by go commands
+        self._quit = False
+
+    def poll(self):
+        return 0 if self._quit else None
+
+    def resetCounts(self):
+        self.counts = {}
+        self.roundTrips = 0
+        self.writes = 0
+        self.searchedNodes = 0
+
+    def command(self, line: str):
+        tokens = line.split()
+        if len(tokens) == 0:
+            return
+        name = tokens[0]
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if name in ROUND_TRIPS:
+            self.roundTrips += 1
+            if self.latency > 0:
+                time.sleep(self.latency)
+        if name == "uci":
+            self.output.append("id name Stockfish 16")
+            for option in DEFAULT_PARAMS:
+                self.output.append(f"option name {option} type string")
+            self.output.append("option name UCI_ShowWDL type check default false")
+            self.output.append("uciok")
+        elif name == "isready":
+            self.output.append("readyok")
+        elif name == "setoption":
+            # setoption name <name> value <value>, names may contain spaces
+            text = line[len("setoption name "):]
+            option, _, value = text.partition(" value ")
+            self.options[option] = value
+        elif name == "position":
+            self._position(tokens)
+        elif name == "go":
+            self._go(tokens)
+        elif name == "d":
+            self.output.append(f"Fen: {self.board.fen}")
+            self.output.append(f"Key: {self.board.key:016X}")
+            self.output.append("Checkers: ")
+        elif name == "quit":
+            self._quit = True
+
+    def _position(self, tokens: list[str]):
+        movesAt = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if tokens[1] == "startpos":
+            self.board = Board(START_FEN)
+        elif tokens[1] == "fen":
+            self.board = Board(" ".join(tokens[2:movesAt]))
+        else:
+            # like stockfish, ignore the command
+            return
+        for move in tokens[movesAt + 1:]:
+            makeMove(self.board, move)
+
+    def _score(self, move: str) -> tuple:
+        # score of the move for the side that makes it
+        board = self.board
+        undo = makeMove(board, move)
+        if len(legalMoves(board)) == 0 and isCheck(board):
+            score = ("mate", 1)
+        else:
+            material = sum(PIECE_VALUES[piece] for piece in board.squares if piece != None)
+            value = (material if not board.whiteToMove else -material) + (board.key % 21) - 10
+            score = ("cp", value)
+        unmakeMove(board, move, undo)
+        self.searchedNodes += 1
+        return score
+
+    def _go(self, tokens: list[str]):
+        depth = int(tokens[tokens.index("depth") + 1]) if "depth" in tokens else 10
+        movetime = int(tokens[tokens.index("movetime") + 1]) if "movetime" in tokens else 0
+        nodes = int(tokens[tokens.index("nodes") + 1]) if "nodes" in tokens else 0
+        moves = legalMoves(self.board)
+        if "searchmoves" in tokens:
+            searchmoves = tokens[tokens.index("searchmoves") + 1:]
+            moves = [move for move in moves if move in searchmoves]
+        if len(moves) == 0:
+            self.output.append("info depth 0 score " + ("mate 0" if isCheck(self.board) else "cp 0"))
+            self.output.append("bestmove (none)")
+            return
+        scored = sorted(((self._score(move), move) for move in moves), key=lambda item: (item[0][0] != "mate", -item[0][1], item[1]))
+        multipv = min(int(self.options.get("MultiPV", "1")), len(scored))
+        wdl = " wdl 300 400 300" if self.options.get("UCI_ShowWDL") == "true" else ""
+        start = time.perf_counter()
+        for d in range(1, depth + 1):
+            if self.searchLatency > 0:
+                time.sleep(self.searchLatency)
+            for k, ((kind, value), move) in enumerate(scored[0:multipv], 1):
+                self.output.append(f"info depth {d} seldepth {d + 2} multipv {k} score {kind} {value}{wdl} nodes {d * 1000} nps 1000000 time {d} pv {move}")
+            # every depth searches 1000 nodes
+            if (nodes > 0 and (d + 1) * 1000 > nodes) or (movetime > 0 and (time.perf_counter() - start) * 1000 >= movetime):
+                break
+        self.output.append(f"bestmove {scored[0][1]}")
+
+class FakeStockfish(UciEngine):
+    # Same start up sequence as the driver, with the fake engine instead of a process
+    def __init__(self, depth: int = 15, parameters: dict = None, latency: float = 0.0, searchLatency: float = 0.0):
+        super().__init__("fake", depth, parameters, process=FakeProcess(latency, searchLatency))
+
+    @property
+    def process(self) -> FakeProcess:
+        return self._process
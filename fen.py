@@ -0,0 +1,136 @@
+#!python3
+# Validation and parsing of FEN strings in a single pass.
+# parseFen checks a FEN and returns the position as a Board, so it doesn't need to be parsed again afterwards.
+# validateFens checks many FENs, e.g. the lines of a file, and reports the error of every invalid one.
+#
+# python fen.py positions.txt
+import sys
+import time
+from board import Board
+
+PIECES = frozenset("pnbrqkPNBRQK")
+EMPTY = {"1": 1, "2": 2, "3": 3, "4": 4, "5": 5, "6": 6, "7": 7, "8": 8}
+CASTLING = frozenset("KQkq")
+EP_FILES = frozenset("abcdefgh")
+
+# Parsed rows of the piece placement. Positions share most of their rows, so each distinct row is only checked once.
+# row -> (8 squares, white kings, black kings) or the error message
+ROW_CACHE = {}
+ROW_CACHE_SIZE = 100000
+
+EXAMPLE = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def _parseRow(row: str):
+    squares = []
+    whiteKings = 0
+    blackKings = 0
+    previousWasDigit = False
+    for c in row:
+        empty = EMPTY.get(c)
+        if empty != None:
+            if previousWasDigit:
+                return "two subsequent digits"
+            squares.extend([None] * empty)
+            previousWasDigit = True
+        elif c in PIECES:
+            squares.append(c)
+            previousWasDigit = False
+            if c == 'K':
+                whiteKings += 1
+            elif c == 'k':
+                blackKings += 1
+        else:
+            return f"invalid character {repr(c)}"
+    if len(squares) != 8:
+        return f"expected 8 columns, got {len(squares)}"
+    return (squares, whiteKings, blackKings)
+
+# Checks the FEN and returns its fields (squares, white to move, castling, en passant square, halfmove, fullmove).
+# Raises ValueError with the reason if the FEN is invalid.
+def parseFields(fen: str) -> tuple:
+    fields = fen.split()
+    if len(fields) != 6:
+        raise ValueError(f"expected 6 fields in fen, got {len(fields)}. Example: {EXAMPLE}")
+    placement, side, castling, ep, halfmove, fullmove = fields
+
+    rows = placement.split("/")
+    if len(rows) != 8:
+        raise ValueError(f"expected 8 rows in position part of fen, got {len(rows)}: {repr(placement)}")
+    squares = [None] * 64
+    whiteKings = 0
+    blackKings = 0
+    for i, row in enumerate(rows):
+        parsed = ROW_CACHE.get(row)
+        if parsed == None:
+            parsed = _parseRow(row)
+            if len(ROW_CACHE) >= ROW_CACHE_SIZE:
+                ROW_CACHE.clear()
+            ROW_CACHE[row] = parsed
+        if type(parsed) == str:
+            raise ValueError(f"{parsed} in row {i + 1} of position part of fen: {repr(placement)}")
+        rank = 7 - i
+        squares[rank * 8:rank * 8 + 8] = parsed[0]
+        whiteKings += parsed[1]
+        blackKings += parsed[2]
+    if whiteKings > 1:
+        raise ValueError("Multiple white kings.")
+    if blackKings > 1:
+        raise ValueError("Multiple black kings.")
+    if whiteKings == 0:
+        raise ValueError("White king not present.")
+    if blackKings == 0:
+        raise ValueError("Black king not present.")
+
+    if side != "w" and side != "b":
+        raise ValueError(f"side to move must be 'w' or 'b', got {repr(side)}")
+    whiteToMove = side == "w"
+
+    if castling != "-" and (len(castling) > 4 or not CASTLING.issuperset(castling) or len(set(castling)) != len(castling)):
+        raise ValueError(f"castling must be '-' or any of 'KQkq' once each, got {repr(castling)}")
+
+    if ep == "-":
+        ep = None
+    elif len(ep) != 2 or not ep[0] in EP_FILES or ep[1] != ("6" if whiteToMove else "3"):
+        raise ValueError(f"en passant square must be '-' or a square on rank {'6' if whiteToMove else '3'}, got {repr(ep)}")
+
+    if not halfmove.isdigit() or not fullmove.isdigit():
+        raise ValueError(f"move counters must be numbers, got {repr(halfmove)} {repr(fullmove)}")
+    return squares, whiteToMove, castling, ep, int(halfmove), int(fullmove)
+
+# Checks the FEN and returns the position. Raises ValueError with the reason if the FEN is invalid.
+def parseFen(fen: str) -> Board:
+    squares, whiteToMove, castling, ep, halfmove, fullmove = parseFields(fen)
+    return Board.fromFields(squares, whiteToMove, castling, ep, halfmove, fullmove, " ".join(fen.split()))
+
+# Checks many FENs, e.g. the lines of an open file. Empty lines and lines starting with # are skipped.
+# Yields (line number, fen, error) for every FEN, error is None if the FEN is valid.
+def validateFens(fens):
+    for lineNumber, fen in enumerate(fens, 1):
+        fen = fen.strip()
+        if fen == "" or fen.startswith("#"):
+            continue
+        try:
+            parseFields(fen)
+            yield lineNumber, fen, None
+        except ValueError as ex:
+            yield lineNumber, fen, str(ex)
+
+def main():
+    if len(sys.argv) < 2:
+        print("python fen.py positions.txt")
+        return 2
+    start = time.perf_counter()
+    count = 0
+    invalid = 0
+    with open(sys.argv[1], "r") as file:
+        for lineNumber, fen, error in validateFens(file):
+            count += 1
+            if error != None:
+                invalid += 1
+                print(f"line {lineNumber}: {error}")
+    elapsed = time.perf_counter() - start
+    print(f"{count} positions, {invalid} invalid, {elapsed:.1f}s ({count / elapsed if elapsed > 0 else 0:.0f} positions/sec)", file=sys.stderr)
+    return 0 if invalid == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# A game as a root position and a list of moves, with a pointer to the current position.
+# Moves are played and taken back on the board in place, so previewing a move, undoing it
+# or going back to an earlier position doesn't need a new board or a full position reload.
+# The engine is kept in sync by sending it the root position and the moves up to the pointer.
+# Setting a new root position (another FEN, flipping sides) starts a new segment of the game,
+# the earlier segments are kept so that their positions can still be gone back to.
+from ucidriver import UciEngine
+from board import Board, START_FEN
+from movegen import makeMove, unmakeMove
+
+class Game:
+    def __init__(self, fen: str = START_FEN, engine: UciEngine = None):
+        self.board = Board(fen)     # current position
+        self.engine = engine        # engine that is kept on the current position, if any
+        self._sent = None           # last position command sent to the engine
+        self._segments = []         # (root FEN, moves) of every root position the game had, see setRoot
+        self.segment = 0            # index of the current segment
+        self._load(self.board.fen, [])
+        self._segments.append((self.rootFen, self.moves))
+        self._sync()
+
+    # Starts over from a new position, as a new segment after the existing ones.
+    # The engine hash is cleared if newGame is set.
+    def setRoot(self, fen: str, newGame: bool = False):
+        self._load(fen, [])
+        self._segments.append((self.rootFen, self.moves))
+        self.segment = len(self._segments) - 1
+        if newGame and self.engine != None:
+            self.engine.send("ucinewgame")
+        self._sync()
+
+    def _load(self, fen: str, moves: list[str]):
+        self.board.setFen(fen)
+        self.rootFen = self.board.fen
+        self.moves = moves          # moves of the segment in UCI notation, may go beyond the current position
+        self.ply = 0                # number of moves played to reach the current position
+        self._undo = []             # what unmakeMove needs for each of the moves up to the current position
+        self._keys = {self.board.key: 1}    # Zobrist key -> number of times the position occurred up to the current position
+
+    # Plays the move in the current position. If the move differs from the next move of the game,
+    # the moves after the current position are dropped and returned, so they can be restored with pop().
+    # Returns None if the move is the next move of the game, the game's moves stay as they are then.
+    def push(self, move: str) -> list[str]:
+        if self.ply < len(self.moves) and self.moves[self.ply] == move:
+            self.forward()
+            return None
+        dropped = self.moves[self.ply:]
+        del self.moves[self.ply:]
+        self.moves.append(move)
+        self._play()
+        self._sync()
+        return dropped
+
+    # Takes back the last move. The move stays in the game, so forward() can play it again,
+    # unless what push() returned for it is given (undoing a preview): then the move is replaced by the moves
+    # that push() dropped. None keeps the moves, push() returns it when the move was the game's next move anyway.
+    def pop(self, restore: list[str] = None):
+        self._takeBack()
+        if restore != None:
+            self.moves[self.ply:] = restore
+        self._sync()
+
+    def forward(self):
+        self._play()
+        self._sync()
+
+    # Goes to the position after the given number of moves, of the given segment or the current one.
+    def goto(self, ply: int, segment: int = None):
+        if segment != None and segment != self.segment:
+            if segment < 0 or segment >= len(self._segments):
+                raise IndexError(f"No segment {segment} in the game")
+            if ply < 0 or ply > len(self._segments[segment][1]):
+                raise IndexError(f"No position {ply} in the game")
+            self._load(*self._segments[segment])
+            self.segment = segment
+        elif ply < 0 or ply > len(self.moves):
+            raise IndexError(f"No position {ply} in the game")
+        while self.ply > ply:
+            self._takeBack()
+        while self.ply < ply:
+            self._play()
+        self._sync()
+
+    # number of times the current position occurred in the game up to now
+    def repetitions(self) -> int:
+        return self._keys[self.board.key]
+
+    # (segment, ply, move that led to the position or None, FEN) of every position of every segment, in order
+    def history(self) -> list[tuple]:
+        history = []
+        for segment, (rootFen, moves) in enumerate(self._segments):
+            board = Board(rootFen)
+            history.append((segment, 0, None, board.fen))
+            for ply, move in enumerate(moves, 1):
+                makeMove(board, move)
+                history.append((segment, ply, move, board.fen))
+        return history
+
+    # The last moves that led to the current position, at most count of them, as (position before the move, move),
+    # the earliest first. Takes the moves back on a copy of the current position instead of replaying the game from the root.
+    def lastMoves(self, count: int) -> list[tuple]:
+        board = self.board.copy()
+        moves = []
+        for ply in range(self.ply - 1, max(self.ply - count, 0) - 1, -1):
+            unmakeMove(board, self.moves[ply], self._undo[ply])
+            moves.append((board.copy(), self.moves[ply]))
+        moves.reverse()
+        return moves
+
+    # every position of the line as a Board, from the root position to the last move, including the moves after the current position
+    def boards(self) -> list[Board]:
+        board = Board(self.rootFen)
+        boards = [board.copy()]
+        for move in self.moves:
+            makeMove(board, move)
+            boards.append(board.copy())
+        return boards
+
+    # position command for the engine, the root position and the moves up to the current position
+    def positionCommand(self) -> str:
+        if self.ply == 0:
+            return f"position fen {self.rootFen}"
+        return f"position fen {self.rootFen} moves " + " ".join(self.moves[0:self.ply])
+
+    def _play(self):
+        move = self.moves[self.ply]
+        self._undo.append(makeMove(self.board, move))
+        self.ply += 1
+        key = self.board.key
+        self._keys[key] = self._keys.get(key, 0) + 1
+
+    def _takeBack(self):
+        key = self.board.key
+        self._keys[key] -= 1
+        if self._keys[key] == 0:
+            del self._keys[key]
+        self.ply -= 1
+        unmakeMove(self.board, self.moves[self.ply], self._undo.pop())
+
+    # Sends the current position to the engine. A single write without waiting for the engine,
+    # the engine applies the moves to the root position itself.
+    def _sync(self):
+        if self.engine == None:
+            return
+        command = self.positionCommand()
+        if command != self._sent:
+            self.engine.send(command)
+            self._sent = command
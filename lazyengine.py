@@ -0,0 +1,64 @@
+# Starts the engine when a search needs it instead of at program start.
+# LazyEngine stands in for the engine driver (see ucidriver.py). The depth and the parameters are known without
+# the engine, and the position is remembered until the engine is started. Everything else starts the engine first,
+# or waits for the warm up if it is already starting the engine in the background.
+# onStart is called with the engine driver once the engine runs, e.g. to register it with the profiler.
+import threading
+from ucidriver import UciEngine, DEFAULT_PARAMS
+
+class LazyEngine:
+    def __init__(self, path: str, depth: int = 15, parameters: dict = None, onStart = None):
+        self.path = path
+        self.depth = str(depth)
+        self.parameters = parameters if parameters != None else {}
+        self.onStart = onStart
+        self._engine = None
+        self._position = None               # last position command before the engine was started
+        self._startLock = threading.Lock()  # only one thread starts the engine
+        self._lock = threading.Lock()       # guards _engine and _position
+
+    def started(self) -> bool:
+        return self._engine != None
+
+    # starts the engine in the background, so the first search doesn't have to wait for it
+    def warmUp(self):
+        if self._engine == None:
+            threading.Thread(target=self.engine, daemon=True).start()
+
+    # the engine, started on first use
+    def engine(self):
+        engine = self._engine
+        if engine != None:
+            return engine
+        with self._startLock:
+            if self._engine == None:
+                engine = UciEngine(path=self.path, depth=int(self.depth), parameters=self.parameters)
+                with self._lock:
+                    if self._position != None:
+                        engine.send(self._position)
+                    self._engine = engine
+                if self.onStart != None:
+                    self.onStart(engine)
+        return self._engine
+
+    def get_parameters(self) -> dict:
+        if self._engine != None:
+            return self._engine.get_parameters()
+        parameters = dict(DEFAULT_PARAMS)
+        parameters.update(self.parameters)
+        return parameters
+
+    def send(self, command: str):
+        with self._lock:
+            if self._engine == None:
+                # a new engine starts with a new game, only the position has to be sent once it runs
+                if command.startswith("position "):
+                    self._position = command
+                    return
+                if command == "ucinewgame":
+                    return
+        self.engine().send(command)
+
+    def __getattr__(self, name: str):
+        # everything else needs the engine
+        return getattr(self.engine(), name)
@@ -0,0 +1,393 @@
+#!python3
+# Legal move generator working on bitboards.
+# Used to check moves locally instead of asking the engine to run a search for every candidate.
+# Bit 0 is a1, bit 7 is h1, bit 56 is a8 and bit 63 is h8, the same as the squares of the Board.
+import sys
+import time
+from board import Board, squareIndex, squareName
+from zobrist import PIECE_SQUARE, EN_PASSANT_FILE, WHITE_TO_MOVE, castlingKey, enPassantKey
+
+WHITE = 0
+BLACK = 1
+
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+# FEN letter -> (color, piece type)
+PIECE_INDEX = {
+    'P': (WHITE, PAWN), 'N': (WHITE, KNIGHT), 'B': (WHITE, BISHOP), 'R': (WHITE, ROOK), 'Q': (WHITE, QUEEN), 'K': (WHITE, KING),
+    'p': (BLACK, PAWN), 'n': (BLACK, KNIGHT), 'b': (BLACK, BISHOP), 'r': (BLACK, ROOK), 'q': (BLACK, QUEEN), 'k': (BLACK, KING)
+}
+
+PROMOTIONS = "qrbn"
+
+FULL = (1 << 64) - 1
+
+class Capture:
+    # same values as the Capture enum of the stockfish package
+    DIRECT_CAPTURE = "direct capture"
+    EN_PASSANT = "en passant"
+    NO_CAPTURE = "no capture"
+
+# precomputed attack tables
+def _stepAttacks(steps: list) -> list:
+    table = []
+    for sq in range(0, 64):
+        file, rank = sq & 7, sq >> 3
+        bb = 0
+        for df, dr in steps:
+            f, r = file + df, rank + dr
+            if 0 <= f < 8 and 0 <= r < 8:
+                bb |= 1 << (r * 8 + f)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _stepAttacks([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _stepAttacks([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+# PAWN_ATTACKS[color][sq] are the squares a pawn of that color on sq attacks
+PAWN_ATTACKS = [_stepAttacks([(-1, 1), (1, 1)]), _stepAttacks([(-1, -1), (1, -1)])]
+
+# ray tables for sliding pieces. The first two directions of each table go towards higher square indices,
+# so the closest blocker is the lowest set bit. For the other two it is the highest set bit.
+ROOK_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+def _rays(directions: list) -> list:
+    tables = []
+    for df, dr in directions:
+        table = []
+        for sq in range(0, 64):
+            f, r = (sq & 7) + df, (sq >> 3) + dr
+            bb = 0
+            while 0 <= f < 8 and 0 <= r < 8:
+                bb |= 1 << (r * 8 + f)
+                f, r = f + df, r + dr
+            table.append(bb)
+        tables.append(table)
+    return tables
+
+# [north, east, south, west]
+ROOK_RAYS = _rays(ROOK_DIRECTIONS)
+# [north east, north west, south east, south west]
+BISHOP_RAYS = _rays(BISHOP_DIRECTIONS)
+
+def _slide(sq: int, occ: int, rays: list) -> int:
+    attacks = 0
+    # positive directions
+    for table in rays[0:2]:
+        ray = table[sq]
+        blockers = ray & occ
+        if blockers:
+            ray ^= table[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    # negative directions
+    for table in rays[2:4]:
+        ray = table[sq]
+        blockers = ray & occ
+        if blockers:
+            ray ^= table[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rookAttacks(sq: int, occ: int) -> int:
+    return _slide(sq, occ, ROOK_RAYS)
+
+def bishopAttacks(sq: int, occ: int) -> int:
+    return _slide(sq, occ, BISHOP_RAYS)
+
+def _bits(bb: int):
+    # yields the indices of all set bits
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+RANK_1 = 0xFF
+RANK_2 = 0xFF << 8
+RANK_7 = 0xFF << 48
+RANK_8 = 0xFF << 56
+
+# squares that have to be empty / may not be attacked for castling, by castling right
+CASTLING = {
+    # right: (king src, king dst, rook src, rook dst, squares that must be empty, squares the king passes through)
+    'K': (4, 6, 7, 5, (1 << 5) | (1 << 6), [4, 5]),
+    'Q': (4, 2, 0, 3, (1 << 1) | (1 << 2) | (1 << 3), [4, 3]),
+    'k': (60, 62, 63, 61, (1 << 61) | (1 << 62), [60, 61]),
+    'q': (60, 58, 56, 59, (1 << 57) | (1 << 58) | (1 << 59), [60, 59])
+}
+
+def _bitboards(board: Board) -> list:
+    # bbs[color][piece type]
+    bbs = [[0] * 6, [0] * 6]
+    for sq, piece in enumerate(board.squares):
+        if piece != None:
+            color, pieceType = PIECE_INDEX[piece]
+            bbs[color][pieceType] |= 1 << sq
+    return bbs
+
+def _isAttacked(sq: int, by: int, bbs: list, occ: int) -> bool:
+    pieces = bbs[by]
+    if PAWN_ATTACKS[1 - by][sq] & pieces[PAWN]:
+        return True
+    if KNIGHT_ATTACKS[sq] & pieces[KNIGHT]:
+        return True
+    if KING_ATTACKS[sq] & pieces[KING]:
+        return True
+    if bishopAttacks(sq, occ) & (pieces[BISHOP] | pieces[QUEEN]):
+        return True
+    if rookAttacks(sq, occ) & (pieces[ROOK] | pieces[QUEEN]):
+        return True
+    return False
+
+# returns whether the side to move is in check
+def isCheck(board: Board) -> bool:
+    bbs = _bitboards(board)
+    us = WHITE if board.whiteToMove else BLACK
+    occ = 0
+    for bb in bbs[WHITE] + bbs[BLACK]:
+        occ |= bb
+    king = bbs[us][KING]
+    return king != 0 and _isAttacked(king.bit_length() - 1, 1 - us, bbs, occ)
+
+# returns all legal moves of the side to move in UCI notation (e2e4, e7e8q, e1g1)
+def legalMoves(board: Board) -> list[str]:
+    bbs = _bitboards(board)
+    us = WHITE if board.whiteToMove else BLACK
+    them = 1 - us
+    own = 0
+    for bb in bbs[us]:
+        own |= bb
+    opp = 0
+    for bb in bbs[them]:
+        opp |= bb
+    occ = own | opp
+    kingBB = bbs[us][KING]
+    if kingBB == 0:
+        return []
+    kingSq = kingBB.bit_length() - 1
+    epSq = squareIndex(board.epSquare) if board.epSquare != None else -1
+
+    # pseudo legal moves as (src, dst, promotions, square of a pawn captured en passant or -1)
+    candidates = []
+    pawns = bbs[us][PAWN]
+    empty = ~occ & FULL
+    if us == WHITE:
+        single = (pawns << 8) & empty
+        double = ((single & (RANK_2 << 8)) << 8) & empty
+        forward = 8
+        promoRank = RANK_8
+    else:
+        single = (pawns >> 8) & empty
+        double = ((single & (RANK_7 >> 8)) >> 8) & empty
+        forward = -8
+        promoRank = RANK_1
+    for dst in _bits(single):
+        candidates.append((dst - forward, dst, (1 << dst) & promoRank != 0, -1))
+    for dst in _bits(double):
+        candidates.append((dst - 2 * forward, dst, False, -1))
+    for src in _bits(pawns):
+        attacks = PAWN_ATTACKS[us][src]
+        for dst in _bits(attacks & opp):
+            candidates.append((src, dst, (1 << dst) & promoRank != 0, -1))
+        if epSq >= 0 and attacks & (1 << epSq):
+            candidates.append((src, epSq, False, epSq - forward))
+    for src in _bits(bbs[us][KNIGHT]):
+        for dst in _bits(KNIGHT_ATTACKS[src] & ~own):
+            candidates.append((src, dst, False, -1))
+    for src in _bits(bbs[us][BISHOP] | bbs[us][QUEEN]):
+        for dst in _bits(bishopAttacks(src, occ) & ~own):
+            candidates.append((src, dst, False, -1))
+    for src in _bits(bbs[us][ROOK] | bbs[us][QUEEN]):
+        for dst in _bits(rookAttacks(src, occ) & ~own):
+            candidates.append((src, dst, False, -1))
+    for dst in _bits(KING_ATTACKS[kingSq] & ~own):
+        candidates.append((kingSq, dst, False, -1))
+
+    moves = []
+    # filter out moves that leave the own king in check
+    theirs = bbs[them]
+    after = [None, None]
+    for src, dst, promotes, epCapture in candidates:
+        dstBit = 1 << dst
+        removed = dstBit if epCapture < 0 else (1 << epCapture)
+        newOcc = (occ & ~(1 << src) & ~removed) | dstBit
+        after[them] = [bb & ~removed for bb in theirs]
+        king = dst if src == kingSq else kingSq
+        if _isAttacked(king, them, after, newOcc):
+            continue
+        move = squareName(src) + squareName(dst)
+        if promotes:
+            for promo in PROMOTIONS:
+                moves.append(move + promo)
+        else:
+            moves.append(move)
+
+    # castling. The king may not be in check, pass through or land on an attacked square.
+    for right in board.castling:
+        if right == '-' or (right.isupper() != (us == WHITE)):
+            continue
+        kingSrc, kingDst, rookSrc, rookDst, between, passes = CASTLING[right]
+        if kingSq != kingSrc or not (bbs[us][ROOK] & (1 << rookSrc)) or occ & between:
+            continue
+        if any(_isAttacked(sq, them, bbs, occ) for sq in passes + [kingDst]):
+            continue
+        moves.append(squareName(kingSrc) + squareName(kingDst))
+    return moves
+
+# returns what kind of capture the move is. The move is expected to be legal.
+def getCapture(board: Board, move: str) -> str:
+    dst = move[2:4]
+    if board.pieceAt(dst) != None:
+        return Capture.DIRECT_CAPTURE
+    piece = board.pieceAt(move[0:2])
+    if dst == board.epSquare and piece in ['P', 'p'] and move[0] != move[2]:
+        return Capture.EN_PASSANT
+    return Capture.NO_CAPTURE
+
+# Plays the move on the board and updates the Zobrist key incrementally. The move is expected to be legal.
+# Returns what is needed to take the move back with unmakeMove.
+def makeMove(board: Board, move: str) -> tuple:
+    squares = board.squares
+    src = squareIndex(move[0:2])
+    dst = squareIndex(move[2:4])
+    piece = squares[src]
+    captured = squares[dst]
+    pawnMove = piece in ['P', 'p']
+    undo = (piece, board.castling, board.epSquare, board.halfmove, board.key, board._fen)
+    # remove the en passant and castling parts of the key, they are added again below
+    key = board.key ^ enPassantKey(squares, board.epSquare, board.whiteToMove) ^ castlingKey(board.castling)
+    key ^= PIECE_SQUARE[piece][src]
+    if captured != None:
+        key ^= PIECE_SQUARE[captured][dst]
+    board.epSquare = None
+
+    if pawnMove:
+        if captured == None and (src & 7) != (dst & 7):
+            # en passant, the captured pawn is behind the target square
+            epPawnSq = (src & ~7) | (dst & 7)
+            captured = squares[epPawnSq]
+            key ^= PIECE_SQUARE[captured][epPawnSq]
+            squares[epPawnSq] = None
+        elif abs(dst - src) == 16:
+            # only record the en passant square if an enemy pawn could actually capture there
+            epSq = (src + dst) // 2
+            enemyPawn = 'p' if piece == 'P' else 'P'
+            neighbours = []
+            if (dst & 7) > 0:
+                neighbours.append(dst - 1)
+            if (dst & 7) < 7:
+                neighbours.append(dst + 1)
+            if any(squares[sq] == enemyPawn for sq in neighbours):
+                board.epSquare = squareName(epSq)
+                key ^= EN_PASSANT_FILE[dst & 7]
+        if len(move) > 4:
+            piece = move[4].upper() if piece == 'P' else move[4].lower()
+    elif piece in ['K', 'k'] and abs(dst - src) == 2:
+        # castling, move the rook as well
+        rookSrc, rookDst = (src + 3, src + 1) if dst > src else (src - 4, src - 1)
+        rook = squares[rookSrc]
+        key ^= PIECE_SQUARE[rook][rookSrc] ^ PIECE_SQUARE[rook][rookDst]
+        squares[rookDst] = rook
+        squares[rookSrc] = None
+
+    squares[dst] = piece
+    squares[src] = None
+    key ^= PIECE_SQUARE[piece][dst]
+
+    # update castling rights
+    if board.castling != '-':
+        castling = board.castling
+        for sq in (src, dst):
+            if sq == 4:
+                castling = castling.replace('K', '').replace('Q', '')
+            elif sq == 60:
+                castling = castling.replace('k', '').replace('q', '')
+            elif sq == 7:
+                castling = castling.replace('K', '')
+            elif sq == 0:
+                castling = castling.replace('Q', '')
+            elif sq == 63:
+                castling = castling.replace('k', '')
+            elif sq == 56:
+                castling = castling.replace('q', '')
+        board.castling = castling if castling != '' else '-'
+        key ^= castlingKey(board.castling)
+
+    board.halfmove = 0 if (pawnMove or captured != None) else board.halfmove + 1
+    if not board.whiteToMove:
+        board.fullmove += 1
+    board.whiteToMove = not board.whiteToMove
+    board.key = key ^ WHITE_TO_MOVE
+    board._fen = None
+    return undo + (captured,)
+
+# Takes back a move that was played with makeMove, undo is what makeMove returned.
+def unmakeMove(board: Board, move: str, undo: tuple):
+    piece, castling, epSquare, halfmove, key, fen, captured = undo
+    squares = board.squares
+    src = squareIndex(move[0:2])
+    dst = squareIndex(move[2:4])
+    squares[src] = piece
+    if piece in ['P', 'p'] and move[2:4] == epSquare:
+        # en passant, the captured pawn was behind the target square
+        squares[dst] = None
+        squares[(src & ~7) | (dst & 7)] = captured
+    else:
+        squares[dst] = captured
+        if piece in ['K', 'k'] and abs(dst - src) == 2:
+            rookSrc, rookDst = (src + 3, src + 1) if dst > src else (src - 4, src - 1)
+            squares[rookSrc] = squares[rookDst]
+            squares[rookDst] = None
+    board.whiteToMove = not board.whiteToMove
+    if not board.whiteToMove:
+        board.fullmove -= 1
+    board.castling = castling
+    board.epSquare = epSquare
+    board.halfmove = halfmove
+    board.key = key
+    board._fen = fen
+
+# counts the leaf nodes of the move tree up to the given depth
+def perft(board: Board, depth: int) -> int:
+    moves = legalMoves(board)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = makeMove(board, move)
+        nodes += perft(board, depth - 1)
+        unmakeMove(board, move, undo)
+    return nodes
+
+# well known positions with their node counts
+# https://www.chessprogramming.org/Perft_Results
+PERFT_SUITE = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281]),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    ("r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", [6, 264, 9467]),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+    ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890])
+]
+
+# runs the perft suite and returns whether all counts matched
+def runPerftSuite(maxDepth: int = 3) -> bool:
+    passed = True
+    for fen, counts in PERFT_SUITE:
+        for depth in range(1, min(maxDepth, len(counts)) + 1):
+            start = time.perf_counter()
+            nodes = perft(Board(fen), depth)
+            elapsed = time.perf_counter() - start
+            ok = nodes == counts[depth - 1]
+            passed = passed and ok
+            print(f"{'OK  ' if ok else 'FAIL'} depth {depth} {nodes:>8} (expected {counts[depth - 1]:>8}) {elapsed:6.2f}s  {fen}")
+    return passed
+
+if __name__ == "__main__":
+    # python movegen.py [max depth]
+    sys.exit(0 if runPerftSuite(int(sys.argv[1]) if len(sys.argv) > 1 else 3) else 1)
@@ -0,0 +1,170 @@
+# Streaming reader for PGN files and conversion between SAN and UCI moves.
+# readGames reads only the mainline of each game, comments, variations and NAGs are skipped.
+# readTokens keeps them, for reading a game with its variations (see analysistree.py).
+import regex
+from board import Board, START_FEN
+from movegen import legalMoves, makeMove, unmakeMove, isCheck
+
+RESULTS = ["1-0", "0-1", "1/2-1/2", "*"]
+
+# kinds of tokens, see readTokens
+HEADER = "header"
+COMMENT = "comment"
+VARIATION_START = "("
+VARIATION_END = ")"
+MOVE = "move"
+NAG = "nag"
+RESULT = "result"
+
+SAN_REGEX = regex.compile("^([NBRQK]?)([a-h]?)([1-8]?)x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+# turns a move in standard algebraic notation (Nf3, exd5, O-O, e8=Q+) into a UCI move (g1f3).
+# Raises ValueError if the move is not legal in the position.
+def sanToMove(board: Board, san: str) -> str:
+    san = san.rstrip("+#!?")
+    legal = legalMoves(board)
+    rank = "1" if board.whiteToMove else "8"
+    if san in ["O-O", "0-0"]:
+        move = f"e{rank}g{rank}"
+    elif san in ["O-O-O", "0-0-0"]:
+        move = f"e{rank}c{rank}"
+    else:
+        match = SAN_REGEX.match(san)
+        if match == None:
+            raise ValueError(f"Not a valid move: {san}")
+        piece, srcFile, srcRank, dst, promotion = match.groups()
+        piece = piece if piece != '' else 'P'
+        if not board.whiteToMove:
+            piece = piece.lower()
+        target = dst + (promotion.lower() if promotion != None else '')
+        candidates = [m for m in legal
+                      if m[2:] == target
+                      and board.pieceAt(m[0:2]) == piece
+                      and (srcFile == '' or m[0] == srcFile)
+                      and (srcRank == '' or m[1] == srcRank)]
+        if len(candidates) != 1:
+            raise ValueError(f"{'Ambiguous' if len(candidates) > 1 else 'Illegal'} move: {san}")
+        move = candidates[0]
+    if not move in legal:
+        raise ValueError(f"Illegal move: {san}")
+    return move
+
+# Splits PGN into tokens, from an iterable of lines (e.g. an open file).
+# Yields (kind, text): HEADER with text (name, value), COMMENT without the braces, VARIATION_START and VARIATION_END
+# for the parentheses, MOVE in SAN without the move number, NAG ($1) and RESULT.
+def readTokens(lines):
+    depth = 0           # nesting depth of variations
+    inComment = False
+    comment = []        # parts of a comment that spans several lines
+    for line in lines:
+        line = line.strip()
+        if not inComment and depth == 0 and line.startswith("["):
+            match = regex.match('^\\[(\\w+)\\s+"(.*)"\\]$', line)
+            if match != None:
+                yield HEADER, (match.group(1), match.group(2))
+            continue
+        if line.startswith("%"):
+            continue
+        i = 0
+        n = len(line)
+        while i < n:
+            c = line[i]
+            if inComment:
+                end = line.find("}", i)
+                if end < 0:
+                    comment.append(line[i:])
+                    break
+                comment.append(line[i:end])
+                yield COMMENT, " ".join(part.strip() for part in comment if part.strip() != "")
+                inComment = False
+                i = end + 1
+            elif c == "{":
+                inComment = True
+                comment = []
+                i += 1
+            elif c == ";":
+                yield COMMENT, line[i + 1:].strip()
+                break
+            elif c == "(":
+                depth += 1
+                yield VARIATION_START, c
+                i += 1
+            elif c == ")":
+                depth -= 1
+                yield VARIATION_END, c
+                i += 1
+            elif c.isspace():
+                i += 1
+            else:
+                end = i
+                while end < n and not line[end].isspace() and not line[end] in "{}();":
+                    end += 1
+                token = line[i:end]
+                i = end
+                if token.startswith("$"):
+                    yield NAG, token
+                elif token in RESULTS:
+                    yield RESULT, token
+                else:
+                    # strip move numbers like "12." or "12..." that are attached to the move
+                    token = token.split(".")[-1]
+                    if token != "" and not token.isdigit():
+                        yield MOVE, token
+
+# turns a legal UCI move (g1f3) into standard algebraic notation (Nf3), with + or # for check and mate
+def moveToSan(board: Board, move: str) -> str:
+    piece = board.pieceAt(move[0:2])
+    pieceType = piece.upper()
+    if pieceType == 'K' and abs(ord(move[0]) - ord(move[2])) == 2:
+        san = "O-O" if move[2] == 'g' else "O-O-O"
+    elif pieceType == 'P':
+        capture = move[0] != move[2]
+        san = (move[0] + "x" if capture else "") + move[2:4] + ("=" + move[4].upper() if len(move) > 4 else "")
+    else:
+        capture = board.pieceAt(move[2:4]) != None
+        others = [m for m in legalMoves(board) if m != move and m[2:4] == move[2:4] and board.pieceAt(m[0:2]) == piece]
+        source = ""
+        if len(others) > 0:
+            if all(m[0] != move[0] for m in others):
+                source = move[0]
+            elif all(m[1] != move[1] for m in others):
+                source = move[1]
+            else:
+                source = move[0:2]
+        san = pieceType + source + ("x" if capture else "") + move[2:4]
+    undo = makeMove(board, move)
+    if isCheck(board):
+        san += "#" if len(legalMoves(board)) == 0 else "+"
+    unmakeMove(board, move, undo)
+    return san
+
+# Reads games from an iterable of lines (e.g. an open file) one at a time.
+# Yields (headers, moves) with the headers as a dict and the mainline moves in SAN.
+def readGames(lines):
+    headers = {}
+    moves = []
+    depth = 0           # nesting depth of variations
+    for kind, text in readTokens(lines):
+        if kind == HEADER:
+            if len(moves) > 0:
+                # a game without a result marker
+                yield headers, moves
+                headers, moves = {}, []
+            headers[text[0]] = text[1]
+        elif kind == VARIATION_START:
+            depth += 1
+        elif kind == VARIATION_END:
+            depth -= 1
+        elif depth > 0:
+            continue
+        elif kind == RESULT:
+            yield headers, moves
+            headers, moves = {}, []
+        elif kind == MOVE:
+            moves.append(text)
+    if len(moves) > 0 or len(headers) > 0:
+        yield headers, moves
+
+# starting position of a game
+def gameStartFen(headers: dict) -> str:
+    return headers.get("FEN", START_FEN)
@@ -0,0 +1,109 @@
+# Background analysis of the current position while the user is thinking.
+# Searches the current position and the positions after its top candidate moves with the background engine
+# and puts the results into the cache, so that evaluating one of these moves afterwards is answered from the cache.
+# Positions that are looked at for a while, like in the analysis tree, are deepened step by step instead (see deepen).
+import asyncio
+import threading
+from board import Board
+from movegen import makeMove
+from analysis import analysisCovers
+from analysiscache import AnalysisCache
+from asyncuci import BackgroundEngine
+
+# plies a deepening search goes beyond the previous one
+DEEPEN_STEP = 2
+
+class Prefetcher:
+    def __init__(self, background: BackgroundEngine, cache: AnalysisCache, candidates: int = 3):
+        self.background = background
+        self.cache = cache
+        self.candidates = candidates    # number of top moves of which the resulting positions are analyzed
+        self._fen = None                # position the prefetch was started for
+        self._moves = None              # moves that are deepened, None for the top candidates
+        self._future = None
+        self._searching = None          # (fen, event) of the position that is being searched right now
+        self._lock = threading.Lock()
+
+    # Starts prefetching for the position. Prefetching for a previous position is cancelled.
+    # Does nothing if the prefetch for this position is already running.
+    def start(self, board: Board, multipv: int, depth: int, params: dict):
+        if self._fen == board.fen and self._future != None and not self._future.done():
+            return
+        self.cancel()
+        self._fen = board.fen
+        self._future = self.background.run(self._run(board.copy(), multipv, depth, params))
+
+    # Like start, but for the given moves of the position instead of its top candidates, and searching again deeper
+    # each time all of them are done, up to maxDepth. Deeper searches continue from what the engine's hash table has.
+    def deepen(self, board: Board, moves: list[str], multipv: int, depth: int, params: dict, maxDepth: int):
+        if self._fen == board.fen and self._moves == moves and self._future != None and not self._future.done():
+            return
+        self.cancel()
+        self._fen = board.fen
+        self._moves = list(moves)
+        self._future = self.background.run(self._deepen(board.copy(), list(moves), multipv, depth, params, maxDepth))
+
+    # cancels the prefetch without waiting for it
+    def cancel(self):
+        if self._future != None:
+            self._future.cancel()
+            self._future = None
+        self._fen = None
+        self._moves = None
+
+    # If the position is being searched right now, waits for that search to finish
+    # so that the result can be taken from the cache instead of searching again.
+    # timeout is the most seconds to wait, None waits for the search to finish.
+    def wait(self, fen: str, timeout: float = None):
+        with self._lock:
+            searching = self._searching
+        if searching != None and searching[0] == fen:
+            searching[1].wait(timeout)
+
+    async def _run(self, board: Board, multipv: int, depth: int, params: dict):
+        analysis = await self._analyze(board, multipv, depth, params)
+        if analysis["depth"] < depth:
+            # the search was stopped by a search in the foreground
+            return
+        for line in analysis["lines"][0:self.candidates]:
+            child = board.copy()
+            makeMove(child, line["Move"])
+            if (await self._analyze(child, multipv, depth, params))["depth"] < depth:
+                return
+
+    async def _deepen(self, board: Board, moves: list[str], multipv: int, depth: int, params: dict, maxDepth: int):
+        children = []
+        for move in moves:
+            child = board.copy()
+            makeMove(child, move)
+            children.append(child)
+        while depth <= maxDepth:
+            for position in [board] + children:
+                if (await self._analyze(position, multipv, depth, params))["depth"] < depth:
+                    return
+            depth += DEEPEN_STEP
+
+    async def _analyze(self, board: Board, multipv: int, depth: int, params: dict) -> dict:
+        fen = board.fen
+        cached = self.cache.get(board)
+        if analysisCovers(cached, multipv, depth, params):
+            return cached
+        done = threading.Event()
+        with self._lock:
+            self._searching = (fen, done)
+        try:
+            engine = await self.background.engine()
+            search = await engine.search(fen, board.whiteToMove, multipv, depth)
+            try:
+                lines = await search.wait()
+            except asyncio.CancelledError:
+                await engine.stop(search)
+                raise
+            analysis = {"depth": search.depth, "multipv": multipv, "params": params, "lines": lines}
+            if search.depth >= depth:
+                self.cache.put(board, analysis)
+            return analysis
+        finally:
+            with self._lock:
+                self._searching = None
+            done.set()
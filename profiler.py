@@ -0,0 +1,189 @@
+# Instrumentation of the engine calls, per menu action.
+# Engines are registered when they start (see LazyEngine and BackgroundEngine), so profiling never starts one itself.
+# When enabled, the methods of every registered engine are wrapped on the instance, so the call counts and
+# latencies of each menu action show where the time went (search, engine round trips or rendering).
+# Nested calls are counted as well, e.g. set_fen_position shows up together with the send calls it makes.
+# When disabled the wrappers are removed again, so the only cost left is checking PROFILER.enabled at the cache lookups.
+import inspect
+import json
+import threading
+import time
+from ucidriver import UciEngine
+
+# every method of the engine driver, including the private ones that talk to the process
+ENGINE_METHODS = [name for name in dir(UciEngine) if not name.startswith("__") and callable(getattr(UciEngine, name))]
+# methods of the background engine (see asyncuci.py) and the engine pool that talk to their engines
+ASYNC_ENGINE_METHODS = ["search", "stop", "isReady", "setOptions"]
+POOL_METHODS = ["imap", "submit", "nextResult"]
+
+# latency buckets, bucket i counts calls that took less than 2^i microseconds
+HISTOGRAM_BUCKETS = 27
+
+class Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    # upper bound of the bucket that contains the given fraction of the calls, in seconds
+    def percentile(self, fraction: float) -> float:
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= fraction * self.count:
+                return (1 << i) / 1e6
+        return self.max
+
+    def toJson(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "max_ms": self.max * 1000,
+            "histogram_us": {f"<{1 << i}": n for i, n in enumerate(self.buckets) if n > 0}
+        }
+
+class ActionStats:
+    def __init__(self):
+        self.calls = {}     # name -> Histogram
+        self.cache = {}     # name -> [hits, misses]
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.action = "startup"     # menu action the following calls are recorded for
+        self.actions = {}           # action -> ActionStats
+        self._engines = []          # (engine, method names, prefix of the recorded names) of the started engines
+        self._lock = threading.Lock()   # the background engine and the prefetch record from their own thread
+
+    # Adds a started engine, it is instrumented right away if profiling is enabled.
+    # The calls are recorded as the prefix followed by the method name.
+    def register(self, engine, methods: list[str] = ENGINE_METHODS, prefix: str = ""):
+        with self._lock:
+            self._engines.append((engine, methods, prefix))
+            if self.enabled:
+                self._instrument(engine, methods, prefix)
+
+    def enable(self):
+        with self._lock:
+            if self.enabled:
+                return
+            self.enabled = True
+            for engine, methods, prefix in self._engines:
+                self._instrument(engine, methods, prefix)
+
+    def disable(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            for engine, methods, prefix in self._engines:
+                for name in methods:
+                    engine.__dict__.pop(name, None)
+
+    def _instrument(self, engine, methods: list[str], prefix: str):
+        for name in methods:
+            setattr(engine, name, self._wrap(prefix + name, getattr(engine, name)))
+
+    def reset(self):
+        self.actions = {}
+
+    def _stats(self) -> ActionStats:
+        stats = self.actions.get(self.action)
+        if stats == None:
+            stats = ActionStats()
+            self.actions[self.action] = stats
+        return stats
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            calls = self._stats().calls
+            histogram = calls.get(name)
+            if histogram == None:
+                histogram = Histogram()
+                calls[name] = histogram
+            histogram.add(seconds)
+
+    # records whether a lookup in one of the caches was answered from the cache
+    def cacheLookup(self, name: str, hit: bool):
+        with self._lock:
+            counts = self._stats().cache.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def _wrap(self, name: str, method):
+        if inspect.iscoroutinefunction(method):
+            async def timedAsync(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return timedAsync
+        if inspect.isgeneratorfunction(method):
+            # every result counts as a call, e.g. the wait for the next position of EnginePool.imap
+            def timedGenerator(*args, **kwargs):
+                results = method(*args, **kwargs)
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        result = next(results)
+                    except StopIteration:
+                        return
+                    self.record(name, time.perf_counter() - start)
+                    yield result
+            return timedGenerator
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    # Runs the function and records its latency if profiling is enabled.
+    # For the work between the engine calls, like rendering.
+    def timed(self, name: str, function, *args, **kwargs):
+        if not self.enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def toJson(self) -> dict:
+        result = {}
+        for action, stats in self.actions.items():
+            result[action] = {
+                "calls": {name: histogram.toJson() for name, histogram in stats.calls.items()},
+                "cache": {name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)} for name, (hits, misses) in stats.cache.items()}
+            }
+        return result
+
+    def export(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.toJson(), file, indent=2)
+
+    def report(self) -> str:
+        lines = []
+        for action, stats in self.actions.items():
+            lines.append(f"== {action}")
+            lines.append(f"  {'call':<36} {'count':>7} {'total ms':>10} {'avg ms':>9} {'p90 ms':>9} {'max ms':>9}")
+            for name, histogram in sorted(stats.calls.items(), key=lambda item: -item[1].total):
+                lines.append(f"  {name:<36} {histogram.count:>7} {histogram.total * 1000:>10.1f} {histogram.total / histogram.count * 1000:>9.2f} {histogram.percentile(0.9) * 1000:>9.2f} {histogram.max * 1000:>9.2f}")
+            for name, (hits, misses) in stats.cache.items():
+                lines.append(f"  cache {name}: {hits} hits, {misses} misses, {hits / (hits + misses) * 100:.0f}% hit rate")
+        if len(lines) == 0:
+            lines.append("Nothing recorded yet.")
+        return "\n".join(lines)
+
+PROFILER = Profiler()
@@ -0,0 +1,280 @@
+#!python3
+# Analysis server for several users, sharing one engine pool and one cache.
+# Answers HTTP GET requests with JSON. Every position is searched at most once at a time: a request for a position
+# that is already being searched waits for that search instead of starting another one (coalescing).
+# When more positions are waiting than the queue allows, requests are refused with 503 and a Retry-After header,
+# so clients back off instead of piling up work. /metrics reports the queue depth and the hit rates.
+#
+# python server.py --port 8765 --processes 4
+#
+# GET /info                                  engine parameters, depth and MultiPV of the server
+# GET /analysis?fen=...&multipv=4&depth=20   analysis record, see analysis.py
+# GET /eval?fen=...                          evaluation, like chess.getEval
+# GET /bestmoves?fen=...&moves=3             best moves, like chess.getBestMoves
+# GET /wdl?fen=...                           WDL stats, like chess.getWDL
+# GET /resolve?fen=...&move=Nf3              move in long algebraic notation, like chess.resolveMove, with its warnings
+# GET /metrics                               queue depth and counters
+#
+# The interactive program uses the server instead of its own engines with PYCHESS_SERVER=http://127.0.0.1:8765,
+# see analysisclient.py
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from board import Board
+from movegen import legalMoves
+from fen import parseFen
+from analysis import ANALYSIS_PARAMS, analysisCovers, analysisEval, analysisWDL, analysisBestMoves
+from analysiscache import AnalysisCache
+from chess import ENGINE_PATH, ENGINE_DEPTH, ENGINE_PARAMS, resolveMove, getBookMoves
+from config import loadConfig
+
+DEFAULT_PORT = 8765
+
+# raised when the queue is full, the client should try again later
+class Overloaded(Exception):
+    pass
+
+# raised when a search did not finish in time, e.g. because its engine process died
+class SearchTimeout(Exception):
+    pass
+
+class AnalysisService:
+    def __init__(self, pool, cache: AnalysisCache, params: dict, multipv: int, depth: int, maxQueue: int = 64, searchTimeout: float = 300):
+        self.pool = pool
+        self.cache = cache
+        self.params = params            # analysis params of the engines, see analysis.getAnalysisParams
+        self.multipv = multipv
+        self.depth = depth
+        self.maxQueue = maxQueue        # searches that may be queued or running at the same time
+        self.searchTimeout = searchTimeout  # seconds a request waits for its search
+        self.counters = {"requests": 0, "hits": 0, "coalesced": 0, "searches": 0, "rejected": 0, "errors": 0, "timeouts": 0}
+        self._searching = {}            # key -> (future, multipv, depth) of the latest search of the position
+        self._jobs = {}                 # job id -> (board, future, start time) of queued and running searches
+        self._searchTime = 0.0          # seconds of the finished searches, from queueing to the result
+        self._finished = 0
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._readResults, daemon=True)
+        self._reader.start()
+
+    # Analysis of the position with at least multipv lines and depth. Blocks until the search is done.
+    # Raises Overloaded if a search would have to be queued while the queue is full
+    # and SearchTimeout if the search does not finish within searchTimeout.
+    def analyze(self, board: Board, multipv: int = 0, depth: int = 0) -> dict:
+        multipv = max(multipv, self.multipv)
+        depth = depth if depth > 0 else self.depth
+        with self._lock:
+            self.counters["requests"] += 1
+            analysis = self.cache.get(board)
+            if analysisCovers(analysis, multipv, depth, self.params):
+                self.counters["hits"] += 1
+                return analysis
+            searching = self._searching.get(board.key)
+            if searching != None and searching[1] >= multipv and searching[2] >= depth:
+                self.counters["coalesced"] += 1
+                future = searching[0]
+            else:
+                if len(self._jobs) >= self.maxQueue:
+                    self.counters["rejected"] += 1
+                    raise Overloaded(f"{len(self._jobs)} searches queued")
+                future = concurrent.futures.Future()
+                idx = self.pool.submit(board.fen, multipv, depth)
+                self._jobs[idx] = (board, future, time.perf_counter())
+                # requests that wait for an earlier, shallower search of the position keep waiting for that one
+                self._searching[board.key] = (future, multipv, depth)
+                self.counters["searches"] += 1
+        try:
+            return future.result(timeout=self.searchTimeout)
+        except concurrent.futures.TimeoutError:
+            with self._lock:
+                self.counters["timeouts"] += 1
+                # the engine may have died with the search, the next request for the position searches again
+                searching = self._searching.get(board.key)
+                if searching != None and searching[0] == future:
+                    del self._searching[board.key]
+                for idx in [idx for idx, job in self._jobs.items() if job[1] == future]:
+                    del self._jobs[idx]
+            raise SearchTimeout(f"no result after {self.searchTimeout:g}s")
+
+    def _readResults(self):
+        while True:
+            idx, analysis, error = self.pool.nextResult()
+            with self._lock:
+                job = self._jobs.pop(idx, None)
+                if job == None:
+                    continue
+                board, future, start = job
+                self._searchTime += time.perf_counter() - start
+                self._finished += 1
+                searching = self._searching.get(board.key)
+                if searching != None and searching[0] == future:
+                    del self._searching[board.key]
+                if error == None:
+                    # a deeper search of the position may have finished first
+                    if not analysisCovers(self.cache.get(board), analysis["multipv"], analysis["depth"], self.params):
+                        self.cache.put(board, analysis)
+                else:
+                    self.counters["errors"] += 1
+            if error == None:
+                future.set_result(analysis)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self.counters)
+            metrics["queueDepth"] = len(self._jobs)
+            metrics["maxQueue"] = self.maxQueue
+            metrics["processes"] = self.pool.processes
+            metrics["hitRate"] = self.counters["hits"] / self.counters["requests"] if self.counters["requests"] > 0 else 0
+            metrics["averageSearchSeconds"] = self._searchTime / self._finished if self._finished > 0 else 0
+        metrics["cache"] = self.cache.stats()
+        return metrics
+
+    def info(self) -> dict:
+        return {"params": self.params, "multipv": self.multipv, "depth": self.depth, "processes": self.pool.processes}
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service = None          # AnalysisService, set by serve()
+    book = None             # opening book for /bestmoves, see book.py
+    retryAfter = 1          # seconds clients should wait when the server is overloaded
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {name: values[0] for name, values in urllib.parse.parse_qs(url.query).items()}
+        try:
+            handler = ROUTES.get(url.path)
+            if handler == None:
+                self._send(404, {"error": f"unknown path {url.path}"})
+                return
+            self._send(200, handler(self, query))
+        except Overloaded as ex:
+            self._send(503, {"error": f"overloaded, {ex}"}, {"Retry-After": str(self.retryAfter)})
+        except SearchTimeout as ex:
+            self._send(504, {"error": f"search timed out, {ex}"})
+        except (ValueError, KeyError) as ex:
+            self._send(400, {"error": str(ex)})
+        except RuntimeError as ex:
+            self._send(500, {"error": str(ex)})
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body, separators=(',', ':')).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers if headers != None else {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # one line per request is too much with many clients
+        pass
+
+    def _board(self, query: dict) -> Board:
+        if not "fen" in query:
+            raise ValueError("missing fen")
+        return parseFen(query["fen"])
+
+    def _analysis(self, query: dict) -> dict:
+        return self.service.analyze(self._board(query), int(query.get("multipv", "0")), int(query.get("depth", "0")))
+
+    def analysis(self, query: dict) -> dict:
+        return self._analysis(query)
+
+    def eval(self, query: dict) -> dict:
+        return analysisEval(self._analysis(query), self._board(query))
+
+    def wdl(self, query: dict) -> dict:
+        return {"wdl": analysisWDL(self._analysis(query))}
+
+    def bestMoves(self, query: dict) -> dict:
+        board = self._board(query)
+        moves = int(query.get("moves", "0"))
+        moves = moves if moves > 0 else self.service.multipv
+        if query.get("book", "1") != "0":
+            bookMoves = getBookMoves(board, self.book)
+            if len(bookMoves) > 0:
+                return {"moves": [{"Move": move["Move"], "Centipawn": None, "Mate": None, "Weight": move["Weight"]} for move in bookMoves[0:moves]]}
+        return {"moves": analysisBestMoves(self.service.analyze(board, moves, int(query.get("depth", "0"))), moves)}
+
+    def resolve(self, query: dict) -> dict:
+        board = self._board(query)
+        # warnings go to the client instead of the server's output
+        warnings = []
+        move = resolveMove(board, query.get("move", ""), warnings=warnings)
+        if not move in legalMoves(board):
+            raise ValueError(move)
+        return {"move": move, "warnings": warnings}
+
+    def info(self, query: dict) -> dict:
+        return self.service.info()
+
+    def metrics(self, query: dict) -> dict:
+        return self.service.metrics()
+
+ROUTES = {
+    "/analysis": RequestHandler.analysis,
+    "/eval": RequestHandler.eval,
+    "/wdl": RequestHandler.wdl,
+    "/bestmoves": RequestHandler.bestMoves,
+    "/resolve": RequestHandler.resolve,
+    "/info": RequestHandler.info,
+    "/metrics": RequestHandler.metrics,
+}
+
+def serve(service: AnalysisService, host: str, port: int, book = None) -> ThreadingHTTPServer:
+    RequestHandler.service = service
+    RequestHandler.book = book
+    return ThreadingHTTPServer((host, port), RequestHandler)
+
+def main():
+    try:
+        config = loadConfig(ENGINE_PATH, ENGINE_DEPTH, ENGINE_PARAMS)
+    except ValueError as ex:
+        sys.exit(f"Error: {ex}")
+    parser = argparse.ArgumentParser(description="Serve engine analysis to several clients over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--engine", default=config["engine"], help="path to the stockfish binary")
+    parser.add_argument("--depth", type=int, default=config["depth"])
+    parser.add_argument("--multipv", type=int, default=config["parameters"]["MultiPV"], help="lines of every search")
+    parser.add_argument("--processes", type=int, default=config["processes"] if config["processes"] > 0 else max(1, (os.cpu_count() or 2) // 2), help="number of engine processes")
+    parser.add_argument("--threads", type=int, default=2, help="threads per engine process")
+    parser.add_argument("--hash", type=int, default=config["parameters"]["Hash"], help="hash size in MB per engine process")
+    parser.add_argument("--max-queue", type=int, default=64, help="searches that may be queued before requests are refused")
+    parser.add_argument("--search-timeout", type=float, default=300, help="seconds a request waits for its search before it fails with 504")
+    parser.add_argument("--cache", default=config["cache"], help="persistent analysis store to read from and write to")
+    parser.add_argument("--cache-memory", type=int, default=config["cache_memory"], help="MB of memory for cached analysis")
+    parser.add_argument("--book", default=config["book"], help="Polyglot opening book for /bestmoves")
+    args = parser.parse_args()
+
+    from enginepool import EnginePool
+    params = dict(config["parameters"])
+    params["MultiPV"] = args.multipv
+    store = None
+    if args.cache != "":
+        from analysisstore import AnalysisStore
+        store = AnalysisStore(args.cache, maxEntries=config["cache_entries"])
+    cache = AnalysisCache(args.cache_memory * 1024 * 1024, store)
+    book = None
+    if args.book != "":
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    with EnginePool(args.engine, processes=args.processes, threads=args.threads, hash=args.hash, depth=args.depth, parameters=params) as pool:
+        service = AnalysisService(pool, cache, {name: params.get(name) for name in ANALYSIS_PARAMS}, args.multipv, args.depth, args.max_queue, args.search_timeout)
+        server = serve(service, args.host, args.port, book)
+        print(f"Serving on http://{args.host}:{args.port} with {args.processes} engines.", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Static evaluation: a rough score of a position from the pieces alone, without a search.
+# It is shown right away while the engine is still searching, it is no replacement for the engine's evaluation.
+# The score is made of material and piece-square tables (blended between middle game and end game by the material left),
+# mobility of the sliding pieces and pawn structure (doubled, isolated and passed pawns).
+# Positions are rows of 64 piece codes, so many positions are scored at once with a few NumPy operations,
+# for example all positions after the legal moves of a position (see staticMoveEvals).
+import numpy as np
+from board import Board
+from movegen import legalMoves, makeMove
+
+# piece code of a square, 0 is empty, white pieces are 1 to 6 and black pieces 7 to 12
+PIECE_CODES = {None: 0, 'P': 1, 'N': 2, 'B': 3, 'R': 4, 'Q': 5, 'K': 6, 'p': 7, 'n': 8, 'b': 9, 'r': 10, 'q': 11, 'k': 12}
+PAWN = 1
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+
+MATERIAL = [0, 100, 320, 330, 500, 900, 0]
+
+# piece-square tables for white as seen from white's side, the first row is rank 8
+PAWN_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0]
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+ROOK_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0]
+QUEEN_TABLE = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20]
+KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20]
+# in the end game the king belongs in the center
+KING_END_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+# weight of the pieces for the game phase, 24 is the start position
+PHASE = [0, 0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+# centipawns per attacked square of the sliding pieces, relative to the usual number of squares
+MOBILITY = {BISHOP: (5, 7), ROOK: (3, 7), QUEEN: (1, 14)}
+
+DOUBLED_PAWN = 15
+ISOLATED_PAWN = 15
+# bonus of a passed pawn by rank, from the side of the pawn
+PASSED_PAWN = [0, 5, 10, 20, 35, 60, 100, 0]
+
+def _scoreTable(tables: list) -> np.ndarray:
+    # score of every piece code on every square, including material, positive for white
+    table = np.zeros((13, 64), dtype=np.int32)
+    for piece in range(1, 7):
+        # a1 first
+        white = np.flipud(np.array(tables[piece], dtype=np.int32).reshape(8, 8)).ravel() + MATERIAL[piece]
+        table[piece] = white
+        # black uses the table of white mirrored along the middle of the board
+        table[piece + 6] = -white.reshape(8, 8)[::-1].ravel()
+    return table
+
+MIDDLE_GAME = _scoreTable([None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE])
+END_GAME = _scoreTable([None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_END_TABLE])
+PHASES = np.array(PHASE + PHASE[1:], dtype=np.int32)
+
+def _slidingRays() -> tuple:
+    # RAYS[sq, direction] are the squares from sq to the edge, padded with 64
+    # the first four directions are the rook's, the last four the bishop's
+    directions = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+    rays = np.full((64, 8, 7), 64, dtype=np.int32)
+    lengths = np.zeros((64, 8), dtype=np.int32)
+    for sq in range(0, 64):
+        for d, (df, dr) in enumerate(directions):
+            f, r = (sq & 7) + df, (sq >> 3) + dr
+            while 0 <= f < 8 and 0 <= r < 8:
+                rays[sq, d, lengths[sq, d]] = r * 8 + f
+                lengths[sq, d] += 1
+                f, r = f + df, r + dr
+    return rays, lengths
+
+RAYS, RAY_LENGTHS = _slidingRays()
+
+def _mobilityWeights() -> tuple:
+    # by piece code: weight of the attacked squares along rook rays and bishop rays, and the usual score to subtract
+    straight = np.zeros(13, dtype=np.int32)
+    diagonal = np.zeros(13, dtype=np.int32)
+    base = np.zeros(13, dtype=np.int32)
+    for piece, (weight, usual) in MOBILITY.items():
+        for code, sign in [(piece, 1), (piece + 6, -1)]:
+            if piece in [ROOK, QUEEN]:
+                straight[code] = sign * weight
+            if piece in [BISHOP, QUEEN]:
+                diagonal[code] = sign * weight
+            base[code] = sign * weight * usual
+    return straight, diagonal, base
+
+STRAIGHT_MOBILITY, DIAGONAL_MOBILITY, MOBILITY_BASE = _mobilityWeights()
+
+def encodeBoards(boards: list[Board]) -> np.ndarray:
+    # one row of piece codes per board
+    return np.array([[PIECE_CODES[piece] for piece in board.squares] for board in boards], dtype=np.int32).reshape(len(boards), 64)
+
+def _material(codes: np.ndarray) -> np.ndarray:
+    squares = np.arange(64)
+    middle = MIDDLE_GAME[codes, squares].sum(axis=1)
+    end = END_GAME[codes, squares].sum(axis=1)
+    phase = np.minimum(PHASES[codes].sum(axis=1), MAX_PHASE)
+    return (middle * phase + end * (MAX_PHASE - phase)) // MAX_PHASE
+
+def _mobility(codes: np.ndarray) -> np.ndarray:
+    # squares attacked by the sliding pieces: the empty squares of a ray up to the first piece and that piece
+    occupied = np.ones((len(codes), 65), dtype=bool)
+    occupied[:, 0:64] = codes != 0
+    empty = ~occupied[:, RAYS]
+    reach = np.cumprod(empty, axis=3).sum(axis=3)
+    reach += reach < RAY_LENGTHS
+    straight = reach[:, :, 0:4].sum(axis=2)
+    diagonal = reach[:, :, 4:8].sum(axis=2)
+    return (STRAIGHT_MOBILITY[codes] * straight + DIAGONAL_MOBILITY[codes] * diagonal - MOBILITY_BASE[codes]).sum(axis=1)
+
+def _neighbourFiles(files: np.ndarray, fill: int, reduce) -> np.ndarray:
+    # combines the values of the two neighbouring files of every file
+    padded = np.pad(files, ((0, 0), (1, 1)), constant_values=fill)
+    return reduce(padded[:, 0:8], padded[:, 2:10])
+
+def _pawnStructure(codes: np.ndarray) -> np.ndarray:
+    grid = codes.reshape(len(codes), 8, 8)  # [position, rank, file]
+    white = grid == PAWN
+    black = grid == PAWN + 6
+    ranks = np.arange(8).reshape(1, 8, 1)
+    score = np.zeros(len(codes), dtype=np.int32)
+    for pawns, sign in [(white, 1), (black, -1)]:
+        files = pawns.sum(axis=1)
+        doubled = np.maximum(files - 1, 0).sum(axis=1)
+        isolated = (files * (_neighbourFiles(files, 0, np.maximum) == 0)).sum(axis=1)
+        score -= sign * (DOUBLED_PAWN * doubled + ISOLATED_PAWN * isolated)
+    # a pawn is passed if no enemy pawn on its file or the neighbouring files is in front of it
+    blackRanks = np.where(black, ranks, -1).max(axis=1)     # most advanced black pawn of every file from white's side
+    whiteRanks = np.where(white, ranks, 8).min(axis=1)
+    blackFront = np.maximum(blackRanks, _neighbourFiles(blackRanks, -1, np.maximum))
+    whiteFront = np.minimum(whiteRanks, _neighbourFiles(whiteRanks, 8, np.minimum))
+    passedWhite = white & (ranks >= blackFront[:, None, :])
+    passedBlack = black & (ranks <= whiteFront[:, None, :])
+    bonus = np.array(PASSED_PAWN).reshape(1, 8, 1)
+    score += (passedWhite * bonus).sum(axis=(1, 2)) - (passedBlack * bonus[:, ::-1]).sum(axis=(1, 2))
+    return score
+
+# centipawns of every position, positive is advantage for white
+def staticEvals(boards: list[Board]) -> list[int]:
+    if len(boards) == 0:
+        return []
+    codes = encodeBoards(boards)
+    return [int(score) for score in _material(codes) + _mobility(codes) + _pawnStructure(codes)]
+
+# static evaluation in the format of Stockfish.get_evaluation, positive is advantage for white
+def staticEval(board: Board) -> dict:
+    return {"type": "cp", "value": staticEvals([board])[0]}
+
+# Every legal move with the static evaluation of the position after it as [{"Move", "Centipawn"}],
+# the best move for the side to move first. Centipawn is positive for white, like the engine's lines.
+def staticMoveEvals(board: Board) -> list[dict]:
+    moves = legalMoves(board)
+    boards = []
+    for move in moves:
+        after = board.copy()
+        makeMove(after, move)
+        boards.append(after)
+    lines = [{"Move": move, "Centipawn": score} for move, score in zip(moves, staticEvals(boards))]
+    lines.sort(key=lambda line: line["Centipawn"], reverse=board.whiteToMove)
+    return lines
@@ -0,0 +1,31 @@
+from board import Board, START_FEN
+from analysis import Budget, deepenAnalysis
+from analysiscache import AnalysisCache
+from fakeengine import FakeProcess, FakeStockfish
+from ucidriver import UciEngine
+
+# an engine that runs out of time before it completes the first depth
+class NoDepthProcess(FakeProcess):
+    def _go(self, tokens: list[str]):
+        self.output.append("bestmove e2e4")
+
+def test_search_without_a_depth_is_not_cached():
+    stockfish = UciEngine("fake", 10, process=NoDepthProcess())
+    board = Board(START_FEN)
+    cache = AnalysisCache()
+    stockfish.set_fen_position(board.fen)
+    analysis = deepenAnalysis(stockfish, board, cache, 1, Budget(10, movetime=1))
+    assert analysis["depth"] == 0
+    assert analysis["lines"] == []
+    assert cache.get(board) == None
+
+def test_position_without_moves_is_complete():
+    stockfish = FakeStockfish(depth=10)
+    # fool's mate
+    board = Board("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+    cache = AnalysisCache()
+    stockfish.set_fen_position(board.fen)
+    analysis = deepenAnalysis(stockfish, board, cache, 1, Budget(10, movetime=1))
+    assert analysis["depth"] == 10
+    assert analysis["lines"] == []
+    assert cache.get(board) == analysis
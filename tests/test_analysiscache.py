@@ -0,0 +1,75 @@
+import itertools
+import types
+import analysisstore
+from board import Board, START_FEN
+from movegen import makeMove
+from analysiscache import AnalysisCache
+from analysisstore import AnalysisStore
+
+PARAMS = {"Threads": 1, "Hash": 16}
+
+def line(move: str, centipawn: int = None, mate: int = None, wdl: list = None) -> dict:
+    return {"Move": move, "Centipawn": centipawn, "Mate": mate, "WDL": wdl}
+
+def analysis(lines: list[dict], depth: int = 12) -> dict:
+    return {"depth": depth, "multipv": len(lines), "params": dict(PARAMS), "lines": lines}
+
+def positions(count: int) -> list[Board]:
+    boards = []
+    board = Board(START_FEN)
+    for move in ["g1f3", "g8f6", "f3g1", "f6g8"][:count]:
+        boards.append(board.copy())
+        makeMove(board, move)
+    return boards
+
+def test_pack_round_trip():
+    cache = AnalysisCache()
+    record = analysis([
+        line("e2e4", centipawn=35, wdl=[120, 800, 80]),
+        line("a7a8q", mate=-3),
+        line("e1g1", centipawn=-1250),
+    ])
+    record["moveLines"] = [[line("h2h4", centipawn=-20), line("e2e4", centipawn=35, wdl=[1000, 0, 0])]]
+    assert cache.pack(record).unpack() == record
+
+def test_records_share_their_params():
+    cache = AnalysisCache()
+    first = cache.pack(analysis([line("e2e4", centipawn=35)]))
+    second = cache.pack(analysis([line("d2d4", centipawn=30)]))
+    assert first.params is second.params
+
+def test_least_recently_used_is_evicted_by_size():
+    record = analysis([line("e2e4", centipawn=35)])
+    size = AnalysisCache().pack(record).size()
+    cache = AnalysisCache(maxBytes=size * 2)
+    first, second, third = positions(3)
+    cache.put(first, record)
+    cache.put(second, record)
+    # using the first position makes the second the least recently used
+    assert cache.get(first) == record
+    cache.put(third, record)
+    assert cache.bytes == size * 2
+    assert cache.evictions == 1
+    assert cache.get(second) == None
+    assert cache.get(first) == record
+    assert cache.get(third) == record
+
+def test_preload_fills_the_budget_with_the_most_recent(tmp_path, monkeypatch):
+    # every write is a little later than the one before
+    clock = itertools.count(1000.0)
+    monkeypatch.setattr(analysisstore, "time", types.SimpleNamespace(time=lambda: next(clock)))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    record = analysis([line("e2e4", centipawn=35)])
+    boards = positions(4)
+    writer = AnalysisCache(store=store)
+    for board in boards:
+        writer.put(board, record)
+    size = writer.pack(record).size()
+    cache = AnalysisCache(maxBytes=size * 2, store=store)
+    assert cache.preload() == 2
+    assert len(cache) == 2
+    store.close()
+    cache.store = None
+    assert cache.get(boards[3]) == record
+    assert cache.get(boards[2]) == record
+    assert cache.get(boards[0]) == None
@@ -0,0 +1,67 @@
+import pytest
+from board import Board, START_FEN
+from game import Game
+from analysis import runAnalysis, classifyMove, rateMove, lineEval
+from analysiscache import AnalysisCache
+from annotate import annotateGame
+from fakeengine import FakeStockfish
+
+# stands in for the engine pool (see enginepool.py), searching the positions one after another in the process
+class FakePool:
+    def __init__(self, depth: int):
+        self.stockfish = FakeStockfish(depth=depth)
+
+    def imap(self, fens, multipv: int = 1, depth: int = 0):
+        for fen in fens:
+            self.stockfish.set_fen_position(fen, False)
+            yield runAnalysis(self.stockfish, Board(fen), multipv, depth)
+
+def playedGame(moves: list[str]) -> Game:
+    game = Game(START_FEN)
+    for move in moves:
+        game.push(move)
+    return game
+
+@pytest.mark.parametrize("rating, moveClass", [
+    (0, None), (-49, None), (-50, "inaccuracy"), (-99, "inaccuracy"),
+    (-100, "mistake"), (-299, "mistake"), (-300, "blunder"), (-5000, "blunder"),
+])
+def test_classification_thresholds(rating: int, moveClass: str):
+    assert classifyMove(rating) == moveClass
+
+def test_rate_move():
+    # the best move is "best" whatever the evaluations say, better evaluations are capped at 0
+    assert rateMove("e2e4", "e2e4", {"type": "cp", "value": 30}, {"type": "cp", "value": -500}, True) == (-530, "best")
+    assert rateMove("d2d4", "e2e4", {"type": "cp", "value": 30}, {"type": "cp", "value": 80}, True) == (0, None)
+    # for black a higher evaluation is worse
+    assert rateMove("d7d5", "e7e5", {"type": "cp", "value": -50}, {"type": "cp", "value": 60}, False) == (-110, "mistake")
+    # walking into a mate
+    assert rateMove("g7g5", "e7e5", {"type": "cp", "value": 0}, {"type": "mate", "value": 1}, False)[1] == "blunder"
+
+def test_annotations_follow_the_evaluations():
+    # 2. Qg4 leaves the queen to the bishop on c8
+    game = playedGame(["e2e4", "d7d5", "d1g4", "c8g4"])
+    stockfish = FakeStockfish(depth=4)
+    pool = FakePool(4)
+    annotations = annotateGame(stockfish, pool, game, AnalysisCache())
+    assert [annotation["Move"] for annotation in annotations] == game.moves
+    assert [annotation["Ply"] for annotation in annotations] == [1, 2, 3, 4]
+    for annotation, board in zip(annotations, game.boards()):
+        pool.stockfish.set_fen_position(board.fen, False)
+        best = runAnalysis(pool.stockfish, board, 1, 4)["lines"][0]
+        assert annotation["Before"] == lineEval(best)
+        assert annotation["Best"] == best["Move"]
+    for annotation, following in zip(annotations, annotations[1:]):
+        assert annotation["After"] == following["Before"]
+    assert annotations[2]["Class"] == "blunder"
+    assert annotations[2]["Best"] == "e4d5"
+    assert annotations[3]["Class"] == "best"
+
+def test_annotate_with_a_tiny_cache():
+    game = playedGame(["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6", "b5a4", "g8f6", "e1g1", "f8e7"])
+    cache = AnalysisCache(maxBytes=1)
+    annotations = annotateGame(FakeStockfish(depth=4), FakePool(4), game, cache)
+    # the cache keeps only the last position
+    assert len(cache) == 1
+    assert len(annotations) == len(game.moves)
+    assert all(annotation["Before"] != None and annotation["After"] != None for annotation in annotations)
@@ -0,0 +1,60 @@
+from board import Board, START_FEN, squareIndex
+from book import OpeningBook, ENTRY
+
+CASTLING_FEN = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+PROMOTION_FEN = "4k3/1P6/8/8/8/8/8/4K3 w - - 0 1"
+
+# the move as Polyglot stores it: to square, from square and promotion piece in 3 bits each above
+def rawMove(move: str) -> int:
+    promotion = ["", "n", "b", "r", "q"].index(move[4:])
+    return squareIndex(move[2:4]) | squareIndex(move[0:2]) << 6 | promotion << 12
+
+# writes a book with the entries (fen, move, weight), sorted by key like a Polyglot book
+def writeBook(path, entries: list[tuple]) -> OpeningBook:
+    rows = sorted((Board(fen).key, rawMove(move), weight) for fen, move, weight in entries)
+    with open(path, "wb") as file:
+        for key, raw, weight in rows:
+            file.write(ENTRY.pack(key, raw, weight, 0))
+    return OpeningBook(str(path))
+
+def test_lookup(tmp_path):
+    book = writeBook(tmp_path / "book.bin", [
+        (START_FEN, "e2e4", 10),
+        (START_FEN, "d2d4", 12),
+        (CASTLING_FEN, "e1h1", 1),
+        (PROMOTION_FEN, "b7b8q", 3),
+    ])
+    assert book.entries == 4
+    assert book.lookup(Board(START_FEN)) == [{"Move": "d2d4", "Weight": 12}, {"Move": "e2e4", "Weight": 10}]
+    assert book.lookup(Board(PROMOTION_FEN)) == [{"Move": "b7b8q", "Weight": 3}]
+    book.close()
+
+def test_weights_of_the_same_move_are_summed(tmp_path):
+    book = writeBook(tmp_path / "book.bin", [
+        (START_FEN, "e2e4", 10),
+        (START_FEN, "d2d4", 12),
+        (START_FEN, "e2e4", 5),
+    ])
+    assert book.lookup(Board(START_FEN)) == [{"Move": "e2e4", "Weight": 15}, {"Move": "d2d4", "Weight": 12}]
+    book.close()
+
+def test_castling_is_translated(tmp_path):
+    book = writeBook(tmp_path / "book.bin", [
+        (CASTLING_FEN, "e1h1", 4),
+        (CASTLING_FEN, "e1a1", 2),
+    ])
+    assert book.lookup(Board(CASTLING_FEN)) == [{"Move": "e1g1", "Weight": 4}, {"Move": "e1c1", "Weight": 2}]
+    book.close()
+
+def test_illegal_moves_are_dropped(tmp_path):
+    book = writeBook(tmp_path / "book.bin", [(START_FEN, "e2e5", 100), (START_FEN, "g1f3", 1)])
+    assert book.lookup(Board(START_FEN)) == [{"Move": "g1f3", "Weight": 1}]
+    book.close()
+
+def test_position_not_in_the_book(tmp_path):
+    book = writeBook(tmp_path / "book.bin", [(START_FEN, "e2e4", 10), (CASTLING_FEN, "e1h1", 1)])
+    assert book.lookup(Board(PROMOTION_FEN)) == []
+    book.close()
+    single = writeBook(tmp_path / "single.bin", [(START_FEN, "e2e4", 1)])
+    assert single.lookup(Board(CASTLING_FEN)) == []
+    single.close()
@@ -0,0 +1,32 @@
+import pytest
+from board import START_FEN
+from fen import parseFen, validateFens
+
+def test_good_fen():
+    board = parseFen("r3k2r/pppq1ppp/2n2n2/3pp3/1b1PP3/2N2N2/PPPQ1PPP/R3K2R b KQkq e3 4 8")
+    assert board.fen == "r3k2r/pppq1ppp/2n2n2/3pp3/1b1PP3/2N2N2/PPPQ1PPP/R3K2R b KQkq e3 4 8"
+    assert not board.whiteToMove
+
+def test_row_too_short():
+    with pytest.raises(ValueError, match="expected 8 columns, got 7 in row 2"):
+        parseFen("rnbqkbnr/ppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+
+def test_row_too_long():
+    # only the last row used to be checked
+    with pytest.raises(ValueError, match="expected 8 columns, got 9 in row 3"):
+        parseFen("rnbqkbnr/pppppppp/8p/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+
+# the old regex accepted '|' in the side to move and castling fields
+@pytest.mark.parametrize("fen, message", [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR | KQkq - 0 1", "side to move"),
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w K|q - 0 1", "castling"),
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNB|KBNR w KQkq - 0 1", "invalid character '\\|'"),
+])
+def test_pipe_is_rejected(fen: str, message: str):
+    with pytest.raises(ValueError, match=message):
+        parseFen(fen)
+
+def test_validate_fens_reports_every_line():
+    lines = ["# positions", START_FEN, "", "8/8/8/8/8/8/8/8 w - - 0 1"]
+    results = list(validateFens(lines))
+    assert [(lineNumber, error == None) for lineNumber, fen, error in results] == [(2, True), (4, False)]
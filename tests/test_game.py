@@ -0,0 +1,57 @@
+from board import START_FEN
+from game import Game
+
+def playedGame() -> Game:
+    game = Game(START_FEN)
+    for move in ["e2e4", "e7e5", "g1f3"]:
+        game.push(move)
+    return game
+
+def test_declining_the_next_move_keeps_the_game():
+    game = playedGame()
+    game.goto(0)
+    dropped = game.push("e2e4")
+    assert dropped == None
+    game.pop(dropped)
+    assert game.moves == ["e2e4", "e7e5", "g1f3"]
+    assert game.ply == 0
+
+def test_declining_another_move_restores_the_game():
+    game = playedGame()
+    game.goto(1)
+    dropped = game.push("c7c5")
+    assert game.moves == ["e2e4", "c7c5"]
+    game.pop(dropped)
+    assert game.moves == ["e2e4", "e7e5", "g1f3"]
+    assert game.ply == 1
+
+def test_declining_a_new_move_removes_it():
+    game = playedGame()
+    dropped = game.push("b8c6")
+    game.pop(dropped)
+    assert game.moves == ["e2e4", "e7e5", "g1f3"]
+    assert game.ply == 3
+
+def test_set_root_keeps_the_earlier_positions():
+    game = playedGame()
+    fen = game.board.fen
+    game.setRoot(fen.replace(" b ", " w "))
+    history = game.history()
+    assert len(history) == 5
+    assert history[3] == (0, 3, "g1f3", fen)
+    game.goto(3, 0)
+    assert game.segment == 0
+    assert game.board.fen == fen
+    assert game.moves == ["e2e4", "e7e5", "g1f3"]
+    game.goto(0, 1)
+    assert game.board.fen == fen.replace(" b ", " w ")
+
+def test_last_moves_match_the_replayed_game():
+    game = playedGame()
+    game.push("b8c6")
+    boards = game.boards()
+    assert [(before.fen, move) for before, move in game.lastMoves(2)] == [(boards[2].fen, "g1f3"), (boards[3].fen, "b8c6")]
+    assert [move for before, move in game.lastMoves(10)] == ["e2e4", "e7e5", "g1f3", "b8c6"]
+    game.goto(1)
+    assert [move for before, move in game.lastMoves(10)] == ["e2e4"]
+    assert game.board.fen == boards[1].fen
@@ -0,0 +1,13 @@
+import pytest
+from board import Board
+from movegen import perft, PERFT_SUITE
+
+# the node counts of the suite up to depth 3, deeper ones take too long for every test run (python movegen.py 4)
+@pytest.mark.parametrize("fen, depth, nodes", [(fen, depth, counts[depth - 1]) for fen, counts in PERFT_SUITE for depth in range(1, min(3, len(counts)) + 1)])
+def test_perft(fen: str, depth: int, nodes: int):
+    board = Board(fen)
+    key = board.key
+    assert perft(board, depth) == nodes
+    # every move was taken back
+    assert board.key == key
+    assert board.fen == fen
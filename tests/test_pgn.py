@@ -0,0 +1,66 @@
+import pytest
+from board import Board, START_FEN
+from movegen import legalMoves, makeMove
+from pgn import readGames, sanToMove, moveToSan
+from analysistree import AnalysisTree
+
+# castling both ways, promotions with and without capture, en passant and pieces that need disambiguation
+@pytest.mark.parametrize("fen", [
+    START_FEN,
+    "r3k2r/pPp2ppp/8/3pP3/8/8/P1P2PPP/R3K2R w KQkq d6 0 1",
+    "r3k2r/ppp2ppp/8/8/3pP3/8/PPpP1PPP/R3K2R b KQkq e3 0 1",
+    "4k3/8/8/1N3N2/8/1N3N2/8/4K3 w - - 0 1",
+    "4k3/R7/8/8/8/8/R7/4K3 w - - 0 1",
+    "4k3/8/8/R6R/8/8/8/4K3 w - - 0 1",
+])
+def test_san_round_trip(fen: str):
+    board = Board(fen)
+    for move in legalMoves(board):
+        san = moveToSan(board, move)
+        assert sanToMove(board, san) == move, san
+        assert board.fen == fen
+
+def test_san_of_special_moves():
+    board = Board("r3k2r/pPp2ppp/8/3pP3/8/8/P1P2PPP/R3K2R w KQkq d6 0 1")
+    assert moveToSan(board, "e1g1") == "O-O"
+    assert moveToSan(board, "e1c1") == "O-O-O"
+    assert moveToSan(board, "e5d6") == "exd6"
+    assert moveToSan(board, "b7a8q") == "bxa8=Q+"
+    board = Board("4k3/8/8/1N3N2/8/1N3N2/8/4K3 w - - 0 1")
+    assert moveToSan(board, "b5d4") == "Nb5d4"
+
+def test_read_games_skips_comments_and_variations():
+    pgn = """[Event "first"]
+
+1. f3 {weak} e5 (1... e6 2. g4) 2. g4 $4 Qh4# 0-1
+
+[Event "second"]
+[SetUp "1"]
+[FEN "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"]
+
+1. e4 Kd7 *
+"""
+    games = list(readGames(pgn.splitlines()))
+    assert games == [
+        ({"Event": "first"}, ["f3", "e5", "g4", "Qh4#"]),
+        ({"Event": "second", "SetUp": "1", "FEN": "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"}, ["e4", "Kd7"]),
+    ]
+
+def test_tree_pgn_round_trip():
+    fen = "r3k2r/ppp2ppp/8/3pP3/8/8/PPP2PPP/R3K2R w KQkq d6 0 1"
+    tree = AnalysisTree(fen)
+    tree.headers = {"White": "a", "Black": "b"}
+    tree.addLine(["e5d6", "c7d6", "e1g1", "e8c8"])
+    tree.addLine(["e5d6", "e8g8"])
+    tree.addLine(["a2a3"])
+    board = Board(fen)
+    makeMove(board, "e5d6")
+    tree.node(board).comment = "en passant"
+    pgn = tree.toPgn()
+    read = AnalysisTree.fromPgn(pgn.splitlines())
+    assert read.rootFen == fen
+    assert read.headers["White"] == "a"
+    assert read.mainLine(Board(fen)) == ["e5d6", "c7d6", "e1g1", "e8c8"]
+    assert list(read.nodes[board.key].children) == ["c7d6", "e8g8"]
+    assert read.nodes[board.key].comment == "en passant"
+    assert read.toPgn() == pgn
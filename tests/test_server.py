@@ -0,0 +1,134 @@
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import pytest
+from board import Board, START_FEN
+from analysis import getAnalysisParams, runAnalysis
+from analysiscache import AnalysisCache
+from fakeengine import FakeStockfish
+from server import AnalysisService, serve
+
+FEN = "rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2"
+
+# Stands in for the engine pool (see enginepool.py) with a fake engine in the process.
+# Submitted searches wait until the test finishes them, so it decides what is still running.
+class FakePool:
+    processes = 1
+
+    def __init__(self):
+        self.stockfish = FakeStockfish(depth=4)
+        self.submitted = []         # (id, fen, multipv, depth) of every submitted search
+        self._pending = []
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+
+    def submit(self, fen: str, multipv: int = 1, depth: int = 0) -> int:
+        with self._lock:
+            job = (len(self.submitted), fen, multipv, depth)
+            self.submitted.append(job)
+            self._pending.append(job)
+        return job[0]
+
+    # runs the searches that were submitted so far
+    def finish(self):
+        with self._lock:
+            jobs, self._pending = self._pending, []
+        for idx, fen, multipv, depth in jobs:
+            self.stockfish.set_fen_position(fen, False)
+            self._results.put((idx, runAnalysis(self.stockfish, Board(fen), multipv, depth), None))
+
+    def nextResult(self) -> tuple:
+        return self._results.get()
+
+def waitFor(condition):
+    deadline = time.perf_counter() + 5
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def server():
+    servers = []
+    def start(maxQueue: int = 64, searchTimeout: float = 5):
+        pool = FakePool()
+        service = AnalysisService(pool, AnalysisCache(), getAnalysisParams(pool.stockfish), 1, 4, maxQueue, searchTimeout)
+        httpServer = serve(service, "127.0.0.1", 0)
+        threading.Thread(target=httpServer.serve_forever, daemon=True).start()
+        servers.append(httpServer)
+        return f"http://127.0.0.1:{httpServer.server_address[1]}", service, pool
+    yield start
+    for httpServer in servers:
+        httpServer.shutdown()
+        httpServer.server_close()
+
+# (status, body, headers) of a GET request
+def get(url: str, path: str, **query) -> tuple:
+    try:
+        with urllib.request.urlopen(f"{url}{path}?{urllib.parse.urlencode(query)}", timeout=10) as response:
+            return response.status, json.loads(response.read()), response.headers
+    except urllib.error.HTTPError as ex:
+        return ex.code, json.loads(ex.read()), ex.headers
+
+# runs the request in a thread, the response is put into the returned queue
+def getLater(url: str, path: str, **query) -> queue.Queue:
+    responses = queue.Queue()
+    threading.Thread(target=lambda: responses.put(get(url, path, **query)), daemon=True).start()
+    return responses
+
+def test_identical_requests_share_one_search(server):
+    url, service, pool = server()
+    first = getLater(url, "/analysis", fen=FEN)
+    waitFor(lambda: len(pool.submitted) == 1)
+    second = getLater(url, "/eval", fen=FEN)
+    waitFor(lambda: service.counters["coalesced"] == 1)
+    pool.finish()
+    status, analysis, _ = first.get(timeout=10)
+    assert status == 200
+    assert analysis["depth"] == 4
+    status, evaluation, _ = second.get(timeout=10)
+    assert status == 200
+    assert evaluation == {"type": "cp", "value": analysis["lines"][0]["Centipawn"]}
+    assert len(pool.submitted) == 1
+    # answered from the cache now
+    status, _, _ = get(url, "/analysis", fen=FEN)
+    assert status == 200
+    assert service.counters["hits"] == 1
+    assert len(pool.submitted) == 1
+
+def test_full_queue_is_refused(server):
+    url, service, pool = server(maxQueue=1)
+    waiting = getLater(url, "/analysis", fen=FEN)
+    waitFor(lambda: len(pool.submitted) == 1)
+    status, body, headers = get(url, "/analysis", fen=START_FEN)
+    assert status == 503
+    assert "overloaded" in body["error"]
+    assert headers["Retry-After"] == "1"
+    assert service.counters["rejected"] == 1
+    pool.finish()
+    assert waiting.get(timeout=10)[0] == 200
+
+def test_search_timeout(server):
+    url, service, pool = server(searchTimeout=0.2)
+    status, body, _ = get(url, "/analysis", fen=FEN)
+    assert status == 504
+    assert body["error"] == "search timed out, no result after 0.2s"
+    metrics = get(url, "/metrics")[1]
+    assert metrics["timeouts"] == 1
+    assert metrics["queueDepth"] == 0
+    # the position is searched again instead of waiting for the lost search
+    waiting = getLater(url, "/analysis", fen=FEN)
+    waitFor(lambda: len(pool.submitted) == 2)
+    pool.finish()
+    assert waiting.get(timeout=10)[0] == 200
+
+def test_resolve_returns_its_warnings(server):
+    url, service, pool = server()
+    assert get(url, "/resolve", fen=FEN, move="exd5")[:2] == (200, {"move": "e4d5", "warnings": []})
+    status, body, _ = get(url, "/resolve", fen=FEN, move="ed5")
+    assert status == 200
+    assert body == {"move": "e4d5", "warnings": ["Move results in a capture, but capture was not indicated by the move string."]}
+    assert get(url, "/resolve", fen=FEN, move="Ke3")[0] == 400
@@ -0,0 +1,32 @@
+from uci import parseInfo, completedLines
+
+def info(depth: int, multipv: int, score: int, move: str) -> dict:
+    return parseInfo(f"info depth {depth} seldepth {depth + 2} multipv {multipv} score cp {score} nodes 1000 pv {move} e7e5")
+
+def test_parse_info():
+    line = "info depth 12 seldepth 18 multipv 2 score mate -3 wdl 0 10 990 nodes 52000 nps 1000000 hashfull 4 tbhits 0 time 52 pv d2d4 d7d5 c2c4"
+    assert parseInfo(line) == {
+        "depth": 12, "seldepth": 18, "multipv": 2, "scoreType": "mate", "score": -3, "wdl": [0, 10, 990],
+        "nodes": 52000, "nps": 1000000, "hashfull": 4, "tbhits": 0, "time": 52, "move": "d2d4"
+    }
+
+def test_parse_info_bound_and_string():
+    assert parseInfo("info depth 5 score cp 20 lowerbound nodes 10 pv e2e4")["bound"] == "lowerbound"
+    assert parseInfo("info string NNUE evaluation using nn.nnue") == {}
+    assert not "move" in parseInfo("info depth 3 currmove e2e4 currmovenumber 1")
+
+def test_completed_lines_skip_an_unfinished_depth():
+    infos = [info(1, 1, 30, "e2e4"), info(1, 2, 20, "d2d4"), info(2, 1, 25, "d2d4"), info(2, 2, 15, "e2e4"), info(3, 1, 40, "g1f3")]
+    depth, lines = completedLines(infos, True)
+    assert depth == 2
+    assert [line["Move"] for line in lines] == ["d2d4", "e2e4"]
+    assert [line["Centipawn"] for line in lines] == [25, 15]
+
+def test_completed_lines_from_blacks_point_of_view():
+    infos = [info(4, 1, 30, "e7e5"), parseInfo("info depth 5 multipv 1 score cp 90 upperbound pv d7d5")]
+    depth, lines = completedLines(infos, False)
+    assert depth == 4
+    assert lines == [{"Move": "e7e5", "Centipawn": -30, "Mate": None, "WDL": None}]
+
+def test_completed_lines_without_infos():
+    assert completedLines([parseInfo("info depth 0 score mate 0")], True) == (0, [])
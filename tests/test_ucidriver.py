@@ -0,0 +1,58 @@
+from board import START_FEN
+from analysis import searchPosition
+from fakeengine import FakeStockfish
+
+FEN = "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+
+def newEngine() -> FakeStockfish:
+    engine = FakeStockfish(depth=4)
+    engine.process.resetCounts()
+    return engine
+
+def test_same_position_is_sent_once():
+    engine = newEngine()
+    engine.set_fen_position(FEN, False)
+    searchPosition(engine, True, 1, 2)
+    engine.set_fen_position(FEN, False)
+    searchPosition(engine, True, 1, 2)
+    assert engine.process.counts["position"] == 1
+    assert engine.process.counts["go"] == 2
+
+def test_position_that_was_never_searched_is_not_sent():
+    engine = newEngine()
+    engine.set_fen_position(START_FEN, False)
+    engine.set_fen_position(FEN, False)
+    searchPosition(engine, True, 1, 2)
+    assert engine.process.counts["position"] == 1
+    assert engine.process.board.fen == FEN
+
+def test_new_game_sends_the_position_again():
+    engine = newEngine()
+    engine.set_fen_position(FEN, False)
+    searchPosition(engine, True, 1, 2)
+    engine.set_fen_position(FEN)
+    searchPosition(engine, True, 1, 2)
+    assert engine.process.counts["ucinewgame"] == 1
+    assert engine.process.counts["position"] == 2
+
+def test_unchanged_option_is_not_sent():
+    engine = newEngine()
+    engine.setOption("MultiPV", 3)
+    engine.setOption("MultiPV", 3)
+    # an option the engine doesn't have
+    engine.setOption("Not An Option", 1)
+    engine.set_fen_position(FEN, False)
+    searchPosition(engine, True, 3, 2)
+    assert engine.process.counts["setoption"] == 1
+    assert engine.get_parameters()["MultiPV"] == 3
+    assert engine.get_parameters()["Not An Option"] == 1
+
+def test_commands_are_written_together_with_the_search():
+    engine = newEngine()
+    engine.setOption("MultiPV", 2)
+    engine.set_fen_position(FEN, False)
+    depth, lines = searchPosition(engine, True, 2, 3)
+    assert depth == 3
+    assert len(lines) == 2
+    # setoption, position and go in a single write
+    assert engine.process.writes == 1
@@ -0,0 +1,88 @@
+# Helpers for reading the output of a UCI engine.
+
+# fields of an info line that are followed by a single number
+INFO_NUMBERS = {"depth", "seldepth", "multipv", "nodes", "nps", "time", "hashfull", "tbhits", "currmovenumber"}
+
+# Parses an "info ..." line into a dict with the fields that are used by this program.
+# Only the first move of the principal variation is used, it is in "move".
+# The engine sends many info lines per search and the pv is most of each line, so the pv is not split into tokens.
+def parseInfo(line: str) -> dict:
+    head, _, pv = line.partition(" pv ")
+    tokens = head.split()
+    info = {}
+    i = 1
+    n = len(tokens)
+    while i < n:
+        token = tokens[i]
+        if token in INFO_NUMBERS:
+            info[token] = int(tokens[i + 1])
+            i += 2
+        elif token == "score":
+            info["scoreType"] = tokens[i + 1]
+            info["score"] = int(tokens[i + 2])
+            i += 3
+            if i < n and tokens[i] in ["lowerbound", "upperbound"]:
+                info["bound"] = tokens[i]
+                i += 1
+        elif token == "wdl":
+            info["wdl"] = [int(tokens[i + 1]), int(tokens[i + 2]), int(tokens[i + 3])]
+            i += 4
+        elif token == "string":
+            return info
+        else:
+            i += 1
+    if pv != "":
+        end = pv.find(" ")
+        info["move"] = pv if end < 0 else pv[0:end]
+    return info
+
+# Arguments of a go command with the limits of the search, infinite if there are none.
+# With searchmoves, only these moves are searched.
+def goLimits(depth: int, movetime: int = 0, nodes: int = 0, searchmoves: list[str] = None) -> str:
+    limits = []
+    if depth > 0:
+        limits.append(f"depth {depth}")
+    if movetime > 0:
+        limits.append(f"movetime {movetime}")
+    if nodes > 0:
+        limits.append(f"nodes {nodes}")
+    if len(limits) == 0:
+        limits.append("infinite")
+    if searchmoves != None and len(searchmoves) > 0:
+        limits.append("searchmoves " + " ".join(searchmoves))
+    return " ".join(limits)
+
+# Turns parsed info lines into the top moves, in the same format as Stockfish.get_top_moves.
+# Scores are from white's point of view. Each line also has the WDL stats for the side to move.
+def topLines(infos: list[dict], whiteToMove: bool) -> list[dict]:
+    latest = {}
+    for info in infos:
+        # bounds are only intermediate results of an aspiration window
+        if "move" in info and "score" in info and not "bound" in info:
+            latest[info.get("multipv", 1)] = info
+    multiplier = 1 if whiteToMove else -1
+    lines = []
+    for multipv in sorted(latest):
+        info = latest[multipv]
+        lines.append({
+            "Move": info["move"],
+            "Centipawn": info["score"] * multiplier if info["scoreType"] == "cp" else None,
+            "Mate": info["score"] * multiplier if info["scoreType"] == "mate" else None,
+            "WDL": info.get("wdl")
+        })
+    return lines
+
+# Top lines of the deepest depth for which all lines were reported, as (depth, lines).
+# A search that was stopped by a time or node limit may have reported only some of the lines of its last depth,
+# mixing them with the lines of the previous depth would compare moves searched to different depths.
+def completedLines(infos: list[dict], whiteToMove: bool) -> tuple:
+    depths = {}     # depth -> multipv -> info
+    for info in infos:
+        if "move" in info and "score" in info and not "bound" in info:
+            depths.setdefault(info.get("depth", 0), {})[info.get("multipv", 1)] = info
+    if len(depths) == 0:
+        return 0, []
+    width = max(len(lines) for lines in depths.values())
+    for depth in sorted(depths, reverse=True):
+        if len(depths[depth]) >= width:
+            return depth, topLines(list(depths[depth].values()), whiteToMove)
@@ -0,0 +1,140 @@
+# Driver for a UCI engine over a persistent pipe, in place of the stockfish package's wrapper.
+# The wrapper waits for the engine after every option it sets, re-sends the position after changing options
+# and has to ask the engine for a board dump to do so. UciEngine keeps track of the options and the position
+# the engine has, so it only sends what changed. Commands are collected until an answer is needed
+# and then written to the engine at once, so a position, the options and the go command of a search are a single write.
+# send, readLine and setOption are the protocol for callers that talk to the engine themselves, like a search (see analysis.py).
+# get_parameters and set_fen_position keep the names of the wrapper's methods.
+import subprocess
+
+# Parameters the engine is configured with unless given otherwise. These are the defaults of the stockfish package's wrapper,
+# so the analysis params (see analysis.getAnalysisParams) of cached analysis stay the same.
+DEFAULT_PARAMS = {
+    "Debug Log File": "",
+    "Contempt": 0,
+    "Min Split Depth": 0,
+    "Threads": 1,
+    "Ponder": "false",
+    "Hash": 16,
+    "MultiPV": 1,
+    "Skill Level": 20,
+    "Move Overhead": 10,
+    "Minimum Thinking Time": 20,
+    "Slow Mover": 100,
+    "UCI_Chess960": "false",
+    "UCI_LimitStrength": "false",
+    "UCI_Elo": 1350,
+}
+
+# commands that are written right away, everything else waits until an answer is read
+IMMEDIATE_COMMANDS = ["stop", "quit"]
+
+# default value of an option from the rest of its option line after "type", None if it has none
+# "spin default 1 min 1 max 512" -> "1", "string default <empty>" -> ""
+def _optionDefault(text: str):
+    tokens = text.split(" ")
+    if not "default" in tokens:
+        return None
+    value = []
+    for token in tokens[tokens.index("default") + 1:]:
+        if token in ["min", "max", "var"]:
+            break
+        value.append(token)
+    value = " ".join(value)
+    return "" if value == "<empty>" else value
+
+class UciEngine:
+    # process is a started engine process with text mode stdin and stdout, by default path is started
+    def __init__(self, path: str = "stockfish", depth: int = 15, parameters: dict = None, process = None):
+        self.depth = str(depth)
+        self._process = process if process != None else subprocess.Popen(
+            [path],
+            universal_newlines=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        self._pending = []          # commands that were not written yet
+        self._options = {}          # option -> value the engine has, as sent, None if only the engine's default is known
+        self._position = None       # last position command of the engine
+        self._parameters = dict(DEFAULT_PARAMS)
+        if parameters != None:
+            self._parameters.update(parameters)
+        self.send("uci")
+        while True:
+            line = self.readLine()
+            if line == "uciok":
+                break
+            if line.startswith("option name "):
+                name, _, rest = line[len("option name "):].partition(" type ")
+                self._options[name] = _optionDefault(rest)
+        # the hash table is resized for the number of threads, so Threads goes first
+        for name in sorted(self._parameters, key=lambda name: name != "Threads"):
+            self.setOption(name, self._parameters[name], False)
+        self.setOption("UCI_ShowWDL", "true", False)
+        # a single round trip for all options, some of them take a while (Hash)
+        self.send("isready")
+        while self.readLine() != "readyok":
+            pass
+
+    def get_parameters(self) -> dict:
+        return self._parameters
+
+    # Sets the option of the engine if the engine has it and it has another value.
+    # updateParameters also changes the value returned by get_parameters.
+    def setOption(self, name: str, value, updateParameters: bool = True):
+        if updateParameters:
+            self._parameters[name] = value
+        if not name in self._options:
+            # not an option of this engine, the wrapper's defaults include options of older Stockfish versions
+            return
+        value = str(value)
+        if self._options[name] != value:
+            self._options[name] = value
+            self.send(f"setoption name {name} value {value}")
+
+    def set_fen_position(self, fen: str, send_ucinewgame_token: bool = True):
+        if send_ucinewgame_token:
+            self.send("ucinewgame")
+        self.send(f"position fen {fen}")
+
+    # Sends the command to the engine. It is written with the next command that needs an answer, see readLine.
+    # A position command that the engine has already is left out, and so is one the engine never searched.
+    def send(self, command: str):
+        if command.startswith("position "):
+            if command == self._position:
+                return
+            self._position = command
+            if len(self._pending) > 0 and self._pending[-1].startswith("position "):
+                # the engine never searched the previous position
+                self._pending[-1] = command
+                return
+        elif command == "ucinewgame":
+            # the position has to follow
+            self._position = None
+        self._pending.append(command)
+        if command in IMMEDIATE_COMMANDS:
+            self._flush()
+
+    def _flush(self):
+        if len(self._pending) == 0:
+            return
+        self._process.stdin.write("\n".join(self._pending) + "\n")
+        self._process.stdin.flush()
+        self._pending = []
+
+    # writes the pending commands and returns the next line of the engine's output
+    def readLine(self) -> str:
+        self._flush()
+        line = self._process.stdout.readline()
+        if line == "":
+            raise RuntimeError("the engine process has ended")
+        return line.strip()
+
+    def __del__(self):
+        try:
+            if self._process.poll() == None:
+                self.send("quit")
+        except (AttributeError, OSError, ValueError):
+            # the engine did not start or the pipe is already closed
+            pass